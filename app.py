@@ -1,23 +1,27 @@
 # app.py
 import streamlit as st
-import os
 # import tempfile
 # import shutil # For removing temp directories
 
-# Import from the src package
-from src import ui, processing, config, utils, __version__
+# Import from the src package. processing / pipeline / youtube (librosa, scipy.signal, yt-dlp) are
+# imported inside the mode that needs them, so opening the app doesn't pay for every mode.
+from src import ui, jobs, previews, storage, metrics, warmup, config, utils, __version__
 
 # --- Initial Setup ---
 st.set_page_config(page_title="Audio Processing Suite", layout="wide")
 st.title("🎧 Audio Processing Suite")
 logger = utils.logger # Use the shared logger
 config.ensure_dirs() # Make sure output directories exist at startup
+metrics.start_exporters() # Once per process: Prometheus text file and/or :PORT/metrics (see config.METRICS_*)
 
 # --- Global State (Optional but can be useful) ---
 # Use session state to store temporary file paths across reruns if needed
 # Initialize state variables
 if 'temp_file_path' not in st.session_state:
     st.session_state.temp_file_path = None
+# Finished jobs of this session by job ID, so results still show after the upload is cleared (or the job is pruned)
+if 'finished_jobs' not in st.session_state:
+    st.session_state.finished_jobs = {}
 
 
 # --- Sidebar Navigation ---
@@ -29,41 +33,101 @@ st.sidebar.caption(f"Vocalizer Version: {__version__}") # <--- Use the imported
 
 # --- Main App Logic ---
 
+# One job manager per server process, shared by every session (survives reruns)
+@st.cache_resource
+def get_job_manager():
+    return jobs.JobManager()
+
+job_manager = get_job_manager()
+job_stats = job_manager.stats()
+st.sidebar.caption(f"Jobs on this server: {job_stats['running']} running, {job_stats['queued']} queued")
+
+# Keeps output/temp directories within their quotas in the background (see config.STORAGE_QUOTAS)
+@st.cache_resource
+def get_janitor():
+    return storage.start_janitor()
+
+janitor = get_janitor()
+
+# Pre-imports the processing stack and loads Demucs in the background, so the first job starts warm
+@st.cache_resource
+def get_warmup():
+    return warmup.start_warmup()
+
+get_warmup()
+if janitor.last_result: # Usage as of the last sweep; storage.usage() rescans but walks every directory
+    st.sidebar.caption("Disk: " + ", ".join(f"{name} {stats['bytes'] / 1024 ** 2:.0f} MB"
+                                            for name, stats in janitor.last_result.items()))
+
+
+def submit_job(job_key, name, func, *args, cleanup=None, on_result=None):
+    """Queues a background job and remembers its ID in this session. Returns False if the server is busy."""
+    try:
+        job_id = job_manager.submit(name, func, *args, cleanup=cleanup, on_result=on_result)
+        st.session_state.finished_jobs.pop(st.session_state.get(job_key), None) # Replaced by the new job
+        st.session_state[job_key] = job_id
+        return True
+    except jobs.JobRejected as e:
+        st.warning(str(e))
+        if cleanup:
+            cleanup()
+        return False
+
+
+@st.fragment(run_every=config.JOB_POLL_INTERVAL_SEC)
+def show_progress(job_id):
+    """Progress of a running job. Only this fragment reruns while polling; the whole page reruns once the job ends."""
+    job = job_manager.get(job_id)
+    if job is None or not job.active:
+        st.rerun()
+    stage = f" - {job.stage}" if job.stage else ""
+    st.info(f"Processing {job.name}: {job.status}{stage} ({job.elapsed:.0f}s)")
+    st.progress(job.progress)
+
+
+def show_job(job_key, results_placeholder, display_results_func):
+    """Shows this session's job for the current mode: progress while it runs, results once it's done."""
+    job_id = st.session_state.get(job_key)
+    job = st.session_state.finished_jobs.get(job_id) or job_manager.get(job_id)
+    if job is None:
+        return
+    if job.active:
+        with results_placeholder:
+            show_progress(job_id)
+        return
+    st.session_state.finished_jobs[job_id] = job
+    if job.status == "failed":
+        results_placeholder.error(f"An unexpected error occurred: {job.error}")
+    else:
+        display_results_func(job.result, results_placeholder)
+
+
 # Use a function to handle the file processing logic cleanly
 def handle_file_processing(processor_func, uploaded_file, process_button, results_placeholder, display_results_func, *args):
-    temp_input_path = None # Initialize outside try for use in finally
+    job_key = f"job_{processor_func.__module__}.{processor_func.__name__}"
     if uploaded_file and process_button:
-        try:
-            # Save uploaded file temporarily(now returns path to a single temp file)
-            temp_input_path = utils.save_uploaded_file(uploaded_file)
-            if temp_input_path:
-                st.info(f"Processing: {uploaded_file.name}")
-                with st.spinner("Processing audio... Please wait."):
-                    result = processor_func(temp_input_path, *args)
-                display_results_func(result, results_placeholder)
-            else:
-                st.error("COuld not prepare uploaded file for processing.")
-            # st.session_state.temp_file_path = temp_input_path # Store in state if needed later
-
-        except Exception as e:
-            logger.error(f"An error occurred during {processor_func.__name__} processing: {e}", exc_info=True)
-            st.error(f"An unexpected error occurred: {e}")
-        finally:
-            if temp_input_path and os.path.exists(temp_input_path):
-                logger.info(f"Attempting to clean up temporary file: {temp_input_path}")
-                try:
-                    os.remove(temp_input_path)
-                    logger.info(f"Successfully removed temporary file: {temp_input_path}")
-                except OSError as e:
-                    logger.error(f"Error removing temporary file {temp_input_path}: {e}", exc_info=True)
-                    st.warning(f"Could not automatically clean up temporary file:{e}.")
+        # The upload is decoded straight from its in-memory buffer; only Demucs writes a temp file, and removes it itself
+        st.info(f"Processing: {uploaded_file.name}")
+        # Results are kept as files (not WAV bytes) so finished jobs hold no audio in server memory
+        submit_job(job_key, uploaded_file.name, processor_func, uploaded_file, *args,
+                   on_result=lambda result: previews.spill_audio_bytes(result, processor_func.__name__, uploaded_file.name))
+    show_job(job_key, results_placeholder, display_results_func)
 
 
 # --- Mode Switching ---
 if app_mode == "Download Audio from YouTube":
+    from src import youtube
     ui.render_youtube_downloader()
+    st.markdown("---")
+    sources, bulk_button, bulk_placeholder = ui.render_bulk_youtube_downloader()
+    if bulk_button and sources:
+        submit_job("job_youtube_bulk", f"{len(sources)} YouTube sources", youtube.download_bulk, sources)
+    elif bulk_button:
+        st.warning("Please enter at least one URL.")
+    show_job("job_youtube_bulk", bulk_placeholder, ui.display_bulk_download_results)
 
 elif app_mode == "Extract Vocals (Demucs)":
+    from src import processing
     uploaded_file, process_button, results_placeholder = ui.render_demucs_separator()
     # Determine output path for Demucs (can be based on config)
     demucs_out = config.DEMUCS_OUTPUT_DIR
@@ -77,31 +141,53 @@ elif app_mode == "Extract Vocals (Demucs)":
     )
 
 elif app_mode == "Adaptive Noise Reduction":
+    from src import processing
     uploaded_file, process_button, results_placeholder = ui.render_noise_reduction()
-    # Define output file path
-    if uploaded_file:
-        handle_file_processing(
-            processing.adaptive_noise_reduction,
-            uploaded_file,
-            process_button,
-            results_placeholder,
-            ui.display_nr_results
-            
-        )
-    elif process_button: # Handle case where button clicked but no file
+    if process_button and not uploaded_file: # Handle case where button clicked but no file
         st.warning("Please upload a file first.")
+    handle_file_processing(
+        processing.adaptive_noise_reduction,
+        uploaded_file,
+        process_button,
+        results_placeholder,
+        ui.display_nr_results
+    )
 
 
 elif app_mode == "Loudness Normalization":
+    from src import processing
     uploaded_file, target_lufs, process_button, results_placeholder = ui.render_loudness_normalization()
-    if uploaded_file:
+    if process_button and not uploaded_file: # Handle case where button clicked but no file
+        st.warning("Please upload a file first.")
+    handle_file_processing(
+        processing.loudness_normalization,
+        uploaded_file,
+        process_button,
+        results_placeholder,
+        ui.display_ln_results,
+        target_lufs # Pass target LUFS
+    )
+
+
+elif app_mode == "Full Pipeline":
+    from src import pipeline
+    url, uploaded_file, steps, target_lufs, process_button, results_placeholder = ui.render_pipeline()
+    if url:
+        if process_button:
+            submit_job("job_pipeline_url", url, pipeline.run_pipeline, url, ["download"] + steps, target_lufs)
+        show_job("job_pipeline_url", results_placeholder, ui.display_pipeline_results)
+    else:
+        if process_button and not uploaded_file:
+            st.warning("Please enter a YouTube URL or upload a file first.")
+        elif process_button and not steps:
+            st.warning("Select at least one stage.")
+            process_button = False
         handle_file_processing(
-            processing.loudness_normalization,
+            pipeline.run_pipeline,
             uploaded_file,
             process_button,
             results_placeholder,
-            ui.display_ln_results,
-            target_lufs # Pass target LUFS
+            ui.display_pipeline_results,
+            steps,
+            target_lufs
         )
-    elif process_button: # Handle case where button clicked but no file
-        st.warning("Please upload a file first.")
\ No newline at end of file
@@ -0,0 +1,323 @@
+# src/batch.py
+# Headless batch processing.
+#
+#     python -m src.batch <directory | manifest.csv | manifest.json> [--steps separate,denoise,normalize]
+#                         [--output-dir DIR] [--workers N] [--target-lufs LUFS] [--true-peak-limit DBTP] [--model NAME]
+#                         [--profile fast|balanced|best|auto] [--skip-silence [--silence-fill zero|passthrough]]
+#                         [--noise-profile NAME | --build-noise-profile NAME]
+#     python -m src.batch <directory | manifest> --analyze [--output-dir DIR] [--workers N]
+#
+# Every input file runs through the requested chain of stages in a ProcessPoolExecutor worker.
+# Outputs land in <output-dir>/<path relative to the inputs' common folder, without extension>/ and a JSON report with per-stage timings and failures
+# is written to <output-dir>/batch_report.json (stage timings also as Prometheus text in batch_metrics.prom).
+# --skip-silence separates and denoises only the active regions of each file (src/silence.py); the
+# report then records per stage how much of the audio was skipped.
+# --build-noise-profile estimates one noise profile from the quietest frames of all inputs (src/noise_profiles.py),
+# stores it under NAME and denoises every file with it; --noise-profile reuses a stored one.
+#
+# --analyze only measures: integrated / momentary / short-term loudness, loudness range and true peak
+# of every input (src/loudness.py), written to <output-dir>/loudness_report.json and .csv. No audio is written.
+import os
+import csv
+import json
+import time
+import hashlib
+import logging
+import uuid
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from src import config, loudness, metrics, noise_profiles, processing
+
+logger = logging.getLogger(__name__)
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+STAGES = ("separate", "denoise", "normalize")
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus", ".webm")
+DEFAULT_BATCH_OUTPUT_DIR = os.path.join(config.BASE_DIR, "output_batch")
+
+
+def load_inputs(source: str) -> list[str]:
+    """
+    Collects input paths from a directory (recursively), a CSV manifest with a 'path' column,
+    or a JSON manifest (a list of paths or of objects with a 'path' key).
+    Relative manifest paths are resolved against the manifest's directory; repeated entries are dropped.
+    """
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths.extend(os.path.join(root, f) for f in sorted(files) if f.lower().endswith(AUDIO_EXTENSIONS))
+        return sorted(paths)
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    if source.lower().endswith(".csv"):
+        with open(source, newline="", encoding="utf-8") as f:
+            entries = [row["path"] for row in csv.DictReader(f) if row.get("path")]
+    elif source.lower().endswith(".json"):
+        with open(source, encoding="utf-8") as f:
+            entries = [e["path"] if isinstance(e, dict) else e for e in json.load(f)]
+    else:
+        raise ValueError(f"Input must be a directory, .csv or .json manifest: {source}")
+    paths = [os.path.normpath(p if os.path.isabs(p) else os.path.join(base_dir, p)) for p in entries]
+    return list(dict.fromkeys(paths))
+
+
+def output_names(inputs: list[str]) -> dict[str, str]:
+    """
+    Output folder name of every input: its path relative to the inputs' common folder, without the
+    extension (so a/take1.wav and b/take1.wav don't share a folder). Names that still collide
+    (take1.wav next to take1.mp3) get a short hash of the absolute path appended.
+    """
+    if not inputs:
+        return {}
+    paths = {path: os.path.abspath(path) for path in inputs}
+    root = os.path.commonpath([os.path.dirname(p) for p in paths.values()])
+    names = {path: os.path.splitext(os.path.relpath(full, root))[0] for path, full in paths.items()}
+    counts = {}
+    for name in names.values():
+        counts[name] = counts.get(name, 0) + 1
+    return {path: name if counts[name] == 1 else f"{name}_{hashlib.sha1(paths[path].encode()).hexdigest()[:8]}"
+            for path, name in names.items()}
+
+
+def _save_stage_output(result: dict, output_file: str) -> str:
+    """ Makes sure a noise reduction / normalization result ends up at output_file and returns that path. """
+    if result.get('output_path'):
+        if os.path.abspath(result['output_path']) != os.path.abspath(output_file):
+            os.replace(result['output_path'], output_file)
+    else:
+        with open(output_file, "wb") as f:
+            f.write(result['audio_bytes'])
+    return output_file
+
+
+def _configure_logging():
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+    metrics.configure_logging()
+
+
+def _init_worker(steps):
+    """ Pool initializer: batch workers load Demucs themselves instead of sharing a nested pool. """
+    _configure_logging() # Spawned children start with bare logging
+    if "separate" in steps:
+        from src import demucs_pool
+        import torch
+        torch.set_num_threads(1) # The batch pool already fills every core
+        for name in config.DEMUCS_POOL_MODELS:
+            demucs_pool.get_resident_model(name)
+
+
+def process_file(input_path: str, steps: list[str], output_root: str, options: dict,
+                 output_name: str | None = None) -> dict:
+    """
+    Runs one input through the requested stages, writing to <output_root>/<output_name> (default: the
+    file name without extension; see output_names()). Each stage consumes the previous stage's output
+    (the vocals stem after separation). Never raises: failures are recorded in the returned dict.
+    """
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+    file_output_dir = os.path.join(output_root, output_name or base_name)
+    os.makedirs(file_output_dir, exist_ok=True)
+    report = {'input': input_path, 'success': True, 'stages': {}, 'outputs': {}, 'error': None,
+              'correlation_id': uuid.uuid4().hex}
+    with metrics.correlation(report['correlation_id']):
+        return _process_file(input_path, steps, file_output_dir, base_name, options, report)
+
+
+def _process_file(input_path: str, steps: list[str], file_output_dir: str, base_name: str, options: dict,
+                  report: dict) -> dict:
+    current = input_path
+    started = time.perf_counter()
+
+    for step in steps:
+        stage_started = time.perf_counter()
+        if step == "separate":
+            result = processing.separate_audio_with_demucs(current, os.path.join(file_output_dir, "stems"),
+                                                           options['model'], config.DEFAULT_DEMUCS_STEMS,
+                                                           backend="inprocess", profile=options['profile'],
+                                                           skip_silence=options['skip_silence'],
+                                                           silence_fill=options['silence_fill'])
+            if result['success']:
+                report['outputs'].update(result['output_paths'])
+                current = result['output_paths'].get("vocals", current)
+        elif step == "denoise":
+            output_file = os.path.join(file_output_dir, f"{base_name}_noise_reduced.wav")
+            result = processing.adaptive_noise_reduction(current, output_file=output_file,
+                                                         skip_silence=options['skip_silence'],
+                                                         silence_fill=options['silence_fill'],
+                                                         noise_profile=options['noise_profile'])
+            if result['success']:
+                current = report['outputs']['noise_reduced'] = _save_stage_output(result, output_file)
+        else: # normalize
+            output_file = os.path.join(file_output_dir, f"{base_name}_normalized.wav")
+            result = processing.loudness_normalization(current, options['target_lufs'], output_file=output_file,
+                                                       true_peak_limit=options['true_peak_limit'])
+            if result['success']:
+                current = report['outputs']['normalized'] = _save_stage_output(result, output_file)
+
+        report['stages'][step] = {'seconds': round(time.perf_counter() - stage_started, 3),
+                                  'success': result['success'], 'message': result['message']}
+        if result.get('silence'):
+            report['stages'][step]['silence'] = result['silence']
+        if not result['success']:
+            report['success'] = False
+            report['error'] = f"{step}: {result['message']}"
+            break
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def run_batch(inputs: list[str], steps: list[str], output_root: str = DEFAULT_BATCH_OUTPUT_DIR,
+              workers: int = config.CPU_COUNT, options: dict | None = None) -> dict:
+    """ Processes all inputs over a process pool and writes <output_root>/batch_report.json. """
+    options = {'model': None, 'profile': config.DEMUCS_PROFILE, 'target_lufs': config.DEFAULT_TARGET_LUFS,
+               'true_peak_limit': config.TRUE_PEAK_LIMIT_DBTP, 'skip_silence': config.SKIP_SILENCE,
+               'silence_fill': config.SILENCE_FILL, 'noise_profile': config.NOISE_PROFILE, **(options or {})}
+    os.makedirs(output_root, exist_ok=True)
+    started = time.time()
+    files = []
+    names = output_names(inputs)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(steps,)) as executor:
+        futures = {executor.submit(process_file, path, steps, output_root, options, names[path]): path
+                   for path in inputs}
+        for done, future in enumerate(as_completed(futures), start=1):
+            path = futures[future]
+            try:
+                file_report = future.result()
+            except Exception as e: # Worker crashed (e.g. out of memory)
+                file_report = {'input': path, 'success': False, 'stages': {}, 'outputs': {}, 'error': f"worker error: {e}"}
+            files.append(file_report)
+            for step, stage in file_report['stages'].items(): # Worker registries die with the pool; aggregate here
+                metrics.observe("batch_stage_seconds", stage['seconds'], step=step)
+                metrics.inc("batch_stages_total", step=step, status="ok" if stage['success'] else "failed")
+            status = "ok" if file_report['success'] else f"FAILED ({file_report['error']})"
+            logger.info(f"[{done}/{len(inputs)}] {os.path.basename(path)}: {status}")
+
+    wall_time = time.time() - started
+    failures = [f for f in files if not f['success']]
+    report = {
+        'started': time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+        'wall_seconds': round(wall_time, 3),
+        'workers': workers,
+        'steps': steps,
+        'options': options,
+        'total': len(files),
+        'succeeded': len(files) - len(failures),
+        'failed': len(failures),
+        'stage_seconds': {step: round(sum(f['stages'].get(step, {}).get('seconds', 0) for f in files), 3) for step in steps},
+        'failures': [{'input': f['input'], 'error': f['error']} for f in failures],
+        'files': sorted(files, key=lambda f: f['input']),
+    }
+    report_path = os.path.join(output_root, "batch_report.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    if config.METRICS_ENABLED:
+        metrics.write_prometheus(os.path.join(output_root, "batch_metrics.prom"))
+    logger.info(f"Processed {report['total']} files in {wall_time:.1f}s ({report['failed']} failed). Report: {report_path}")
+    return report
+
+
+LOUDNESS_COLUMNS = ("input", "integrated_lufs", "loudness_range_lu", "true_peak_dbtp", "sample_peak_dbfs",
+                    "momentary_max_lufs", "short_term_max_lufs", "duration_sec", "sample_rate", "channels", "error")
+
+
+def run_analysis(inputs: list[str], output_root: str = DEFAULT_BATCH_OUTPUT_DIR,
+                 workers: int = config.CPU_COUNT) -> dict:
+    """ Measures the loudness of all inputs over a process pool; writes loudness_report.json and .csv. """
+    os.makedirs(output_root, exist_ok=True)
+    started = time.time()
+    files = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(loudness.analyze_file, path): path for path in inputs}
+        for done, future in enumerate(as_completed(futures), start=1):
+            path = futures[future]
+            try:
+                file_report = future.result()
+            except Exception as e: # Worker crashed (e.g. out of memory)
+                file_report = {'input': path, 'success': False, 'error': f"worker error: {e}"}
+            files.append(file_report)
+            metrics.inc("batch_analyzed_total", status="ok" if file_report['success'] else "failed")
+            if done % 50 == 0 or done == len(inputs):
+                logger.info(f"[{done}/{len(inputs)}] measured")
+
+    wall_time = time.time() - started
+    failures = [f for f in files if not f['success']]
+    files.sort(key=lambda f: f['input'])
+    report = {
+        'started': time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+        'wall_seconds': round(wall_time, 3),
+        'workers': workers,
+        'total': len(files),
+        'failed': len(failures),
+        'audio_seconds': round(sum(f.get('duration_sec', 0) for f in files), 3),
+        'failures': [{'input': f['input'], 'error': f['error']} for f in failures],
+        'files': files,
+    }
+    report_path = os.path.join(output_root, "loudness_report.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2) # -inf (silent files) is written as -Infinity
+    with open(os.path.join(output_root, "loudness_report.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=LOUDNESS_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(files)
+    logger.info(f"Measured {report['total']} files ({report['audio_seconds']:.0f}s of audio) in {wall_time:.1f}s "
+                f"({report['failed']} failed). Report: {report_path}")
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Batch-process audio files with Vocalizer.")
+    parser.add_argument("source", help="Directory of audio files, or a .csv/.json manifest")
+    parser.add_argument("--steps", default=",".join(STAGES),
+                        help=f"Comma-separated chain of stages from {', '.join(STAGES)} (default: all)")
+    parser.add_argument("--output-dir", default=DEFAULT_BATCH_OUTPUT_DIR)
+    parser.add_argument("--workers", type=int, default=config.CPU_COUNT)
+    parser.add_argument("--target-lufs", type=float, default=config.DEFAULT_TARGET_LUFS)
+    parser.add_argument("--true-peak-limit", type=float, default=config.TRUE_PEAK_LIMIT_DBTP, metavar="DBTP",
+                        help="Limit the normalized output's true peak to this level, e.g. -1")
+    parser.add_argument("--model", default=None, help="Demucs model (default: the profile's)")
+    parser.add_argument("--profile", default=config.DEMUCS_PROFILE, choices=["auto", *config.DEMUCS_PROFILES],
+                        help="Demucs speed/quality profile")
+    parser.add_argument("--skip-silence", action="store_true", default=config.SKIP_SILENCE,
+                        help="Separate and denoise only the active regions, skipping dead air")
+    parser.add_argument("--silence-fill", default=config.SILENCE_FILL, choices=("zero", "passthrough"),
+                        help="What skipped silence becomes in the outputs")
+    noise = parser.add_mutually_exclusive_group()
+    noise.add_argument("--noise-profile", default=config.NOISE_PROFILE, metavar="NAME",
+                       help="Denoise with this stored noise profile instead of each file's lead-in")
+    noise.add_argument("--build-noise-profile", metavar="NAME",
+                       help="First estimate a noise profile from the quietest frames of all inputs, store it as NAME and use it")
+    parser.add_argument("--analyze", action="store_true",
+                        help="Only measure loudness, LRA and true peak (no audio written; --steps is ignored)")
+    args = parser.parse_args(argv)
+    _configure_logging()
+
+    steps = [s.strip() for s in args.steps.split(",") if s.strip()]
+    unknown = [s for s in steps if s not in STAGES]
+    if unknown or not steps:
+        parser.error(f"Unknown stage(s): {', '.join(unknown) or '(none given)'}")
+
+    inputs = load_inputs(args.source)
+    if not inputs:
+        logger.error(f"No audio files found in {args.source}")
+        return 1
+    if args.analyze:
+        report = run_analysis(inputs, args.output_dir, max(1, args.workers))
+        return 0 if report['failed'] == 0 else 2
+    noise_profile = args.noise_profile
+    if args.build_noise_profile:
+        try:
+            noise_profiles.estimate(inputs, args.build_noise_profile)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not build noise profile '{args.build_noise_profile}': {e}")
+            return 1
+        noise_profile = args.build_noise_profile
+    report = run_batch(inputs, steps, args.output_dir, max(1, args.workers),
+                       {'model': args.model, 'profile': args.profile, 'target_lufs': args.target_lufs,
+                        'true_peak_limit': args.true_peak_limit, 'skip_silence': args.skip_silence,
+                        'silence_fill': args.silence_fill, 'noise_profile': noise_profile})
+    return 0 if report['failed'] == 0 else 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,287 @@
+# src/benchmark.py
+# Benchmarks for the processing stages.
+#
+#     python -m src.benchmark [--stages separate,denoise,normalize] [--durations 10,60] [--rates 44100]
+#                             [--channels 1,2] [--repeats 3] [--real-demucs] [--output bench.json]
+#                             [--baseline baseline.json] [--threshold 0.2]
+#
+# Inputs are deterministic synthetic recordings (a speech-like harmonic voice with syllable and
+# phrase envelopes over coloured background noise, starting with a noise-only lead-in) generated once
+# into config.BENCHMARK_DIR. Every (stage, input) pair runs in a fresh process: one warm-up call (model
+# loading, ingest decode), then `repeats` timed calls. Reported per pair: median and best wall time,
+# real-time factor (wall / audio duration), peak RSS during the timed calls and its growth over the
+# resident set before them.
+# With --baseline, results are compared per case and the command exits with 1 when the real-time
+# factor or peak memory got worse by more than --threshold (a fraction).
+# Demucs is replaced by a local stub (same file layout, trivial separation) unless --real-demucs is given,
+# so the suite runs offline.
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import statistics
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import soundfile as sf
+from scipy.signal import lfilter
+from src import config, __version__
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+STAGES = ("separate", "denoise", "normalize")
+DEFAULT_DURATIONS = (10, 60)
+DEFAULT_RATES = (44100,)
+DEFAULT_CHANNELS = (1, 2)
+SYNTH_BLOCK_SEC = 10 # Inputs are generated and written block by block, so hour-long files stay cheap
+NOISE_LEAD_IN_SEC = 0.5 # Matches config.DEFAULT_NOISE_PROFILE_SEC: the denoiser profiles this part
+
+
+# --- Synthetic audio ---
+
+def _synth_block(start: int, n: int, sr: int, channels: int, rng: np.random.Generator, noise_state: np.ndarray) -> np.ndarray:
+    """ Samples [start, start + n) of the synthetic recording as float32 (n, channels). """
+    t = (start + np.arange(n)) / sr
+    # Voice: a glottal-like harmonic series on a gliding pitch (f0 = 140 + 40 sin(2pi 0.3t) + 15 sin(2pi 5.5t) Hz,
+    # phase taken as its closed-form integral so blocks join seamlessly), gated into ~4 syllables/s and ~3 s phrases
+    phase = 2 * np.pi * 140 * t - (40 / 0.3) * np.cos(2 * np.pi * 0.3 * t) - (15 / 5.5) * np.cos(2 * np.pi * 5.5 * t)
+    voice = sum(np.sin(k * phase) / k ** 1.2 for k in range(1, 16))
+    syllables = np.clip(np.sin(2 * np.pi * 4.0 * t), 0, None) ** 2
+    phrases = (np.sin(2 * np.pi * t / 3.0) > -0.3).astype(np.float64)
+    voice *= 0.25 * syllables * phrases * (t >= NOISE_LEAD_IN_SEC)
+
+    # Background: brown-ish noise (one-pole low-pass of white noise) about 30 dB under the voice
+    white = rng.standard_normal((n, channels))
+    noise, noise_state[:] = lfilter([0.02], [1, -0.98], white, axis=0, zi=noise_state)
+    pan = np.linspace(0.8, 1.0, channels) # Slightly different voice level per channel
+    return (voice[:, None] * pan + 0.01 * noise).astype(np.float32)
+
+
+def synthesize(duration_sec: float, sample_rate: int = 44100, channels: int = 1, seed: int = 0) -> np.ndarray:
+    """ Deterministic synthetic recording as float32 (samples, channels). Same arguments, same samples. """
+    rng = np.random.default_rng(seed)
+    noise_state = np.zeros((1, channels))
+    total = int(duration_sec * sample_rate)
+    block = SYNTH_BLOCK_SEC * sample_rate
+    return np.concatenate([_synth_block(start, min(block, total - start), sample_rate, channels, rng, noise_state)
+                           for start in range(0, total, block)])
+
+
+def synthetic_file(duration_sec: float, sample_rate: int, channels: int, seed: int = 0) -> str:
+    """ Path of the synthetic WAV for these parameters, generating it (block-wise) on first use. """
+    path = os.path.join(config.BENCHMARK_DIR, f"synth_{duration_sec:g}s_{sample_rate}hz_{channels}ch_seed{seed}.wav")
+    if os.path.exists(path):
+        return path
+    os.makedirs(config.BENCHMARK_DIR, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    noise_state = np.zeros((1, channels))
+    total = int(duration_sec * sample_rate)
+    block = SYNTH_BLOCK_SEC * sample_rate
+    part_path = path + ".part.wav"
+    with sf.SoundFile(part_path, 'w', samplerate=sample_rate, channels=channels, subtype='PCM_16') as out:
+        for start in range(0, total, block):
+            out.write(_synth_block(start, min(block, total - start), sample_rate, channels, rng, noise_state))
+    os.replace(part_path, path)
+    logger.info(f"Generated {path}")
+    return path
+
+
+# --- Stages ---
+
+def stub_separate(audio_path: str, output_dir: str, model: str = config.DEFAULT_DEMUCS_MODEL,
+                  stems: str = config.DEFAULT_DEMUCS_STEMS) -> dict:
+    """
+    Offline stand-in for separate_audio_with_demucs: writes the same stem files (vocals = mid,
+    no_vocals = side) so everything around the model is exercised, but without the model.
+    """
+    from src import ingest, processing
+    y, sr = ingest.load_audio(audio_path, mono=False)
+    y = np.atleast_2d(y)
+    mid = y.mean(axis=0)
+    side = (y[0] - y[-1]) / 2
+    track_dir = os.path.join(output_dir, model, os.path.splitext(os.path.basename(audio_path))[0])
+    os.makedirs(track_dir, exist_ok=True)
+    sf.write(os.path.join(track_dir, "vocals.wav"), np.stack([mid, mid], axis=1), sr, subtype='PCM_16')
+    sf.write(os.path.join(track_dir, "no_vocals.wav"), np.stack([side, -side], axis=1), sr, subtype='PCM_16')
+    return processing._collect_demucs_outputs(audio_path, output_dir, model, stems)
+
+
+def _run_stage(stage: str, input_path: str, work_dir: str, real_demucs: bool) -> dict:
+    """ One uncached call of a stage, the way the app runs it. """
+    from src import processing
+    if stage == "separate":
+        if real_demucs:
+            return processing.separate_audio_with_demucs.__wrapped__(input_path, work_dir, backend="inprocess")
+        return stub_separate(input_path, work_dir)
+    if stage == "denoise":
+        return processing.adaptive_noise_reduction.__wrapped__(input_path, output_file=os.path.join(work_dir, "denoised.wav"))
+    return processing.loudness_normalization.__wrapped__(input_path, output_file=os.path.join(work_dir, "normalized.wav"))
+
+
+def _proc_status_mb(field: str) -> float | None:
+    """ A memory field (VmHWM, VmRSS) of /proc/self/status in MB; None where /proc isn't available. """
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024 # kB
+    except OSError:
+        pass
+    return None
+
+
+def _peak_rss_mb() -> float | None:
+    """ Peak resident set size of this process in MB (None if it can't be measured here). """
+    peak = _proc_status_mb("VmHWM")
+    if peak is not None:
+        return peak
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+    # ru_maxrss survives exec, so in a spawned worker this may include the parent's peak
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024 # bytes on macOS, KB elsewhere
+
+
+def _reset_peak_rss():
+    """ Restarts the VmHWM high-water mark at the current RSS (Linux only; a no-op elsewhere). """
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _measure(stage: str, input_path: str, duration_sec: float, repeats: int, real_demucs: bool) -> dict:
+    """ Runs in a fresh worker process so the memory figures belong to this stage alone. """
+    work_dir = os.path.join(config.BENCHMARK_DIR, "work", f"{stage}_{os.getpid()}")
+    _run_stage(stage, input_path, work_dir, real_demucs) # Warm-up: imports, model load, ingest decode
+    _reset_peak_rss()
+    rss_before = _proc_status_mb("VmRSS")
+    walls = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = _run_stage(stage, input_path, work_dir, real_demucs)
+        walls.append(time.perf_counter() - started)
+        if not result.get('success'):
+            raise RuntimeError(f"{stage} failed: {result.get('message')}")
+    peak = _peak_rss_mb()
+    wall = statistics.median(walls)
+    return {
+        'wall_sec': round(wall, 4),
+        'wall_min_sec': round(min(walls), 4),
+        'rtf': round(wall / duration_sec, 5),
+        'peak_rss_mb': round(peak, 1) if peak is not None else None,
+        'peak_rss_growth_mb': round(peak - rss_before, 1) if peak is not None and rss_before is not None else None,
+    }
+
+
+# --- Suite ---
+
+def case_key(result: dict) -> str:
+    return f"{result['stage']}/{result['duration_sec']:g}s/{result['sample_rate']}hz/{result['channels']}ch"
+
+
+def run_benchmarks(stages=STAGES, durations=DEFAULT_DURATIONS, rates=DEFAULT_RATES, channels=DEFAULT_CHANNELS,
+                   repeats: int = 3, real_demucs: bool = False, seed: int = 0) -> dict:
+    """ Runs every (stage, duration, rate, channels) combination and returns the report dict. """
+    results = []
+    context = multiprocessing.get_context("spawn") # Fresh interpreter per case: clean RSS high-water mark
+    for duration in durations:
+        for rate in rates:
+            for n_channels in channels:
+                input_path = synthetic_file(duration, rate, n_channels, seed)
+                for stage in stages:
+                    case = {'stage': stage, 'duration_sec': duration, 'sample_rate': rate, 'channels': n_channels}
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                        try:
+                            case.update(executor.submit(_measure, stage, input_path, duration, repeats, real_demucs).result())
+                        except Exception as e:
+                            case['error'] = str(e)
+                    results.append(case)
+                    logger.info(f"{case_key(case)}: " + (f"{case['wall_sec']:.3f}s, RTF {case['rtf']:.4f}, "
+                                                         f"peak RSS {case['peak_rss_mb']} MB" if 'error' not in case else f"FAILED ({case['error']})"))
+    return {
+        'meta': {
+            'version': __version__,
+            'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': config.CPU_COUNT,
+            'repeats': repeats,
+            'demucs': "real" if real_demucs else "stub",
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.2) -> list[dict]:
+    """
+    Cases whose real-time factor or peak RSS grew by more than `threshold` (fraction) over the baseline,
+    plus cases that failed now but not before. Cases missing from either report are ignored.
+    """
+    previous = {case_key(case): case for case in baseline['results']}
+    regressions = []
+    for case in current['results']:
+        before = previous.get(case_key(case))
+        if before is None or 'error' in before:
+            continue
+        if 'error' in case:
+            regressions.append({'case': case_key(case), 'metric': 'error', 'baseline': None, 'current': case['error']})
+            continue
+        for metric in ('rtf', 'peak_rss_mb'):
+            if before.get(metric) and case.get(metric) is not None and case[metric] > before[metric] * (1 + threshold):
+                regressions.append({'case': case_key(case), 'metric': metric, 'baseline': before[metric],
+                                    'current': case[metric], 'change': round(case[metric] / before[metric] - 1, 3)})
+    return regressions
+
+
+def _csv_list(value: str, cast) -> list:
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the Vocalizer processing stages.")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated subset of {', '.join(STAGES)}")
+    parser.add_argument("--durations", default=",".join(str(d) for d in DEFAULT_DURATIONS), help="Seconds, e.g. 10,60,3600")
+    parser.add_argument("--rates", default=",".join(str(r) for r in DEFAULT_RATES), help="e.g. 22050,44100,48000")
+    parser.add_argument("--channels", default=",".join(str(c) for c in DEFAULT_CHANNELS), help="1, 2 or 1,2")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--real-demucs", action="store_true", help="Run the real model instead of the offline stub")
+    parser.add_argument("--output", default=os.path.join(config.BENCHMARK_DIR, "benchmark.json"))
+    parser.add_argument("--baseline", help="Earlier benchmark JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown / memory growth (fraction)")
+    args = parser.parse_args(argv)
+
+    stages = _csv_list(args.stages, str)
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown or not stages:
+        parser.error(f"Unknown stage(s): {', '.join(unknown) or '(none given)'}")
+
+    report = run_benchmarks(stages, _csv_list(args.durations, float), _csv_list(args.rates, int),
+                            _csv_list(args.channels, int), max(1, args.repeats), args.real_demucs, args.seed)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report['regressions'] = compare(report, json.load(f), args.threshold)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Benchmark report written to {args.output}")
+
+    for regression in report.get('regressions', []):
+        logger.error(f"Regression in {regression['case']}: {regression['metric']} {regression['baseline']} -> {regression['current']}")
+    if any('error' in case for case in report['results']):
+        return 2
+    return 1 if report.get('regressions') else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,347 @@
+# src/cache.py
+import os
+import json
+import time
+import shutil
+import hashlib
+import inspect
+import logging
+import tempfile
+import functools
+import threading
+import numpy as np
+from src import config, metrics
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# --- Input hashing ---
+# Digests recorded while a file was written (see utils.save_uploaded_file and previews.spill_audio_bytes), keyed by path.
+# The (size, mtime) pair guards against the file changing after it was registered.
+_known_digests = {}
+_digest_lock = threading.Lock()
+
+
+def register_digest(path: str, digest: str):
+    """ Remembers the digest of a file we just wrote so hash_file() doesn't re-read it. """
+    st = os.stat(path)
+    with _digest_lock:
+        _known_digests[os.path.abspath(path)] = (st.st_size, st.st_mtime_ns, digest)
+
+
+def hash_file(path: str) -> str:
+    """ Returns the SHA-256 of a file, reusing a registered digest when the file is unchanged. """
+    abs_path = os.path.abspath(path)
+    st = os.stat(abs_path)
+    with _digest_lock:
+        known = _known_digests.get(abs_path)
+    if known and known[:2] == (st.st_size, st.st_mtime_ns):
+        return known[2]
+
+    hasher = hashlib.sha256()
+    with open(abs_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    digest = hasher.hexdigest()
+    with _digest_lock:
+        _known_digests[abs_path] = (st.st_size, st.st_mtime_ns, digest)
+    return digest
+
+
+def source_name(source) -> str | None:
+    """ File name of a path or named upload (Streamlit's UploadedFile), None for anonymous buffers/arrays. """
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.basename(os.fspath(source))
+    name = getattr(source, 'name', None)
+    return os.path.basename(name) if isinstance(name, str) else None
+
+
+def source_label(source) -> str:
+    """ Short description of any audio source for log messages. """
+    if isinstance(source, tuple):
+        return f"<array {np.shape(source[0])} @ {source[1]} Hz>"
+    return source_name(source) or f"<{type(source).__name__}>"
+
+
+def hash_source(source) -> str:
+    """
+    SHA-256 of an audio source: a file path, bytes-like object, file-like object or (ndarray, sr) tuple.
+    Arrays are hashed with their dtype, shape and sample rate so equal samples at another rate differ.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return hash_file(source)
+    hasher = hashlib.sha256()
+    if isinstance(source, tuple):
+        y, sr = source
+        y = np.ascontiguousarray(y)
+        hasher.update(f"{y.dtype}|{y.shape}|{int(sr)}|".encode("utf-8"))
+        hasher.update(y)
+    elif hasattr(source, 'getbuffer'): # BytesIO / UploadedFile: hash the buffer without copying it
+        with source.getbuffer() as buffer:
+            for start in range(0, len(buffer), HASH_CHUNK_SIZE):
+                hasher.update(buffer[start:start + HASH_CHUNK_SIZE])
+    elif hasattr(source, 'read'):
+        position = source.tell()
+        for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+        source.seek(position)
+    else:
+        hasher.update(memoryview(source)) # Raises TypeError for anything that isn't bytes-like
+    return hasher.hexdigest()
+
+
+FILE_FIELDS = ('output_paths', 'output_path', 'audio_bytes') # Stored as files next to meta.json
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serialisable")
+
+
+def _json_fields(result: dict) -> dict:
+    """ Every field of a result except the files, as plain JSON values; fields that can't be stored are left out. """
+    fields = {}
+    for name, value in result.items():
+        if name in FILE_FIELDS or name in ('success', 'cached'):
+            continue
+        try:
+            fields[name] = json.loads(json.dumps(value, default=_json_default))
+        except (TypeError, ValueError):
+            logger.debug(f"Not caching result field '{name}' ({type(value).__name__})")
+    return fields
+
+
+class ResultCache:
+    """
+    On-disk, content-addressed cache for processing results.
+
+    Each entry is a directory <cache_dir>/<key>/ holding meta.json (the result's JSON fields) plus the
+    stored files, so a hit has the same shape as the run that stored it.
+    The mtime of meta.json is the last-access time used for LRU eviction.
+    """
+
+    def __init__(self, cache_dir: str = config.CACHE_DIR, max_bytes: int = config.CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(stage: str, input_digest: str, params: dict) -> str:
+        """ Builds the cache key from the input audio hash and the stage parameters. """
+        payload = json.dumps({'stage': stage, 'input': input_digest, 'params': params,
+                              'version': config.CACHE_VERSION}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key: str) -> dict | None:
+        """
+        Returns the stored result for `key` (and marks it recently used), or None. Results stored with a
+        layout carry it under 'layout' ({name: path relative to the stage's output_dir}).
+        """
+        entry_dir = self._entry_dir(key)
+        meta_path = os.path.join(entry_dir, "meta.json")
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            result = {'success': True, **meta['result'], 'cached': True}
+            if 'output_paths' in meta:
+                result['output_paths'] = {name: os.path.join(entry_dir, fname) for name, fname in meta['output_paths'].items()}
+            if 'output_path' in meta:
+                result['output_path'] = os.path.join(entry_dir, meta['output_path'])
+            if 'layout' in meta:
+                result['layout'] = meta['layout']
+            if 'audio_bytes' in meta:
+                with open(os.path.join(entry_dir, meta['audio_bytes']), "rb") as f:
+                    result['audio_bytes'] = f.read()
+            os.utime(meta_path) # Touch for LRU
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return result
+
+    def put(self, key: str, result: dict, layout: dict | None = None) -> dict:
+        """
+        Stores a successful result. layout maps output_paths names to where the stage put them relative to
+        its output_dir, so a hit can recreate them there. Returns the result unchanged; storing never fails the caller.
+        """
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Build the entry in a scratch dir and rename it into place so readers never see half an entry
+            staging_dir = tempfile.mkdtemp(prefix=".staging-", dir=self.cache_dir)
+            meta = {'result': _json_fields(result), 'created': time.time()}
+            if result.get('output_paths'):
+                meta['output_paths'] = {}
+                for name, path in result['output_paths'].items():
+                    fname = f"{name}{os.path.splitext(path)[1]}"
+                    shutil.copyfile(path, os.path.join(staging_dir, fname))
+                    meta['output_paths'][name] = fname
+                if layout:
+                    meta['layout'] = layout
+            if result.get('output_path'):
+                meta['output_path'] = f"output{os.path.splitext(result['output_path'])[1]}"
+                shutil.copyfile(result['output_path'], os.path.join(staging_dir, meta['output_path']))
+            if result.get('audio_bytes') is not None:
+                meta['audio_bytes'] = "audio.bin"
+                with open(os.path.join(staging_dir, "audio.bin"), "wb") as f:
+                    f.write(result['audio_bytes'])
+            with open(os.path.join(staging_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            try:
+                os.replace(staging_dir, self._entry_dir(key))
+            except OSError:
+                # Another process stored the same key first; theirs is equivalent
+                shutil.rmtree(staging_dir, ignore_errors=True)
+            self.evict()
+        except Exception as e:
+            logger.warning(f"Could not store result in cache: {e}")
+        return result
+
+    def _entries(self):
+        """ Yields (last_access, size, path) for each complete entry. """
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            meta_path = os.path.join(entry_dir, "meta.json")
+            if name.startswith(".") or not os.path.exists(meta_path):
+                continue
+            size = sum(e.stat().st_size for e in os.scandir(entry_dir) if e.is_file())
+            yield os.path.getmtime(meta_path), size, entry_dir
+
+    def evict(self):
+        """ Removes least-recently-used entries until the cache fits in max_bytes. """
+        if not os.path.isdir(self.cache_dir):
+            return
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            logger.info(f"Evicted cache entry {os.path.basename(entry_dir)} ({size} bytes)")
+
+    def stats(self) -> dict:
+        """ Returns hit/miss counters and the current on-disk footprint. """
+        entries = list(self._entries()) if os.path.isdir(self.cache_dir) else []
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries), 'max_bytes': self.max_bytes}
+
+
+result_cache = ResultCache()
+
+TRACK_PLACEHOLDER = "{track}"
+
+
+def _output_layout(output_paths: dict, output_dir: str, track: str | None) -> dict | None:
+    """
+    Where each output sits relative to output_dir, with a directory named after the input's track
+    replaced by TRACK_PLACEHOLDER. None if any output lies outside output_dir.
+    """
+    layout = {}
+    for name, path in output_paths.items():
+        relative = os.path.relpath(path, output_dir)
+        if relative.startswith(os.pardir) or os.path.isabs(relative):
+            return None
+        *dirs, file_name = relative.split(os.sep)
+        layout[name] = "/".join([TRACK_PLACEHOLDER if part == track else part for part in dirs] + [file_name])
+    return layout
+
+
+def _materialize(output_paths: dict, layout: dict, output_dir: str, track: str | None) -> dict:
+    """ Copies cached outputs into output_dir following layout; returns the new paths. """
+    placed = {}
+    for name, path in output_paths.items():
+        relative = layout[name]
+        if track is not None:
+            relative = relative.replace(TRACK_PLACEHOLDER, track)
+        destination = os.path.join(output_dir, *relative.split("/"))
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(path, destination)
+        placed[name] = destination
+    return placed
+
+
+def _copy_out(output_paths: dict, directory: str, prefix: str) -> dict:
+    """ Copies cached outputs into a new folder under directory for callers that gave no location; returns the new paths. """
+    os.makedirs(directory, exist_ok=True)
+    destination_dir = tempfile.mkdtemp(prefix=f"{prefix}_", dir=directory)
+    placed = {}
+    for name, path in output_paths.items():
+        placed[name] = os.path.join(destination_dir, os.path.basename(path))
+        shutil.copyfile(path, placed[name])
+    return placed
+
+
+def cached_stage(stage: str, params: tuple = (), fingerprints: dict | None = None):
+    """
+    Decorator for processing functions whose first argument is an audio source
+    (path, bytes-like, file-like or (ndarray, sr); see hash_source). The named `params` (with defaults
+    applied) are part of the cache key; anything else (like output_dir) is not. Only successful results are stored.
+    fingerprints maps a param to a function giving what goes into the key in place of its value, for
+    params that name something whose contents can change (e.g. a stored noise profile).
+    On a hit the outputs are copied to where the call asked for them: output_file, or for stages that
+    write several files into an output_dir (Demucs stems), the same layout under that directory.
+    Without either they go to a fresh folder under output_dir (or config.PROCESSED_OUTPUT_DIR), so a
+    hit never hands out a path inside the cache, where eviction could delete it.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not config.CACHE_ENABLED:
+                return func(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            input_source = next(iter(bound.arguments.values()))
+            key_params = {name: bound.arguments[name] for name in params}
+            output_dir = bound.arguments.get('output_dir')
+            input_name = source_name(input_source)
+            track = os.path.splitext(input_name)[0] if input_name else None
+            try:
+                with metrics.timer("hash_input"):
+                    digest = hash_source(input_source)
+                for name, fingerprint in (fingerprints or {}).items():
+                    key_params[name] = fingerprint(key_params[name])
+            except (OSError, TypeError, ValueError):
+                return func(*args, **kwargs) # Let the stage report the missing/invalid input itself
+            key = ResultCache.make_key(stage, digest, key_params)
+
+            cached = result_cache.get(key)
+            metrics.inc("result_cache_total", stage=stage, result="miss" if cached is None else "hit")
+            if cached is not None:
+                logger.info(f"Cache hit for {stage} ({source_label(input_source)})")
+                requested_output = bound.arguments.get('output_file')
+                copy_dir = output_dir or config.PROCESSED_OUTPUT_DIR
+                if cached.get('output_path') and requested_output:
+                    # The caller asked for the result at a specific path
+                    os.makedirs(os.path.dirname(requested_output) or ".", exist_ok=True)
+                    shutil.copyfile(cached['output_path'], requested_output)
+                    cached['output_path'] = requested_output
+                elif cached.get('output_path'):
+                    cached['output_path'] = _copy_out({'output': cached['output_path']}, copy_dir, track or stage)['output']
+                layout = cached.pop('layout', None)
+                if cached.get('output_paths') and output_dir and layout:
+                    # Serve stems from the caller's directory, not from an entry eviction may remove
+                    cached['output_paths'] = _materialize(cached['output_paths'], layout, output_dir, track)
+                elif cached.get('output_paths'):
+                    cached['output_paths'] = _copy_out(cached['output_paths'], copy_dir, track or stage)
+                return cached
+            logger.info(f"Cache miss for {stage} ({source_label(input_source)})")
+            result = func(*args, **kwargs)
+            if result.get('success'):
+                layout = None
+                if result.get('output_paths') and output_dir:
+                    layout = _output_layout(result['output_paths'], output_dir, track)
+                result_cache.put(key, result, layout)
+            return result
+        return wrapper
+    return decorator
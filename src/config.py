@@ -10,19 +10,192 @@ DEMUCS_OUTPUT_DIR = os.path.join(BASE_DIR, "output_demucs")
 # NR_OUTPUT_DIR = os.path.join(BASE_DIR, "output_noise_reduced") # Removed
 # LOUDNESS_OUTPUT_DIR = os.path.join(BASE_DIR, "output_loudness_normalized") # Removed
 YOUTUBE_OUTPUT_DIR = os.path.join(BASE_DIR, "output_youtube")
+PROCESSED_OUTPUT_DIR = os.path.join(BASE_DIR, "output_processed") # Streamed noise reduction / normalization results
 
 # --- Default Parameters ---
 DEFAULT_TARGET_LUFS = -23.0
 DEFAULT_DEMUCS_MODEL = "htdemucs" # Or whichever you prefer
-DEFAULT_DEMUCS_STEMS = "vocals" # e.g., 'vocals' for vocals/no_vocals
+DEFAULT_DEMUCS_STEMS = "vocals" # e.g., 'vocals' for vocals/no_vocals, 'four' for drums/bass/other/vocals
+
+# --- Demucs Profiles ---
+# Speed/quality presets for separation. model: used unless the caller names one; segment: seconds the model
+# sees at once (None = the model's own length; htdemucs can't go above 7.8); shifts: random time-shift passes
+# averaged together (0 = none, each extra one costs a full pass); overlap: fraction shared by neighbouring
+# chunks; jobs: parallel chunk workers (demucs -j, 0 = torch threads only); output: 'int16', 'int24',
+# 'float32' or 'mp3'; rtf: rough wall seconds per audio second on DEMUCS_PROFILE_REFERENCE_CPUS cores,
+# used by the 'auto' profile to predict latency.
+DEMUCS_PROFILES = {
+    'fast': {'model': "htdemucs", 'segment': None, 'shifts': 0, 'overlap': 0.1, 'jobs': 0, 'output': "int16", 'rtf': 0.3},
+    'balanced': {'model': "htdemucs", 'segment': None, 'shifts': 1, 'overlap': 0.25, 'jobs': 0, 'output': "int16", 'rtf': 0.35},
+    'best': {'model': "htdemucs_ft", 'segment': None, 'shifts': 2, 'overlap': 0.25, 'jobs': 0, 'output': "int24", 'rtf': 2.8},
+}
+# A profile name, or 'auto' to take the best profile expected to finish within DEMUCS_LATENCY_BUDGET_SEC
+DEMUCS_PROFILE = os.environ.get("VOCALIZER_DEMUCS_PROFILE", "balanced")
+DEMUCS_LATENCY_BUDGET_SEC = float(os.environ.get("VOCALIZER_DEMUCS_LATENCY_BUDGET_SEC", 300))
+DEMUCS_PROFILE_REFERENCE_CPUS = 4
+
+# --- Demucs Worker Pool ---
+# "pool" keeps models resident in long-lived worker processes, "inprocess" keeps them in the calling process,
+# "subprocess" runs the demucs CLI per request
+DEMUCS_BACKEND = os.environ.get("VOCALIZER_DEMUCS_BACKEND", "pool")
+DEMUCS_SAMPLE_RATE = 44100 # Rate the Demucs models run at; the PCM fast path decodes straight to it
+DEMUCS_POOL_MODELS = [DEFAULT_DEMUCS_MODEL] # Models each worker loads at startup and keeps in memory
+# Each worker runs torch with CPU_COUNT // DEMUCS_POOL_WORKERS threads, so the pool fills the machine
+CPU_COUNT = os.cpu_count() or 1
+DEMUCS_POOL_WORKERS = int(os.environ.get("VOCALIZER_DEMUCS_WORKERS", max(1, CPU_COUNT // 4)))
+
+# --- Segment-parallel Demucs ---
+# Long inputs are cut into overlapping segments that are separated on the pool's workers at once
+DEMUCS_SEGMENT_MIN_SEC = float(os.environ.get("VOCALIZER_DEMUCS_SEGMENT_MIN_SEC", 180)) # Auto-enable at this duration
+DEMUCS_SEGMENT_SEC = float(os.environ.get("VOCALIZER_DEMUCS_SEGMENT_SEC", 60))
+DEMUCS_SEGMENT_OVERLAP_SEC = float(os.environ.get("VOCALIZER_DEMUCS_SEGMENT_OVERLAP_SEC", 2)) # Crossfaded when stitching
+
+# --- Noise Reduction Defaults ---
+DEFAULT_NOISE_PROFILE_SEC = 0.5 # Length of the lead-in used to estimate the noise profile
+DEFAULT_NOISE_FLOOR = 0.02 # Extra fraction of the noise profile subtracted
+
+# --- Stored Noise Profiles (src/noise_profiles.py) ---
+# Named per-bin noise estimates (<name>.npz) that any denoise call can use instead of the file's own lead-in
+NOISE_PROFILE_DIR = os.environ.get("VOCALIZER_NOISE_PROFILE_DIR", os.path.join(BASE_DIR, "noise_profiles"))
+NOISE_PROFILE = os.environ.get("VOCALIZER_NOISE_PROFILE") or None # Profile used by default (unset = per-file lead-in)
+NOISE_PROFILE_QUIETEST = 0.1 # Fraction of the quietest frames a profile is estimated from when no noise clip is given
+NOISE_PROFILE_MAX_FRAMES = 8192 # Quietest frames kept during estimation (~4 MB per 1000 frames at n_fft 2048)
+
+# --- Silence Skipping (src/silence.py) ---
+# Separation and noise reduction can run on the active regions only, leaving the dead air between them out
+SKIP_SILENCE = os.environ.get("VOCALIZER_SKIP_SILENCE", "0") == "1"
+SILENCE_THRESHOLD_DBFS = float(os.environ.get("VOCALIZER_SILENCE_THRESHOLD_DBFS", -50)) # Frame RMS below this is silence
+SILENCE_MIN_SEC = float(os.environ.get("VOCALIZER_SILENCE_MIN_SEC", 1.0)) # Shorter pauses stay inside their region
+SILENCE_PAD_SEC = 0.25 # Kept on both sides of every active region
+SILENCE_FRAME_SEC = 0.02 # RMS frame length
+SILENCE_FILL = os.environ.get("VOCALIZER_SILENCE_FILL", "zero") # Skipped samples in the output: 'zero' or 'passthrough'
+SILENCE_MIN_SAVINGS = 0.1 # Below this fraction of skipped samples the whole input is processed as usual
+
+# --- Loudness (src/loudness.py) ---
+# Ceiling for the optional true-peak limiter applied after loudness normalization, e.g. -1.0 (unset = no limiter)
+_true_peak_limit = os.environ.get("VOCALIZER_TRUE_PEAK_LIMIT_DBTP", "")
+TRUE_PEAK_LIMIT_DBTP = float(_true_peak_limit) if _true_peak_limit else None
+
+# --- Streaming ---
+# Inputs at least this long are processed block-wise and written to disk instead of loaded whole
+STREAMING_MIN_DURATION_SEC = float(os.environ.get("VOCALIZER_STREAMING_MIN_SEC", 600))
+
+# --- Bulk YouTube Downloads ---
+YOUTUBE_BULK_WORKERS = int(os.environ.get("VOCALIZER_YT_WORKERS", 4)) # Concurrent downloads
+YOUTUBE_MIN_REQUEST_INTERVAL_SEC = float(os.environ.get("VOCALIZER_YT_MIN_INTERVAL_SEC", 1.0)) # Per host
+YOUTUBE_ARCHIVE_FILENAME = "download_archive.txt" # Bulk-download archive (one video ID per line), kept inside each output dir
+YOUTUBE_ARCHIVE_PATH = os.path.join(YOUTUBE_OUTPUT_DIR, YOUTUBE_ARCHIVE_FILENAME)
+YOUTUBE_INDEX_FILENAME = "index.sqlite3" # Video-ID download index, kept inside each output dir
+YOUTUBE_STORE_MAX_BYTES = int(os.environ.get("VOCALIZER_YT_STORE_MAX_MB", 0)) * 1024 * 1024 # 0 = no cap
+# Keep YouTube's native bestaudio stream (opus/webm or m4a) instead of re-encoding it to m4a with ffmpeg
+YOUTUBE_NATIVE_AUDIO = os.environ.get("VOCALIZER_YT_NATIVE_AUDIO", "0") == "1"
+
+# --- Background Jobs (Streamlit app) ---
+JOB_WORKERS = int(os.environ.get("VOCALIZER_JOB_WORKERS", max(2, CPU_COUNT // 2))) # Jobs running at once
+JOB_MAX_ACTIVE = int(os.environ.get("VOCALIZER_JOB_MAX_ACTIVE", 4 * JOB_WORKERS)) # Queued + running before rejecting
+JOB_POLL_INTERVAL_SEC = 1.0 # How often a waiting session refreshes the job status
+JOB_RETENTION_SEC = 3600 # Finished jobs (and their results) are forgotten after this
+
+# --- Durable Job Queue (src/jobqueue.py, src/worker.py) ---
+# SQLite file shared by every worker; keep it on a filesystem with working POSIX locks (local disk or a proper shared volume)
+QUEUE_PATH = os.environ.get("VOCALIZER_QUEUE_PATH", os.path.join(BASE_DIR, "jobs.sqlite3"))
+QUEUE_LEASE_SEC = float(os.environ.get("VOCALIZER_QUEUE_LEASE_SEC", 120)) # Renewed by heartbeats; expired = worker died
+QUEUE_MAX_ATTEMPTS = int(os.environ.get("VOCALIZER_QUEUE_MAX_ATTEMPTS", 3)) # Then the job is dead-lettered
+QUEUE_BACKOFF_BASE_SEC = float(os.environ.get("VOCALIZER_QUEUE_BACKOFF_SEC", 15)) # Doubles per attempt
+QUEUE_BACKOFF_MAX_SEC = 1800
+QUEUE_POLL_SEC = float(os.environ.get("VOCALIZER_QUEUE_POLL_SEC", 2)) # Idle workers check for new jobs this often
+WORKER_PROCESSES = int(os.environ.get("VOCALIZER_WORKER_PROCESSES", max(1, CPU_COUNT // 4)))
+
+# --- HTTP API (src/server.py) ---
+SERVER_HOST = os.environ.get("VOCALIZER_SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.environ.get("VOCALIZER_SERVER_PORT", 8600))
+SERVER_WORKERS = int(os.environ.get("VOCALIZER_SERVER_WORKERS", JOB_WORKERS)) # Processing threads
+SERVER_MAX_ACTIVE = int(os.environ.get("VOCALIZER_SERVER_MAX_ACTIVE", 2 * SERVER_WORKERS)) # Uploading + processing; more get 429
+SERVER_MAX_UPLOAD_BYTES = int(os.environ.get("VOCALIZER_SERVER_MAX_UPLOAD_MB", 512)) * 1024 * 1024
+SERVER_CHUNK_BYTES = 256 * 1024 # Response body chunk; each is flushed before the next is read
+SERVER_RETRY_AFTER_SEC = 5 # Retry-After sent with 429 / 503
+SERVER_DRAIN_TIMEOUT_SEC = float(os.environ.get("VOCALIZER_SERVER_DRAIN_SEC", 120)) # On SIGTERM, wait this long for running requests
 
 # --- File Handling ---
 TEMP_DIR_BASE = os.path.join(BASE_DIR, ".temp_audio") # For temporary uploaded files
 
+# --- Ingest Cache ---
+# Decoded audio is stored once as memory-mappable float32 .npy files (see src/ingest.py)
+INGEST_DIR = os.path.join(TEMP_DIR_BASE, "ingest")
+IN_USE_DIR = os.path.join(TEMP_DIR_BASE, ".in_use") # Markers of files a process is using (see storage.in_use)
+INGEST_CACHE_MAX_BYTES = int(os.environ.get("VOCALIZER_INGEST_MAX_MB", 4096)) * 1024 * 1024
+
+# --- Result Cache ---
+# Stage results are stored under a hash of the input audio + stage parameters
+CACHE_ENABLED = os.environ.get("VOCALIZER_CACHE", "1") != "0"
+CACHE_DIR = os.path.join(BASE_DIR, ".cache_results")
+CACHE_MAX_BYTES = int(os.environ.get("VOCALIZER_CACHE_MAX_MB", 2048)) * 1024 * 1024 # LRU eviction above this
+CACHE_VERSION = 4 # Bump when a stage's output changes so old entries stop matching
+
+# --- Player Previews ---
+# The in-app players stream a compressed copy of each output; the full WAV is only read for downloads
+PREVIEW_FORMAT = os.environ.get("VOCALIZER_PREVIEW_FORMAT", "mp3") # mp3, opus or flac
+PREVIEW_COMPRESSION_LEVEL = float(os.environ.get("VOCALIZER_PREVIEW_COMPRESSION", 0.9)) # 0 = best quality, 1 = smallest
+PREVIEW_DIR = os.path.join(BASE_DIR, ".cache_previews")
+PREVIEW_MAX_BYTES = int(os.environ.get("VOCALIZER_PREVIEW_MAX_MB", 512)) * 1024 * 1024
+
+# --- Benchmarks ---
+BENCHMARK_DIR = os.path.join(BASE_DIR, ".benchmark") # Synthetic inputs, scratch outputs and reports of src/benchmark.py
+
+# --- Metrics & Logging ---
+METRICS_ENABLED = os.environ.get("VOCALIZER_METRICS", "1") != "0" # Off = instrumentation compiles away to no-ops
+METRICS_PORT = int(os.environ.get("VOCALIZER_METRICS_PORT", 0)) # Serve Prometheus text on :PORT/metrics (0 = off)
+METRICS_FILE = os.environ.get("VOCALIZER_METRICS_FILE", "") # Periodic Prometheus text dump, e.g. node_exporter's textfile dir (unset = off)
+METRICS_FLUSH_SEC = float(os.environ.get("VOCALIZER_METRICS_FLUSH_SEC", 15))
+LOG_JSON = os.environ.get("VOCALIZER_LOG_JSON", "0") == "1" # One JSON object per log line, with the job's correlation ID
+
+# --- Startup Warm-up ---
+WARMUP_ENABLED = os.environ.get("VOCALIZER_WARMUP", "1") != "0" # Background imports/priming after the app starts
+WARMUP_DEMUCS = os.environ.get("VOCALIZER_WARMUP_DEMUCS", "1") != "0" # Also start the Demucs pool and load its models
+
+# --- Storage Quotas ---
+# The janitor (src/storage.py) keeps each directory under its size and age limits (0 = no limit),
+# removing whole entries least-recently-used first. depth: level of the removable entries
+# (output_demucs/<model>/<track> is depth 2). index: a download store index (src/store.py) whose
+# last_access times order the entries.
+def _quota(path, env_name, default_mb, default_age_hours, depth=1, exclude=(), index=None):
+    return {
+        'path': path,
+        'max_bytes': int(os.environ.get(f"VOCALIZER_{env_name}_MAX_MB", default_mb)) * 1024 * 1024,
+        'max_age_sec': float(os.environ.get(f"VOCALIZER_{env_name}_MAX_AGE_HOURS", default_age_hours)) * 3600,
+        'depth': depth,
+        'exclude': set(exclude),
+        'index': index,
+    }
+
+STORAGE_QUOTAS = {
+    'demucs': _quota(DEMUCS_OUTPUT_DIR, "DEMUCS_OUTPUT", 10240, 168, depth=2),
+    'youtube': _quota(YOUTUBE_OUTPUT_DIR, "YOUTUBE_OUTPUT", 10240, 0,
+                      exclude=(YOUTUBE_INDEX_FILENAME, YOUTUBE_INDEX_FILENAME + "-wal", YOUTUBE_INDEX_FILENAME + "-shm",
+                               YOUTUBE_ARCHIVE_FILENAME),
+                      index=YOUTUBE_INDEX_FILENAME),
+    'processed': _quota(PROCESSED_OUTPUT_DIR, "PROCESSED_OUTPUT", 4096, 168),
+    'temp': _quota(TEMP_DIR_BASE, "TEMP", 2048, 24, # ingest evicts itself; markers are cleared by clear_orphans
+                   exclude=(os.path.basename(INGEST_DIR), os.path.basename(IN_USE_DIR))),
+}
+STORAGE_SWEEP_INTERVAL_SEC = float(os.environ.get("VOCALIZER_STORAGE_SWEEP_SEC", 600))
+STORAGE_MIN_AGE_SEC = 300 # Anything used more recently is assumed to be in use
+STORAGE_ORPHAN_AGE_SEC = 3600 # Temp leftovers older than this are from crashed runs
+
 # --- Ensure Directories Exist ---
 def ensure_dirs():
     os.makedirs(DEMUCS_OUTPUT_DIR, exist_ok=True)
     # os.makedirs(NR_OUTPUT_DIR, exist_ok=True) # Removed
     # os.makedirs(LOUDNESS_OUTPUT_DIR, exist_ok=True) # Removed
     os.makedirs(YOUTUBE_OUTPUT_DIR, exist_ok=True)
-    os.makedirs(TEMP_DIR_BASE, exist_ok=True)
\ No newline at end of file
+    os.makedirs(PROCESSED_OUTPUT_DIR, exist_ok=True)
+    os.makedirs(TEMP_DIR_BASE, exist_ok=True)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Leftovers of crashed runs (only once per process, and only files too old to belong to a live job)
+    global _orphans_cleared
+    if not _orphans_cleared:
+        from src import storage
+        storage.clear_orphans()
+        _orphans_cleared = True
+
+_orphans_cleared = False
\ No newline at end of file
@@ -0,0 +1,274 @@
+# src/demucs_pool.py
+import os
+import logging
+import threading
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from src import config, silence
+
+logger = logging.getLogger(__name__)
+
+# Models loaded in *this* process. In pool workers this is filled once by _init_worker
+# and then reused for every job the worker picks up from the executor's queue.
+_resident_models = {}
+
+NORM_EPS = 1e-8 # Added to the input's standard deviation before dividing by it
+
+# The demucs CLI's defaults; a profile (config.DEMUCS_PROFILES) overrides them per job
+DEFAULT_SETTINGS = {'segment': None, 'shifts': 1, 'overlap': 0.25, 'jobs': 0, 'output': "int16"}
+# Profile output -> demucs.audio.save_audio arguments
+_SAVE_FORMATS = {'int16': (".wav", {'as_float': False, 'bits_per_sample': 16}),
+                 'int24': (".wav", {'as_float': False, 'bits_per_sample': 24}),
+                 'float32': (".wav", {'as_float': True}),
+                 'mp3': (".mp3", {'bitrate': 320})}
+
+
+def _init_worker(model_names, torch_threads):
+    """ Runs once in every worker process: pins torch threads and loads the models. """
+    import torch
+    torch.set_num_threads(max(1, torch_threads))
+    for name in model_names:
+        get_resident_model(name)
+    logger.info(f"Demucs worker {os.getpid()} ready with models: {list(_resident_models)}")
+
+
+def get_resident_model(name: str):
+    """ Returns the Demucs model `name`, loading it into this process on first use. """
+    model = _resident_models.get(name)
+    if model is None:
+        from demucs.pretrained import get_model
+        logger.info(f"Loading Demucs model '{name}' in process {os.getpid()}...")
+        model = get_model(name)
+        model.cpu()
+        model.eval()
+        _resident_models[name] = model
+    return model
+
+
+def _normalisation(wav) -> tuple:
+    """
+    (offset, scale) that demucs.separate.main normalises a (channels, samples) tensor or array with.
+    NORM_EPS keeps the scale above zero, so digital silence doesn't turn into NaN.
+    """
+    ref = wav.mean(0)
+    return ref.mean(), ref.std() + NORM_EPS
+
+
+def _apply_resident_model(demucs_model, wav, settings: dict | None = None):
+    """
+    Runs the model on a (channels, samples) tensor with the same normalisation as demucs.separate.main,
+    using the profile's shifts, overlap, segment and jobs.
+    """
+    import torch
+    from demucs.apply import apply_model
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    offset, scale = _normalisation(wav)
+    wav = (wav - offset) / scale
+    with torch.no_grad():
+        sources = apply_model(demucs_model, wav[None], device="cpu", shifts=settings['shifts'], split=True,
+                              overlap=settings['overlap'], segment=settings['segment'], progress=False,
+                              num_workers=settings['jobs'])[0]
+    return sources * scale + offset
+
+
+def _named_stems(demucs_model, sources, stems: str) -> dict:
+    """ Maps stem file names (without .wav) to tensors, following the CLI's naming. """
+    if stems in demucs_model.sources:
+        # Two-stem mode: the requested stem plus the sum of everything else
+        sources = list(sources)
+        stem_audio = sources.pop(demucs_model.sources.index(stems))
+        return {stems: stem_audio, f"no_{stems}": sum(sources)}
+    return dict(zip(demucs_model.sources, sources))
+
+
+def separate_in_process(audio_path: str, output_dir: str, model: str, stems: str, settings: dict | None = None) -> str:
+    """
+    Separates `audio_path` with a resident model and writes the stems the same way the demucs CLI does:
+    output_dir / model / <track name> / <stem>.wav (plus no_<stem>.wav in two-stem mode; .mp3 for mp3 output).
+
+    Returns:
+        The directory the stems were written to.
+    """
+    from demucs.audio import save_audio
+    from demucs.separate import load_track
+
+    demucs_model = get_resident_model(model)
+    base_name = os.path.splitext(os.path.basename(audio_path))[0]
+    track_dir = os.path.join(output_dir, model, base_name)
+    os.makedirs(track_dir, exist_ok=True)
+
+    wav = load_track(audio_path, demucs_model.audio_channels, demucs_model.samplerate)
+    sources = _apply_resident_model(demucs_model, wav, settings)
+
+    ext, save_format = _SAVE_FORMATS[{**DEFAULT_SETTINGS, **(settings or {})}['output']]
+    save_kwargs = {'samplerate': demucs_model.samplerate, 'clip': 'rescale', **save_format}
+    for name, audio in _named_stems(demucs_model, sources, stems).items():
+        save_audio(audio, os.path.join(track_dir, f"{name}{ext}"), **save_kwargs)
+    return track_dir
+
+
+def separate_array_in_process(wav: np.ndarray, sr: int, model: str, stems: str,
+                              settings: dict | None = None) -> tuple[dict, int]:
+    """
+    Separates an in-memory (channels, samples) or mono float buffer without touching disk.
+    Digital silence (e.g. a trailing segment) isn't run through the model: every stem is silent too.
+
+    Returns:
+        ({stem name: float32 ndarray (channels, samples)}, model sample rate)
+    """
+    demucs_model = get_resident_model(model)
+    if silence.is_silent(wav):
+        length = int(round(np.shape(wav)[-1] * demucs_model.samplerate / sr))
+        zeros = [np.zeros((demucs_model.audio_channels, length), dtype=np.float32) for _ in demucs_model.sources]
+        return _named_stems(demucs_model, zeros, stems), demucs_model.samplerate
+
+    import torch
+    from demucs.audio import convert_audio
+
+    wav_tensor = torch.from_numpy(np.atleast_2d(np.asarray(wav, dtype=np.float32)))
+    wav_tensor = convert_audio(wav_tensor, sr, demucs_model.samplerate, demucs_model.audio_channels)
+    sources = _apply_resident_model(demucs_model, wav_tensor, settings)
+    named = {name: audio.numpy().astype(np.float32) for name, audio in _named_stems(demucs_model, sources, stems).items()}
+    return named, demucs_model.samplerate
+
+
+class DemucsPool:
+    """
+    Long-lived pool of worker processes that each keep the Demucs models resident.
+    Jobs are handed to the workers over the executor's call queue, so only the first job
+    per worker pays for torch import and weight loading. Once a worker dies or fails to load its
+    models the executor is unusable; `broken` is then set and get_pool() starts a new pool.
+    """
+
+    def __init__(self, max_workers: int = config.DEMUCS_POOL_WORKERS, models=None):
+        self.max_workers = max(1, max_workers)
+        self._broken = False
+        self.models = list(models if models is not None else config.DEMUCS_POOL_MODELS)
+        torch_threads = max(1, config.CPU_COUNT // self.max_workers)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            initializer=_init_worker,
+            initargs=(self.models, torch_threads),
+        )
+        logger.info(f"Started Demucs pool: {self.max_workers} workers x {torch_threads} torch threads, models={self.models}")
+
+    @property
+    def broken(self) -> bool:
+        # ProcessPoolExecutor flags itself as soon as a worker dies, before the affected futures resolve
+        return self._broken or bool(getattr(self._executor, '_broken', False))
+
+    def _submit(self, fn, *args):
+        try:
+            return self._executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._broken = True
+            raise
+
+    def submit(self, audio_path: str, output_dir: str, model: str, stems: str, settings: dict | None = None):
+        """ Queues a separation job and returns a Future resolving to the stem directory. """
+        return self._submit(separate_in_process, audio_path, output_dir, model, stems, settings)
+
+    def submit_array(self, wav: np.ndarray, sr: int, model: str, stems: str, settings: dict | None = None):
+        """ Queues separation of an in-memory buffer; the Future resolves to ({stem: array}, sample rate). """
+        return self._submit(separate_array_in_process, wav, sr, model, stems, settings)
+
+    def separate(self, audio_path: str, output_dir: str, model: str, stems: str, settings: dict | None = None) -> str:
+        """ Blocking version of submit(). """
+        return self.submit(audio_path, output_dir, model, stems, settings).result()
+
+    def warm_up(self):
+        """ Blocks until every worker has started and loaded its models. """
+        for future in [self._submit(os.getpid) for _ in range(self.max_workers)]:
+            future.result()
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def _crossfade_weights(length: int, fade_in: int, fade_out: int) -> np.ndarray:
+    """ Linear ramps at the segment edges that overlap a neighbour; 1 elsewhere. """
+    weights = np.ones(length, dtype=np.float32)
+    if fade_in:
+        weights[:fade_in] = np.linspace(0.0, 1.0, fade_in + 2, dtype=np.float32)[1:-1]
+    if fade_out:
+        weights[length - fade_out:] = np.minimum(weights[length - fade_out:],
+                                                 np.linspace(1.0, 0.0, fade_out + 2, dtype=np.float32)[1:-1])
+    return weights
+
+
+def separate_segmented(wav: np.ndarray, sr: int, model: str, stems: str,
+                       segment_sec: float = config.DEMUCS_SEGMENT_SEC,
+                       overlap_sec: float = config.DEMUCS_SEGMENT_OVERLAP_SEC,
+                       pool: "DemucsPool | None" = None, settings: dict | None = None) -> tuple[dict, int]:
+    """
+    Splits a (channels, samples) buffer into overlapping segments, separates them in parallel on the
+    pool's workers and stitches the stems back together with linear crossfades over the overlaps.
+
+    Returns:
+        ({stem name: float32 ndarray (channels, samples)}, model sample rate)
+    """
+    pool = pool or get_pool()
+    wav = np.atleast_2d(wav)
+    n = wav.shape[-1]
+    segment = max(1, int(segment_sec * sr))
+    overlap = min(int(overlap_sec * sr), segment // 2)
+    step = segment - overlap
+    starts = list(range(0, max(n - overlap, 1), step))
+    logger.info(f"Separating {n / sr:.1f}s in {len(starts)} segments of {segment_sec}s ({overlap_sec}s overlap) "
+                f"on {pool.max_workers} workers")
+
+    futures = [pool.submit_array(np.ascontiguousarray(wav[:, start:start + segment]), sr, model, stems, settings)
+               for start in starts]
+
+    stitched, norm, out_sr = {}, None, None
+    for i, (start, future) in enumerate(zip(starts, futures)):
+        named, out_sr = future.result()
+        ratio = out_sr / sr
+        out_start = int(round(start * ratio))
+        if norm is None:
+            total = int(round(n * ratio))
+            norm = np.zeros(total, dtype=np.float32)
+        length = min(next(iter(named.values())).shape[-1], len(norm) - out_start)
+        fade_in = int(round(overlap * ratio)) if i > 0 else 0
+        fade_out = int(round(overlap * ratio)) if i < len(starts) - 1 else 0
+        weights = _crossfade_weights(length, min(fade_in, length), min(fade_out, length))
+        norm[out_start:out_start + length] += weights
+        for name, audio in named.items():
+            if name not in stitched:
+                stitched[name] = np.zeros((audio.shape[0], len(norm)), dtype=np.float32)
+            stitched[name][:, out_start:out_start + length] += audio[:, :length] * weights
+
+    norm[norm == 0] = 1.0
+    for audio in stitched.values():
+        audio /= norm
+    return stitched, out_sr
+
+
+_pool = None # Started once and kept for the process lifetime (replaced if it breaks)
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> DemucsPool:
+    """
+    Returns the process-wide Demucs pool (DEMUCS_POOL_WORKERS workers), starting it on first use.
+    Whole-file jobs and segment-parallel runs share it, so the machine is never oversubscribed.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool.broken:
+            logger.warning("Demucs pool is broken (a worker died or failed to load its models); starting a new one")
+            _pool.shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            _pool = DemucsPool(max_workers=config.DEMUCS_POOL_WORKERS)
+        return _pool
+
+
+def shutdown_pool():
+    """ Stops the process-wide pool (e.g. on server shutdown). """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
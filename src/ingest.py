@@ -0,0 +1,225 @@
+# src/ingest.py
+# Decode-once ingest layer. Each source is decoded a single time into a canonical float32 .npy
+# (mono: (samples,), multi-channel: (channels, samples), like librosa.load) with a small JSON
+# sidecar holding the sample rate and channel count. Later reads are np.load(mmap_mode='r'),
+# so re-reading a long file costs a page-cache lookup instead of an ffmpeg/audioread decode.
+import io
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+import contextlib
+import numpy as np
+import soundfile as sf
+from src import config, metrics, storage
+from src.cache import hash_file, source_label
+
+# Anything the processing functions accept as input: a path, raw file bytes, a file-like object
+# (e.g. a Streamlit upload) or an already decoded (ndarray, sample_rate) pair
+AudioSource = str | os.PathLike | bytes | bytearray | memoryview | io.IOBase | tuple
+
+logger = logging.getLogger(__name__)
+
+_ingest_lock = threading.Lock()
+
+
+def _entry_paths(key: str) -> tuple[str, str]:
+    base = os.path.join(config.INGEST_DIR, key)
+    return base + ".npy", base + ".json"
+
+
+def _decode_to_npy(input_file: str, mono: bool, npy_path: str) -> dict:
+    """ Decodes input_file into npy_path and returns its metadata. Block-wise when soundfile can read the file. """
+    try:
+        info = sf.info(input_file)
+    except Exception:
+        info = None
+
+    if info is not None:
+        # soundfile-readable: fill a memory-mapped .npy block by block, never holding the whole file
+        shape = (info.frames,) if mono or info.channels == 1 else (info.channels, info.frames)
+        out = np.lib.format.open_memmap(npy_path, mode='w+', dtype=np.float32, shape=shape)
+        pos = 0
+        for block in sf.blocks(input_file, blocksize=1 << 16, dtype='float32', always_2d=True):
+            n = len(block)
+            if len(shape) == 1:
+                out[pos:pos + n] = block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
+            else:
+                out[:, pos:pos + n] = block.T
+            pos += n
+        out.flush()
+        del out
+        sr, channels, frames = info.samplerate, info.channels, info.frames
+    else:
+        # Compressed formats soundfile can't open (m4a, ...) go through librosa/audioread once
+        import librosa
+        y, sr = librosa.load(input_file, sr=None, mono=mono)
+        np.save(npy_path, y.astype(np.float32, copy=False))
+        channels = 1 if y.ndim == 1 else y.shape[0]
+        frames = y.shape[-1]
+    return {'sample_rate': int(sr), 'channels': int(channels), 'frames': int(frames),
+            'mono': mono, 'source': os.path.basename(input_file), 'created': time.time()}
+
+
+def load_audio(input_file: str, mono: bool = True) -> tuple[np.ndarray, int]:
+    """
+    Returns (read-only memory-mapped float32 array, sample rate) for input_file,
+    decoding it into the ingest cache on first use. Shapes match librosa.load(sr=None, mono=mono).
+    """
+    key = f"{hash_file(input_file)}_{'mono' if mono else 'multi'}"
+    npy_path, meta_path = _entry_paths(key)
+
+    if os.path.exists(npy_path) and os.path.exists(meta_path):
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            os.utime(meta_path) # Touch for LRU
+            metrics.inc("ingest_cache_total", result="hit")
+            return np.load(npy_path, mmap_mode='r'), meta['sample_rate']
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ingest entry {key} unreadable, decoding again: {e}")
+
+    os.makedirs(config.INGEST_DIR, exist_ok=True)
+    logger.info(f"Decoding {input_file} into the ingest cache...")
+    t0 = time.perf_counter()
+    fd, tmp_npy = tempfile.mkstemp(suffix=".npy.part", dir=config.INGEST_DIR)
+    os.close(fd)
+    metrics.inc("ingest_cache_total", result="miss")
+    try:
+        with metrics.timer("decode", decoder="ingest") as timing:
+            meta = _decode_to_npy(input_file, mono, tmp_npy)
+            timing.bytes = os.path.getsize(input_file)
+            timing.audio_sec = meta['frames'] / meta['sample_rate']
+        with open(meta_path + ".part", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        # Publish the data before the sidecar: an entry only counts once its .json exists
+        os.replace(tmp_npy, npy_path)
+        os.replace(meta_path + ".part", meta_path)
+    finally:
+        for leftover in (tmp_npy, meta_path + ".part"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    logger.info(f"Ingested {meta['source']} ({meta['frames']} frames @ {meta['sample_rate']} Hz) in {time.perf_counter() - t0:.2f}s")
+    evict()
+    return np.load(npy_path, mmap_mode='r'), meta['sample_rate']
+
+
+def iter_mono_blocks(input_file: str, block_size: int):
+    """ Yields consecutive mono float32 blocks of input_file from its memory-mapped ingest entry. """
+    y, _ = load_audio(input_file, mono=True)
+    for start in range(0, len(y), block_size):
+        yield np.asarray(y[start:start + block_size])
+
+
+def get_metadata(input_file: str, mono: bool = True) -> dict:
+    """ Sample rate / channels / frames of an ingested file (ingesting it if needed). """
+    load_audio(input_file, mono)
+    _, meta_path = _entry_paths(f"{hash_file(input_file)}_{'mono' if mono else 'multi'}")
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def evict(max_bytes: int | None = None):
+    """ Drops least-recently-used ingest entries until the cache fits in max_bytes. """
+    max_bytes = config.INGEST_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    if not os.path.isdir(config.INGEST_DIR):
+        return
+    with _ingest_lock:
+        entries = []
+        for name in os.listdir(config.INGEST_DIR):
+            if not name.endswith(".json"):
+                continue
+            meta_path = os.path.join(config.INGEST_DIR, name)
+            npy_path = meta_path[:-len(".json")] + ".npy"
+            try:
+                entries.append((os.path.getmtime(meta_path), os.path.getsize(npy_path), npy_path, meta_path))
+            except OSError:
+                continue
+        entries.sort()
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, npy_path, meta_path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                # Sidecar first so nobody picks up a half-removed entry; open memmaps stay valid on POSIX
+                os.remove(meta_path)
+                os.remove(npy_path)
+                total -= size
+                logger.info(f"Evicted ingest entry {os.path.basename(npy_path)} ({size} bytes)")
+            except OSError as e:
+                logger.warning(f"Could not evict ingest entry {npy_path}: {e}")
+
+
+# --- In-memory sources ---
+
+def is_path(source) -> bool:
+    return isinstance(source, (str, os.PathLike))
+
+
+def _open_buffer(source):
+    """ File-like view of a bytes-like or file-like source, rewound to the start. """
+    if hasattr(source, 'read'):
+        source.seek(0)
+        return source
+    return io.BytesIO(source) # Shares the memory of a bytes object; other buffers are copied once
+
+
+def load_source(source: AudioSource, mono: bool = True) -> tuple[np.ndarray, int]:
+    """
+    Like load_audio() for any AudioSource. Paths go through the ingest cache; buffers and file-like
+    objects are decoded straight from memory with soundfile; (ndarray, sr) pairs are used as they are.
+    """
+    if is_path(source):
+        return load_audio(source, mono)
+    if isinstance(source, tuple):
+        y, sr = source
+        y = np.asarray(y, dtype=np.float32)
+        return (y.mean(axis=0) if mono and y.ndim > 1 else y), int(sr)
+
+    try:
+        with metrics.timer("decode", decoder="buffer") as timing:
+            data, sr = sf.read(_open_buffer(source), dtype='float32', always_2d=True)
+            timing.bytes = data.nbytes
+            timing.audio_sec = len(data) / sr
+    except sf.LibsndfileError:
+        # Compressed formats soundfile can't open (m4a, ...) need a real file for audioread/ffmpeg
+        logger.info(f"soundfile cannot decode {source_label(source)} from memory, using a temp file")
+        import librosa
+        with source_path(source) as path:
+            y, sr = librosa.load(path, sr=None, mono=mono)
+        return y.astype(np.float32, copy=False), int(sr)
+    if mono:
+        return (data.mean(axis=1) if data.shape[1] > 1 else data[:, 0]), int(sr)
+    return (data.T if data.shape[1] > 1 else data[:, 0]), int(sr)
+
+
+@contextlib.contextmanager
+def source_path(source: AudioSource):
+    """
+    Yields a file path holding the source, for tools that only accept paths (the Demucs CLI/loader).
+    Paths are passed through; anything else is written to a temp file that is removed on exit.
+    """
+    if is_path(source):
+        yield os.fspath(source)
+        return
+    os.makedirs(config.TEMP_DIR_BASE, exist_ok=True)
+    if isinstance(source, tuple):
+        suffix = ".wav"
+    else:
+        suffix = os.path.splitext(getattr(source, 'name', '') or '')[1] or ".wav"
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=config.TEMP_DIR_BASE)
+    try:
+        if isinstance(source, tuple):
+            os.close(fd)
+            y, sr = source
+            sf.write(path, np.asarray(y).T, int(sr), subtype='FLOAT')
+        else:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_open_buffer(source).read() if hasattr(source, 'read') else source)
+        with storage.in_use(path):
+            yield path
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,223 @@
+# src/jobqueue.py
+# Durable job queue in a single SQLite file, shared by any number of worker processes (src/worker.py).
+# A worker claims a job atomically and holds a lease on it that its heartbeats keep renewing. If the
+# worker dies, the lease runs out and the job is claimed again. Failed attempts are retried with
+# exponential backoff, and once max_attempts are used up the job is dead-lettered (status 'dead').
+import os
+import json
+import time
+import uuid
+import random
+import socket
+import sqlite3
+import logging
+from src import config
+
+logger = logging.getLogger(__name__)
+
+# queued -> running -> done
+#              |  \-> queued again (retry after backoff)
+#              \----> dead (attempts exhausted, or not retryable)
+STATUSES = ("queued", "running", "done", "dead")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id            TEXT PRIMARY KEY,
+    kind          TEXT NOT NULL,
+    payload       TEXT NOT NULL,
+    status        TEXT NOT NULL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    max_attempts  INTEGER NOT NULL,
+    run_after     REAL NOT NULL,
+    lease_owner   TEXT,
+    lease_expires REAL,
+    result        TEXT,
+    error         TEXT,
+    created       REAL NOT NULL,
+    updated       REAL NOT NULL,
+    finished      REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, run_after);
+"""
+
+
+def worker_id() -> str:
+    """ Unique lease owner name for this process: host:pid:random. """
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def backoff_delay(attempts: int, base: float = config.QUEUE_BACKOFF_BASE_SEC,
+                  cap: float = config.QUEUE_BACKOFF_MAX_SEC) -> float:
+    """ Delay before retry number `attempts` + 1: base * 2^(attempts-1), capped, with +-20% jitter. """
+    return min(cap, base * 2 ** max(0, attempts - 1)) * random.uniform(0.8, 1.2)
+
+
+class JobQueue:
+    """
+    Persistent queue of processing jobs. Every call opens its own short-lived connection, so one
+    instance can be shared between threads, and any number of processes can open the same file.
+    """
+
+    def __init__(self, path: str = config.QUEUE_PATH, lease_sec: float = config.QUEUE_LEASE_SEC,
+                 max_attempts: int = config.QUEUE_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_sec = lease_sec
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode: claims use explicit BEGIN IMMEDIATE so two workers can't take the same row
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _row(row: sqlite3.Row | None) -> dict | None:
+        if row is None:
+            return None
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    # --- Producers ---
+
+    def enqueue(self, kind: str, payload: dict, max_attempts: int | None = None, job_id: str | None = None,
+                delay: float = 0.0) -> str:
+        """
+        Adds a job and returns its ID. Passing a job_id makes the call idempotent: a job that
+        already exists under that ID is kept as it is.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, kind, payload, status, max_attempts, run_after, created, updated) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), max_attempts or self.max_attempts, now + delay, now, now),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> dict | None:
+        with self._connect() as conn:
+            return self._row(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def requeue(self, job_id: str) -> bool:
+        """ Gives a dead-lettered job a fresh set of attempts. Returns False if it isn't dead. """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, run_after = ?, error = NULL, finished = NULL, "
+                "updated = ? WHERE id = ? AND status = 'dead'", (now, now, job_id))
+            return cursor.rowcount == 1
+
+    # --- Workers ---
+
+    def claim(self, owner: str, kinds=None) -> dict | None:
+        """
+        Atomically takes the oldest runnable job (queued and past its backoff, or running with an
+        expired lease) and leases it to owner for lease_sec. Returns the job, or None if there is none.
+        """
+        now = time.time()
+        kind_filter, kind_args = "", []
+        if kinds:
+            kind_filter = f" AND kind IN ({', '.join('?' * len(kinds))})"
+            kind_args = list(kinds)
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # A lease that ran out on the last attempt means the job keeps killing its worker: dead-letter it
+            dead = conn.execute(
+                "UPDATE jobs SET status = 'dead', error = 'Worker lost (lease expired) on the last attempt', "
+                "finished = ?, updated = ?, lease_owner = NULL WHERE status = 'running' AND lease_expires < ? "
+                "AND attempts >= max_attempts", (now, now, now)).rowcount
+            if dead:
+                logger.warning(f"Dead-lettered {dead} job(s) whose workers died on their last attempt")
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE ((status = 'queued' AND run_after <= ?) OR "
+                f"(status = 'running' AND lease_expires < ?)){kind_filter} ORDER BY run_after LIMIT 1",
+                [now, now] + kind_args).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_owner = ?, lease_expires = ?, "
+                "updated = ? WHERE id = ?", (owner, now + self.lease_sec, now, row['id']))
+            job = self._row(conn.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone())
+            conn.execute("COMMIT")
+            return job
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id: str, owner: str) -> bool:
+        """ Extends owner's lease. False means the lease was lost (expired and taken by another worker). """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                (now + self.lease_sec, now, job_id, owner))
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: str, owner: str, result: dict) -> bool:
+        """ Marks the job done with its result; ignored (False) if owner no longer holds the lease. """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_owner = NULL, lease_expires = NULL, "
+                "finished = ?, updated = ? WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                (json.dumps(result, default=str), now, now, job_id, owner))
+            return cursor.rowcount == 1
+
+    def fail(self, job_id: str, owner: str, error: str, retryable: bool = True) -> str | None:
+        """
+        Records a failed attempt: back to 'queued' after a backoff delay while attempts remain (and the
+        error is retryable), otherwise 'dead'. Returns the new status, or None if owner lost the lease.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ? AND lease_owner = ? "
+                               "AND status = 'running'", (job_id, owner)).fetchone()
+            if row is None:
+                return None
+            if retryable and row['attempts'] < row['max_attempts']:
+                delay = backoff_delay(row['attempts'])
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', error = ?, run_after = ?, lease_owner = NULL, "
+                    "lease_expires = NULL, updated = ? WHERE id = ?", (error, now + delay, now, job_id))
+                logger.info(f"Job {job_id} attempt {row['attempts']}/{row['max_attempts']} failed, retrying in {delay:.0f}s: {error}")
+                return "queued"
+            conn.execute(
+                "UPDATE jobs SET status = 'dead', error = ?, lease_owner = NULL, lease_expires = NULL, "
+                "finished = ?, updated = ? WHERE id = ?", (error, now, now, job_id))
+            logger.error(f"Job {job_id} dead-lettered after {row['attempts']} attempt(s): {error}")
+            return "dead"
+
+    # --- Maintenance ---
+
+    def stats(self) -> dict:
+        """ Job count per status. """
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in STATUSES}
+
+    def list(self, status: str | None = None, limit: int = 50) -> list[dict]:
+        """ Most recently updated jobs, optionally of one status. """
+        with self._connect() as conn:
+            if status:
+                rows = conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY updated DESC LIMIT ?", (status, limit))
+            else:
+                rows = conn.execute("SELECT * FROM jobs ORDER BY updated DESC LIMIT ?", (limit,))
+            return [self._row(row) for row in rows.fetchall()]
+
+    def purge(self, older_than_sec: float = 7 * 24 * 3600) -> int:
+        """ Deletes done jobs finished more than older_than_sec ago. Dead jobs are kept for inspection. """
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM jobs WHERE status = 'done' AND finished < ?",
+                                (time.time() - older_than_sec,)).rowcount
@@ -0,0 +1,134 @@
+# src/jobs.py
+# Background job execution for the Streamlit app. One JobManager is shared by all sessions
+# (app.py keeps it in st.cache_resource); sessions only hold job IDs in st.session_state and
+# poll for status, so a rerun or widget interaction never loses running work.
+import time
+import uuid
+import inspect
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from src import config, metrics
+
+logger = logging.getLogger(__name__)
+
+
+class JobRejected(Exception):
+    """ Raised when the server is already at its admission limit. """
+
+
+class Job:
+    """ State of one submitted job. Fields are written by the worker thread and read by sessions. """
+
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.status = "queued" # queued -> running -> done | failed
+        self.progress = 0.0 # 0..1, only advanced by functions that accept progress_callback
+        self.stage = None # Optional label reported alongside progress
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    def set_progress(self, fraction: float, stage: str | None = None):
+        self.progress = max(0.0, min(1.0, fraction))
+        if stage:
+            self.stage = stage
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+def _kind(func) -> str:
+    """ Metrics label for a job function (partials and callables without a name fall back to 'job'). """
+    return getattr(func, "__name__", "job")
+
+
+class JobManager:
+    """
+    Runs jobs on a bounded thread pool. The heavy lifting happens in numpy/librosa (which release the
+    GIL) or in the Demucs worker processes, so threads are enough here. At most max_active jobs may be
+    queued or running at once; further submissions raise JobRejected instead of piling up.
+    """
+
+    def __init__(self, max_workers: int = config.JOB_WORKERS, max_active: int = config.JOB_MAX_ACTIVE):
+        self.max_active = max_active
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="vocalizer-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        logger.info(f"Job manager started: {max_workers} workers, admission limit {max_active}")
+
+    def submit(self, name: str, func, *args, cleanup=None, on_result=None, **kwargs) -> str:
+        """
+        Queues func(*args, **kwargs) and returns the job ID. `cleanup` (no arguments) runs after the job
+        finishes either way, e.g. to delete a temp upload. `on_result(result)` runs in the worker and its
+        return value is stored as the job result, e.g. to move audio bytes to disk.
+        Raises JobRejected when at the admission limit.
+        """
+        self.prune()
+        job = Job(name)
+        with self._lock:
+            active = sum(1 for j in self._jobs.values() if j.active)
+            if active >= self.max_active:
+                raise JobRejected(f"Server busy: {active} jobs already queued or running. Please try again shortly.")
+            self._jobs[job.id] = job
+
+        if "progress_callback" in inspect.signature(func).parameters:
+            kwargs["progress_callback"] = job.set_progress
+        self._executor.submit(self._run, job, func, args, kwargs, cleanup, on_result)
+        metrics.inc("jobs_submitted_total", kind=_kind(func))
+        logger.info(f"Queued job {job.id} ({name})")
+        return job.id
+
+    def _run(self, job: Job, func, args, kwargs, cleanup, on_result):
+        with metrics.correlation(job.id): # Every log line and stage timing of this job carries its ID
+            job.status = "running"
+            job.started = time.time()
+            metrics.observe("job_queue_seconds", job.started - job.submitted, kind=_kind(func))
+            try:
+                result = func(*args, **kwargs)
+                job.result = on_result(result) if on_result is not None else result
+                job.progress = 1.0
+                job.status = "done"
+            except Exception as e:
+                logger.error(f"Job {job.id} ({job.name}) failed: {e}", exc_info=True)
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished = time.time()
+                if cleanup is not None:
+                    try:
+                        cleanup()
+                    except Exception as e:
+                        logger.error(f"Cleanup for job {job.id} failed: {e}")
+                metrics.observe("job_seconds", job.elapsed, kind=_kind(func))
+                metrics.inc("jobs_finished_total", kind=_kind(func), status=job.status)
+                logger.info(f"Job {job.id} ({job.name}) {job.status} after {job.elapsed:.1f}s")
+
+    def get(self, job_id: str | None) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def prune(self, max_age: float = config.JOB_RETENTION_SEC):
+        """ Forgets finished jobs older than max_age seconds. """
+        cutoff = time.time() - max_age
+        with self._lock:
+            for job_id in [j.id for j in self._jobs.values() if not j.active and j.finished < cutoff]:
+                del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            statuses = [j.status for j in self._jobs.values()]
+        return {status: statuses.count(status) for status in ("queued", "running", "done", "failed")}
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,327 @@
+# src/loudness.py
+# Native ITU-R BS.1770-4 / EBU R128 loudness engine.
+# The K-weighting filter runs as one second-order-section cascade (scipy.signal.sosfilt) with its
+# state carried across chunks, and the weighted squared signal is summed per 100 ms step. Every
+# gating window (400 ms momentary / integrated blocks, 3 s short-term) is then a difference of
+# cumulative step sums, so integrated, momentary and short-term loudness and the loudness range all
+# come from a single filtering pass. True peak is measured on a 4x polyphase-oversampled copy,
+# block by block, with the BS.1770-4 Annex 2 interpolation filter. scipy.signal is imported on first use: only loudness work pays for it.
+import os
+import time
+import functools
+import logging
+import numpy as np
+import soundfile as sf
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_GAINS = (1.0, 1.0, 1.0, 1.41, 1.41) # L, R, C, Ls, Rs; further channels count like L/R
+ABSOLUTE_GATE = -70.0 # LUFS
+RELATIVE_GATE = -10.0 # LU below the absolute-gated level (integrated loudness)
+LRA_RELATIVE_GATE = -20.0 # LU below the absolute-gated short-term level (EBU Tech 3342)
+LRA_PERCENTILES = (10, 95)
+STEP_SEC = 0.1 # Gating step: blocks overlap by 75%, momentary/short-term values update at 10 Hz
+MOMENTARY_STEPS = 4 # 400 ms
+SHORT_TERM_STEPS = 30 # 3 s
+OVERSAMPLE = 4 # True-peak oversampling factor (BS.1770-4 Annex 2)
+TAPS_PER_PHASE = 12 # Interpolation filter length per phase (48 taps in all)
+TRUE_PEAK_BLOCK = 1 << 16 # Input samples oversampled at once
+TRUE_PEAK_MARGIN = 16 # Input samples of context on each side of a block (the filter spans TAPS_PER_PHASE)
+LIMITER_ATTACK_SEC = 0.005 # The limiter's gain ramps down (and back up) over this long around each over
+TINY = np.finfo(np.float64).tiny
+
+
+def _lufs(energy):
+    """ Mean-square K-weighted energy -> LUFS (-inf for zero energy). """
+    with np.errstate(divide='ignore'):
+        return -0.691 + 10.0 * np.log10(energy)
+
+
+@functools.lru_cache(maxsize=16)
+def k_weighting(rate: int) -> np.ndarray:
+    """
+    (2, 6) second-order sections of the K-weighting filter at `rate`: the +4 dB high shelf
+    (head effects) followed by the RLB high-pass. Same biquad design as pyloudnorm, so both measure alike.
+    """
+    sections = []
+    for kind, gain_db, q, fc in (("high_shelf", 4.0, 1 / np.sqrt(2.0), 1500.0), ("high_pass", 0.0, 0.5, 38.0)):
+        a_gain = 10 ** (gain_db / 40.0)
+        w0 = 2.0 * np.pi * fc / rate
+        alpha = np.sin(w0) / (2.0 * q)
+        cos_w0 = np.cos(w0)
+        if kind == "high_shelf":
+            sqrt_alpha = 2 * np.sqrt(a_gain) * alpha
+            b = [a_gain * ((a_gain + 1) + (a_gain - 1) * cos_w0 + sqrt_alpha),
+                 -2 * a_gain * ((a_gain - 1) + (a_gain + 1) * cos_w0),
+                 a_gain * ((a_gain + 1) + (a_gain - 1) * cos_w0 - sqrt_alpha)]
+            a = [(a_gain + 1) - (a_gain - 1) * cos_w0 + sqrt_alpha,
+                 2 * ((a_gain - 1) - (a_gain + 1) * cos_w0),
+                 (a_gain + 1) - (a_gain - 1) * cos_w0 - sqrt_alpha]
+        else:
+            b = [(1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2]
+            a = [1 + alpha, -2 * cos_w0, 1 - alpha]
+        sections.append(np.concatenate([b, a]) / a[0])
+    return np.array(sections) # Cached per rate: treat as read-only (sosfilt can't take a read-only buffer)
+
+
+def _channel_gains(channels: int) -> np.ndarray:
+    return np.array([CHANNEL_GAINS[i] if i < len(CHANNEL_GAINS) else 1.0 for i in range(channels)])
+
+
+def _as_channels(y: np.ndarray) -> np.ndarray:
+    """ (samples,) or (channels, samples) audio, like librosa.load gives -> contiguous float64 (channels, samples). """
+    return np.ascontiguousarray(np.atleast_2d(np.asarray(y, dtype=np.float64)))
+
+
+def _window_energy(steps: np.ndarray, n_steps: int, step: int) -> np.ndarray:
+    """ Mean-square energy of every window of n_steps consecutive 100 ms steps (hop: one step). """
+    if len(steps) < n_steps:
+        return np.zeros(0)
+    cumulative = np.concatenate([[0.0], np.cumsum(steps)])
+    return (cumulative[n_steps:] - cumulative[:-n_steps]) / (n_steps * step)
+
+
+def gated_loudness(block_energy: np.ndarray, relative_gate: float = RELATIVE_GATE) -> float:
+    """ BS.1770 two-stage gating over per-block energies: absolute gate, then relative to the gated mean. """
+    loudness = _lufs(block_energy)
+    above_absolute = block_energy[loudness >= ABSOLUTE_GATE]
+    if not len(above_absolute):
+        return -float('inf')
+    gate = _lufs(above_absolute.mean()) + relative_gate
+    kept = block_energy[(loudness > gate) & (loudness > ABSOLUTE_GATE)]
+    return float(_lufs(kept.mean())) if len(kept) else -float('inf')
+
+
+def loudness_range(short_term_energy: np.ndarray) -> float:
+    """ EBU Tech 3342 loudness range (LU): spread between the 10th and 95th percentile of gated short-term loudness. """
+    loudness = _lufs(short_term_energy)
+    above_absolute = loudness >= ABSOLUTE_GATE
+    if not above_absolute.any():
+        return 0.0
+    gate = _lufs(short_term_energy[above_absolute].mean()) + LRA_RELATIVE_GATE
+    kept = loudness[above_absolute & (loudness > gate)]
+    if len(kept) < 2:
+        return 0.0
+    low, high = np.percentile(kept, LRA_PERCENTILES)
+    return float(high - low)
+
+
+# BS.1770-4 Annex 2 true-peak interpolation filter: 48 taps as OVERSAMPLE phases of TAPS_PER_PHASE.
+# Its passband reaches 20 kHz at 48 kHz, so tones near Nyquist are not under-read like a plain
+# quarter-band low-pass would; none of the phases lands exactly on the input samples.
+INTERPOLATION_PHASES = np.array([
+    [0.0017089843750, 0.0109863281250, -0.0196533203125, 0.0332031250000, -0.0594482421875, 0.1373291015625,
+     0.9721679687500, -0.1022949218750, 0.0476074218750, -0.0266113281250, 0.0148925781250, -0.0083007812500],
+    [-0.0291748046875, 0.0292968750000, -0.0517578125000, 0.0891113281250, -0.1665039062500, 0.4650878906250,
+     0.7797851562500, -0.2003173828125, 0.1015625000000, -0.0582275390625, 0.0330810546875, -0.0189208984375],
+    [-0.0189208984375, 0.0330810546875, -0.0582275390625, 0.1015625000000, -0.2003173828125, 0.7797851562500,
+     0.4650878906250, -0.1665039062500, 0.0891113281250, -0.0517578125000, 0.0292968750000, -0.0291748046875],
+    [-0.0083007812500, 0.0148925781250, -0.0266113281250, 0.0476074218750, -0.1022949218750, 0.9721679687500,
+     0.1373291015625, -0.0594482421875, 0.0332031250000, -0.0196533203125, 0.0109863281250, 0.0017089843750],
+])
+
+
+def _oversampled_peaks(padded: np.ndarray, margin: int = TRUE_PEAK_MARGIN) -> np.ndarray:
+    """
+    Per-sample true peak (max |x| over the samples, their OVERSAMPLE interpolated phases and all channels)
+    of padded[:, margin:-margin], a (channels, samples) chunk carrying `margin` samples of context on each side.
+    """
+    n = padded.shape[1] - 2 * margin
+    if n <= 0:
+        return np.zeros(0)
+    peaks = np.abs(padded[:, margin:margin + n]).max(axis=0)
+    start = margin + TAPS_PER_PHASE // 2 # Skip the context and the filter's group delay
+    for phase in INTERPOLATION_PHASES:
+        for channel in padded:
+            np.maximum(peaks, np.abs(np.convolve(channel, phase)[start:start + n]), out=peaks)
+    return peaks
+
+
+def true_peak_envelope(y: np.ndarray, block: int = TRUE_PEAK_BLOCK) -> np.ndarray:
+    """ Per-sample true peak of (samples,) or (channels, samples) audio, oversampled block by block. """
+    margin = TRUE_PEAK_MARGIN
+    padded = np.pad(_as_channels(y), ((0, 0), (margin, margin)))
+    n = padded.shape[1] - 2 * margin
+    envelope = np.empty(n)
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        envelope[start:stop] = _oversampled_peaks(padded[:, start:stop + 2 * margin], margin)
+    return envelope
+
+
+def true_peak(y: np.ndarray) -> float:
+    """ True peak in dBTP (4x oversampled); -inf for silence. """
+    with np.errstate(divide='ignore'):
+        return float(20 * np.log10(true_peak_envelope(y).max(initial=0.0)))
+
+
+class LoudnessMeter:
+    """
+    Incremental loudness meter. push() (frames, channels) chunks in order, then read integrated_loudness(),
+    momentary(), short_term(), loudness_range() or the whole summary(). Memory grows by one float per 100 ms
+    (plus one step of audio), so hours of audio can be measured chunk by chunk.
+    With true_peak=True every chunk is also oversampled for the true peak.
+    """
+
+    def __init__(self, rate: int, channels: int = 1, true_peak: bool = False):
+        from scipy.signal import sosfilt
+        self._sosfilt = sosfilt
+        self.rate = rate
+        self.channels = channels
+        self.step = max(1, int(round(STEP_SEC * rate)))
+        self._sos = k_weighting(rate)
+        self._zi = np.zeros((len(self._sos), channels, 2))
+        self._gains = _channel_gains(channels)
+        self._leftover = np.zeros(0) # Weighted energy of the unfinished step, per sample
+        self._steps = [] # Chunks of per-step weighted energy sums
+        self.frames = 0
+        self.peak = 0.0 # Sample peak
+        self.measure_true_peak = true_peak
+        self._true_peak = 0.0
+        self._tail = np.zeros((channels, 2 * TRUE_PEAK_MARGIN)) # Context for the next oversampled chunk
+
+    def push(self, block: np.ndarray):
+        """ Adds a (frames, channels) chunk of audio, as soundfile reads it (a 1-D chunk for mono). """
+        block = np.asarray(block, dtype=np.float64).reshape(len(block), self.channels)
+        self.push_channels(np.ascontiguousarray(block.T))
+
+    def push_channels(self, block: np.ndarray):
+        """ Adds a (channels, frames) float64 chunk. """
+        n = block.shape[1]
+        if not n:
+            return
+        self.frames += n
+        self.peak = max(self.peak, float(np.max(np.abs(block))))
+        if self.measure_true_peak:
+            for start in range(0, n, TRUE_PEAK_BLOCK):
+                chunk = np.concatenate([self._tail, block[:, start:start + TRUE_PEAK_BLOCK]], axis=1)
+                self._true_peak = max(self._true_peak, float(_oversampled_peaks(chunk).max(initial=0.0)))
+                self._tail = chunk[:, -2 * TRUE_PEAK_MARGIN:]
+        filtered, self._zi = self._sosfilt(self._sos, block, axis=1, zi=self._zi)
+        energy = np.concatenate([self._leftover, self._gains @ (filtered ** 2)])
+        n_steps = len(energy) // self.step
+        self._leftover = energy[n_steps * self.step:]
+        if n_steps:
+            self._steps.append(energy[:n_steps * self.step].reshape(n_steps, self.step).sum(axis=1))
+
+    def _step_energy(self) -> np.ndarray:
+        if len(self._steps) > 1:
+            self._steps = [np.concatenate(self._steps)]
+        return self._steps[0] if self._steps else np.zeros(0)
+
+    def integrated_loudness(self) -> float:
+        """ Gated integrated loudness (LUFS) of everything pushed so far; -inf for silence or < 400 ms. """
+        return gated_loudness(_window_energy(self._step_energy(), MOMENTARY_STEPS, self.step))
+
+    def momentary(self) -> np.ndarray:
+        """ Momentary loudness (400 ms window, LUFS) every 100 ms. """
+        return _lufs(_window_energy(self._step_energy(), MOMENTARY_STEPS, self.step))
+
+    def short_term(self) -> np.ndarray:
+        """ Short-term loudness (3 s window, LUFS) every 100 ms. """
+        return _lufs(_window_energy(self._step_energy(), SHORT_TERM_STEPS, self.step))
+
+    def loudness_range(self) -> float:
+        return loudness_range(_window_energy(self._step_energy(), SHORT_TERM_STEPS, self.step))
+
+    def true_peak(self) -> float:
+        """ True peak (dBTP) so far, including the samples still held back as oversampling context. """
+        if not self.measure_true_peak:
+            raise ValueError("LoudnessMeter was created with true_peak=False")
+        flushed = np.concatenate([self._tail, np.zeros((self.channels, TRUE_PEAK_MARGIN))], axis=1)
+        peak = max(self._true_peak, float(_oversampled_peaks(flushed).max(initial=0.0)))
+        with np.errstate(divide='ignore'):
+            return float(20 * np.log10(peak))
+
+    def summary(self) -> dict:
+        """ Every measurement as plain floats (LUFS / LU / dBTP / dBFS). """
+        momentary, short_term = self.momentary(), self.short_term()
+        with np.errstate(divide='ignore'):
+            sample_peak = float(20 * np.log10(self.peak))
+        return {
+            'duration_sec': round(self.frames / self.rate, 3),
+            'integrated_lufs': self.integrated_loudness(),
+            'momentary_max_lufs': float(momentary.max()) if len(momentary) else -float('inf'),
+            'short_term_max_lufs': float(short_term.max()) if len(short_term) else -float('inf'),
+            'loudness_range_lu': self.loudness_range(),
+            'true_peak_dbtp': self.true_peak() if self.measure_true_peak else None,
+            'sample_peak_dbfs': sample_peak,
+        }
+
+
+def measure(y: np.ndarray, rate: int, true_peak: bool = True) -> dict:
+    """ LoudnessMeter.summary() of an in-memory (samples,) or (channels, samples) buffer. """
+    audio = _as_channels(y)
+    meter = LoudnessMeter(rate, audio.shape[0], true_peak=true_peak)
+    meter.push_channels(audio)
+    return meter.summary()
+
+
+def integrated_loudness(y: np.ndarray, rate: int) -> float:
+    """ Integrated loudness (LUFS) of a (samples,) or (channels, samples) buffer. """
+    audio = _as_channels(y)
+    meter = LoudnessMeter(rate, audio.shape[0])
+    meter.push_channels(audio)
+    return meter.integrated_loudness()
+
+
+def limiter_context(rate: int, attack_sec: float = LIMITER_ATTACK_SEC) -> int:
+    """ Samples on each side of a block that limit_true_peak() needs to give the same result as on the whole signal. """
+    return 3 * max(1, int(attack_sec * rate)) + TRUE_PEAK_MARGIN
+
+
+def limit_true_peak(y: np.ndarray, rate: int, ceiling_dbtp: float = -1.0,
+                    attack_sec: float = LIMITER_ATTACK_SEC) -> np.ndarray:
+    """
+    Look-ahead limiter that holds the 4x-oversampled peak at ceiling_dbtp. The gain each over needs is
+    spread by a sliding minimum (2 x attack wide) and smoothed by a moving average (attack wide), so it
+    ramps linearly into and out of every over and is never above what a nearby peak needs.
+    Audio below the ceiling is returned untouched. Shape and dtype follow y.
+    """
+    from scipy.ndimage import minimum_filter1d, uniform_filter1d
+    y = np.asarray(y)
+    ceiling = 10 ** (ceiling_dbtp / 20.0)
+    envelope = true_peak_envelope(y)
+    if envelope.max(initial=0.0) <= ceiling:
+        return y
+    needed = np.minimum(1.0, ceiling / np.maximum(envelope, TINY))
+    length = max(1, int(attack_sec * rate)) | 1 # Odd, so the average is centred
+    gain = uniform_filter1d(minimum_filter1d(needed, 2 * length - 1, mode='nearest'), length, mode='nearest')
+    logger.info(f"True-peak limiter: {np.count_nonzero(needed < 1.0)} samples over {ceiling_dbtp} dBTP, "
+                f"max reduction {-20 * np.log10(gain.min()):.2f} dB")
+    return (y * gain).astype(y.dtype, copy=False)
+
+
+def analyze_file(input_file: str, block_size: int = 1 << 16) -> dict:
+    """
+    Measures one file without writing any audio: soundfile-readable formats are read block by block,
+    anything else (m4a, ...) through the ingest cache. Never raises; failures are recorded in the dict.
+    """
+    report = {'input': input_file, 'success': True, 'error': None}
+    started = time.perf_counter()
+    try:
+        with metrics.timer("loudness_analyze") as timing:
+            timing.bytes = os.path.getsize(input_file)
+            try:
+                info = sf.info(input_file)
+            except Exception:
+                info = None
+            if info is not None:
+                meter = LoudnessMeter(info.samplerate, info.channels, true_peak=True)
+                for block in sf.blocks(input_file, blocksize=block_size, dtype='float32', always_2d=True):
+                    meter.push(block)
+            else:
+                from src import ingest
+                y, sr = ingest.load_audio(input_file, mono=False) # Memory-mapped; read block by block below
+                y = np.atleast_2d(y)
+                meter = LoudnessMeter(sr, y.shape[0], true_peak=True)
+                for start in range(0, y.shape[1], block_size):
+                    meter.push_channels(np.array(y[:, start:start + block_size], dtype=np.float64))
+            report.update(meter.summary(), sample_rate=meter.rate, channels=meter.channels)
+            timing.audio_sec = report['duration_sec']
+    except Exception as e:
+        logger.error(f"Loudness analysis failed for {input_file}: {e}")
+        report.update(success=False, error=f"{type(e).__name__}: {e}")
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
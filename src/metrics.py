@@ -0,0 +1,322 @@
+# src/metrics.py
+# Lightweight in-process instrumentation: counters and histograms with labels, a timer that records
+# duration / bytes / real-time factor / errors per stage, Prometheus text export (file and/or HTTP),
+# and a per-job correlation ID that is attached to every log record.
+# With config.METRICS_ENABLED off, timed() returns the function unchanged and timer() a shared no-op,
+# so instrumented code pays one attribute lookup.
+# Metrics live in the process that records them: work done inside Demucs/batch worker processes is
+# timed around the call in the parent.
+import os
+import json
+import time
+import bisect
+import logging
+import functools
+import threading
+import contextvars
+import contextlib
+from src import config
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "vocalizer_"
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+RTF_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5)
+
+_correlation_id = contextvars.ContextVar("correlation_id", default=None)
+
+
+# --- Registry ---
+
+class Registry:
+    """ Thread-safe store of labelled counters and histograms. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {} # (name, labels) -> value
+        self._histograms = {} # (name, labels) -> [bucket counts..., sum, count]
+        self._buckets = {} # name -> bucket bounds
+        self._help = {}
+
+    def inc(self, name: str, value: float = 1.0, help: str = "", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+            self._help.setdefault(name, help)
+
+    def observe(self, name: str, value: float, buckets=SECONDS_BUCKETS, help: str = "", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            bounds = self._buckets.setdefault(name, buckets)
+            state = self._histograms.get(key)
+            if state is None:
+                state = self._histograms[key] = [0] * (len(bounds) + 1) + [0.0, 0]
+            state[bisect.bisect_left(bounds, value)] += 1 # Last slot is +Inf
+            state[-2] += value
+            state[-1] += 1
+            self._help.setdefault(name, help)
+
+    def snapshot(self) -> dict:
+        """ Plain-dict copy: {'counters': {...}, 'histograms': {...}} keyed by 'name{labels}'. """
+        with self._lock:
+            counters = {_series(name, labels): value for (name, labels), value in self._counters.items()}
+            histograms = {_series(name, labels): {'count': state[-1], 'sum': state[-2]}
+                          for (name, labels), state in self._histograms.items()}
+        return {'counters': counters, 'histograms': histograms}
+
+    def render(self) -> str:
+        """ Prometheus text exposition format (cumulative buckets). """
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._counters}):
+                lines += [f"# HELP {PREFIX}{name} {self._help.get(name) or name}", f"# TYPE {PREFIX}{name} counter"]
+                lines += [f"{PREFIX}{_series(n, labels)} {value:g}" for (n, labels), value in sorted(self._counters.items()) if n == name]
+            for name in sorted({name for name, _ in self._histograms}):
+                bounds = self._buckets[name]
+                lines += [f"# HELP {PREFIX}{name} {self._help.get(name) or name}", f"# TYPE {PREFIX}{name} histogram"]
+                for (n, labels), state in sorted(self._histograms.items()):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(bounds) + ["+Inf"], state[:-2]):
+                        cumulative += count
+                        lines.append(f"{PREFIX}{_series(name + '_bucket', labels + (('le', f'{bound:g}' if bound != '+Inf' else bound),))} {cumulative}")
+                    lines.append(f"{PREFIX}{_series(name + '_sum', labels)} {state[-2]:g}")
+                    lines.append(f"{PREFIX}{_series(name + '_count', labels)} {state[-1]}")
+        lines += _process_metrics()
+        return "\n".join(lines) + "\n"
+
+
+def _series(name: str, labels: tuple) -> str:
+    if not labels:
+        return name
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return name + "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+def _process_metrics() -> list[str]:
+    """ CPU time and resident memory of this process, read at export time. """
+    times = os.times()
+    lines = [f"# TYPE {PREFIX}process_cpu_seconds_total counter",
+             f"{PREFIX}process_cpu_seconds_total {times.user + times.system:g}"]
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            status = dict(line.split(":", 1) for line in f if ":" in line)
+        for field, metric in (("VmRSS", "process_resident_memory_bytes"), ("VmHWM", "process_peak_resident_memory_bytes")):
+            lines += [f"# TYPE {PREFIX}{metric} gauge", f"{PREFIX}{metric} {int(status[field].split()[0]) * 1024}"]
+    except (OSError, KeyError, ValueError):
+        pass
+    return lines
+
+
+registry = Registry()
+
+
+def inc(name: str, value: float = 1.0, **labels):
+    if config.METRICS_ENABLED:
+        registry.inc(name, value, **labels)
+
+
+def observe(name: str, value: float, buckets=SECONDS_BUCKETS, **labels):
+    if config.METRICS_ENABLED:
+        registry.observe(name, value, buckets, **labels)
+
+
+# --- Timing ---
+
+class Timer:
+    """
+    Times one stage run. Set `bytes` and/or `audio_sec` inside the block to also record throughput
+    and real-time factor; an exception (or mark_failed()) counts as an error for the stage.
+    """
+
+    def __init__(self, stage: str, labels: dict):
+        self.stage = stage
+        self.labels = labels
+        self.bytes = None
+        self.audio_sec = None
+        self.failed = False
+        self.seconds = None
+
+    def mark_failed(self):
+        self.failed = True
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self._started
+        labels = {'stage': self.stage, **self.labels}
+        registry.observe("stage_seconds", self.seconds, help="Wall time per stage run", **labels)
+        registry.inc("stage_runs_total", help="Stage runs", **labels)
+        if exc_type is not None or self.failed:
+            registry.inc("stage_errors_total", help="Stage runs that raised or reported failure", **labels)
+        if self.bytes:
+            registry.inc("stage_bytes_total", self.bytes, help="Bytes read or written by stage runs", **labels)
+        fields = {'stage': self.stage, 'seconds': round(self.seconds, 4), 'error': exc_type is not None or self.failed}
+        if self.audio_sec:
+            rtf = self.seconds / self.audio_sec
+            registry.observe("stage_rtf", rtf, RTF_BUCKETS, help="Real-time factor (wall / audio duration)", **labels)
+            registry.inc("stage_audio_seconds_total", self.audio_sec, help="Audio seconds processed", **labels)
+            fields['rtf'] = round(rtf, 5)
+        if self.bytes:
+            fields['bytes'] = int(self.bytes)
+        logger.debug(f"{self.stage} took {self.seconds:.3f}s", extra={'metrics': fields})
+        return False
+
+
+class _NullTimer:
+    """ Stand-in when metrics are disabled: accepts the same attribute writes, records nothing. """
+    bytes = audio_sec = seconds = None
+    failed = False
+
+    def mark_failed(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(stage: str, **labels):
+    """ Context manager timing a block as `stage` (see Timer). """
+    return Timer(stage, labels) if config.METRICS_ENABLED else _NULL_TIMER
+
+
+def timed(stage: str, **labels):
+    """
+    Decorator form of timer(). Result dicts with success=False count as errors.
+    With metrics disabled at import time, the function is returned undecorated.
+    """
+    def decorator(func):
+        if not config.METRICS_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Timer(stage, labels) as t:
+                result = func(*args, **kwargs)
+                if isinstance(result, dict) and result.get('success') is False:
+                    t.mark_failed()
+                return result
+        return wrapper
+    return decorator
+
+
+# --- Correlation IDs and structured logs ---
+
+@contextlib.contextmanager
+def correlation(correlation_id: str):
+    """ Tags every log record (and nothing else) emitted inside the block with correlation_id. """
+    token = _correlation_id.set(correlation_id)
+    try:
+        yield correlation_id
+    finally:
+        _correlation_id.reset(token)
+
+
+def current_correlation_id() -> str | None:
+    return _correlation_id.get()
+
+
+class CorrelationFilter(logging.Filter):
+    """ Adds record.correlation_id (None outside a job). """
+
+    def filter(self, record):
+        record.correlation_id = _correlation_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """ One JSON object per line: time, level, logger, message, correlation_id and any 'metrics' fields. """
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'correlation_id': getattr(record, 'correlation_id', None) or _correlation_id.get(),
+        }
+        if getattr(record, 'metrics', None):
+            entry.update(record.metrics)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    """ Attaches the correlation filter to the root handlers and, with config.LOG_JSON, switches them to JSON. """
+    root = logging.getLogger()
+    for handler in root.handlers:
+        if not any(isinstance(f, CorrelationFilter) for f in handler.filters):
+            handler.addFilter(CorrelationFilter())
+        if config.LOG_JSON:
+            handler.setFormatter(JsonFormatter())
+
+
+# --- Export ---
+
+def write_prometheus(path: str):
+    """ Writes the current metrics to path atomically (for node_exporter's textfile collector). """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    part_path = f"{path}.{os.getpid()}.part"
+    with open(part_path, "w", encoding="utf-8") as f:
+        f.write(registry.render())
+    os.replace(part_path, path)
+
+
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+
+def start_exporters():
+    """
+    Starts the configured exporters once per process: an HTTP /metrics endpoint on config.METRICS_PORT
+    and/or a periodic dump to config.METRICS_FILE. No-op when metrics are disabled.
+    """
+    global _exporters_started
+    with _exporters_lock:
+        if _exporters_started or not config.METRICS_ENABLED:
+            return
+        _exporters_started = True
+    if config.METRICS_PORT:
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer # Only when serving
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # Scrapes would otherwise flood the app log
+
+        server = ThreadingHTTPServer(("0.0.0.0", config.METRICS_PORT), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="vocalizer-metrics-http", daemon=True).start()
+        logger.info(f"Serving metrics on :{config.METRICS_PORT}/metrics")
+    if config.METRICS_FILE:
+        def flush_loop():
+            while True:
+                try:
+                    write_prometheus(config.METRICS_FILE)
+                except OSError as e:
+                    logger.warning(f"Could not write metrics file: {e}")
+                time.sleep(config.METRICS_FLUSH_SEC)
+        threading.Thread(target=flush_loop, name="vocalizer-metrics-file", daemon=True).start()
+        logger.info(f"Writing metrics to {config.METRICS_FILE} every {config.METRICS_FLUSH_SEC:.0f}s")
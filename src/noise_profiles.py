@@ -0,0 +1,293 @@
+# src/noise_profiles.py
+# Reusable noise profiles for spectral-subtraction denoising.
+#
+# A profile is the per-bin median magnitude of noise-only STFT frames, stored with the STFT settings it
+# was measured with as a small named .npz in config.NOISE_PROFILE_DIR. It is estimated once, either from
+# a designated noise clip (every frame) or from the quietest frames across a set of files (e.g. all takes
+# of a session), in a single streaming pass. Any denoise call can then use it instead of re-estimating
+# the noise from each file's first half second.
+#
+#     python -m src.noise_profiles build <name> <file or directory> [...] [--clip] [--quietest 0.1]
+#     python -m src.noise_profiles list
+#     python -m src.noise_profiles show <name>
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from src import config, ingest, metrics, silence, spectral, storage
+
+logger = logging.getLogger(__name__)
+
+NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".m4a", ".ogg", ".aac", ".wma", ".opus", ".webm")
+
+
+def profile_path(name: str) -> str:
+    """ Path of the stored profile `name`. Names are plain file names (letters, digits, '_', '-', '.'). """
+    if not NAME_PATTERN.match(name or ""):
+        raise ValueError(f"Invalid noise profile name {name!r}")
+    return os.path.join(config.NOISE_PROFILE_DIR, f"{name}.npz")
+
+
+class NoiseProfile:
+    """ Per-bin noise magnitude (n_fft // 2 + 1 values) plus the STFT settings and sample rate it belongs to. """
+
+    def __init__(self, magnitude: np.ndarray, sample_rate: int, n_fft: int, hop_length: int,
+                 name: str | None = None, meta: dict | None = None):
+        self.magnitude = np.asarray(magnitude, dtype=np.float32)
+        self.sample_rate = int(sample_rate)
+        self.n_fft = int(n_fft)
+        self.hop_length = int(hop_length)
+        self.name = name
+        self.meta = meta or {}
+        if len(self.magnitude) != self.n_fft // 2 + 1:
+            raise ValueError(f"Noise profile has {len(self.magnitude)} bins; n_fft {self.n_fft} needs {self.n_fft // 2 + 1}")
+
+    @property
+    def digest(self) -> str:
+        """ Content hash; result cache keys use it so re-estimating a profile under the same name invalidates them. """
+        h = hashlib.sha256(self.magnitude.tobytes())
+        h.update(f"{self.sample_rate}:{self.n_fft}:{self.hop_length}".encode())
+        return h.hexdigest()[:16]
+
+    def threshold(self, noise_floor: float = config.DEFAULT_NOISE_FLOOR) -> np.ndarray:
+        """ Per-bin subtraction threshold, like the per-file estimate in processing._noise_threshold. """
+        return self.magnitude * np.float32(1 + noise_floor)
+
+    def check_rate(self, sr: int):
+        """ Raises ValueError if audio at sr can't use this profile (its bins would be other frequencies). """
+        if sr != self.sample_rate:
+            raise ValueError(f"Noise profile '{self.name or '?'}' was measured at {self.sample_rate} Hz, "
+                             f"but the input is {sr} Hz")
+
+    def save(self, path: str) -> str:
+        """ Writes the profile as a compressed .npz (atomically) and returns path. """
+        with storage.atomic_path(path) as part_path, open(part_path, "wb") as f:
+            np.savez_compressed(f, magnitude=self.magnitude, sample_rate=self.sample_rate, n_fft=self.n_fft,
+                                hop_length=self.hop_length, meta=json.dumps(self.meta))
+        return path
+
+    @classmethod
+    def load(cls, path: str, name: str | None = None) -> "NoiseProfile":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['magnitude'], int(data['sample_rate']), int(data['n_fft']), int(data['hop_length']),
+                       name=name or os.path.splitext(os.path.basename(path))[0], meta=json.loads(str(data['meta'])))
+
+    def summary(self) -> dict:
+        return {'name': self.name, 'sample_rate': self.sample_rate, 'n_fft': self.n_fft, 'hop_length': self.hop_length,
+                'digest': self.digest, **self.meta}
+
+
+def load(name_or_path: str) -> NoiseProfile:
+    """ A stored profile by name, or any .npz profile by path. """
+    if name_or_path.endswith(".npz"):
+        return NoiseProfile.load(name_or_path)
+    path = profile_path(name_or_path)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Noise profile '{name_or_path}' not found in {config.NOISE_PROFILE_DIR}")
+    return NoiseProfile.load(path, name_or_path)
+
+
+def resolve(profile: "NoiseProfile | str | None") -> NoiseProfile | None:
+    """ Turns what the denoise functions accept (a profile, a name / .npz path, or None) into a NoiseProfile or None. """
+    if profile is None or isinstance(profile, NoiseProfile):
+        return profile
+    return load(profile)
+
+
+def fingerprint(profile: "NoiseProfile | str | None") -> str | None:
+    """ Result cache key component of a noise_profile argument: the profile's content hash. """
+    profile = resolve(profile)
+    return profile.digest if profile is not None else None
+
+
+def list_profiles() -> list[dict]:
+    """ Summaries of every stored profile. """
+    if not os.path.isdir(config.NOISE_PROFILE_DIR):
+        return []
+    profiles = []
+    for file_name in sorted(os.listdir(config.NOISE_PROFILE_DIR)):
+        if file_name.endswith(".npz") and not file_name.startswith(storage.PART_PREFIX):
+            try:
+                profiles.append(load(file_name[:-4]).summary())
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Skipping unreadable noise profile {file_name}: {e}")
+    return profiles
+
+
+class NoiseProfileEstimator:
+    """
+    Single-pass noise estimate over one or more signals.
+
+    Frames are taken from each signal in order (no centre padding, so no frame is part zeros) and
+    digitally silent frames are ignored. At most max_frames of the quietest frames (by mean power) are
+    kept while streaming, so memory is bounded however much audio goes in; max_frames=None keeps every
+    frame (a noise clip, where all of them are used, ~4 kB per frame at n_fft 2048). result() takes the quietest
+    `quietest` fraction of all counted frames (1.0 = every frame, for a pure noise clip) and returns the
+    per-bin median of their magnitudes, the same statistic the per-file estimate uses.
+    """
+
+    def __init__(self, sample_rate: int, n_fft: int = 2048, hop_length: int = 512,
+                 quietest: float = config.NOISE_PROFILE_QUIETEST, max_frames: int | None = config.NOISE_PROFILE_MAX_FRAMES):
+        if not 0.0 < quietest <= 1.0:
+            raise ValueError(f"quietest must be in (0, 1], got {quietest}")
+        self.sample_rate = sample_rate
+        self.engine = spectral.get_engine(n_fft, hop_length)
+        self.n_fft, self.hop_length = n_fft, self.engine.hop_length
+        self.quietest = quietest
+        self.max_frames = max(1, max_frames) if max_frames is not None else None
+        self.counted = 0 # Non-silent frames seen
+        self.sources = []
+        self._magnitudes, self._powers = [], [] # Candidate quietest frames, compacted to max_frames now and then
+        self._buffered = 0
+        self._cutoff = np.inf # Power of the loudest kept frame once max_frames are kept; louder frames can't make it
+        self._pending = np.empty(0, dtype=np.float32)
+        self._framed = 0 # Frames taken from the current signal
+
+    def _add_frames(self, frames: np.ndarray):
+        live = np.max(np.abs(frames), axis=1) >= silence.SILENCE_AMPLITUDE
+        windowed = frames[live] * self.engine.window
+        power = np.mean(np.square(windowed), axis=1) # Ranks frames like their spectral power (Parseval)
+        self.counted += len(windowed)
+        candidates = power < self._cutoff
+        if not candidates.any():
+            return
+        self._magnitudes.append(np.abs(self.engine.rfft(windowed[candidates])).astype(np.float32, copy=False))
+        self._powers.append(power[candidates])
+        self._buffered += int(candidates.sum())
+        if self.max_frames is not None and self._buffered > 2 * self.max_frames:
+            self._compact()
+
+    def _compact(self):
+        """ Keeps only the max_frames quietest candidates. """
+        magnitudes, powers = np.concatenate(self._magnitudes), np.concatenate(self._powers)
+        if self.max_frames is not None and len(powers) > self.max_frames:
+            keep = np.argpartition(powers, self.max_frames - 1)[:self.max_frames]
+            magnitudes, powers = magnitudes[keep], powers[keep]
+            self._cutoff = float(powers.max())
+        self._magnitudes, self._powers, self._buffered = [magnitudes], [powers], len(powers)
+
+    def push(self, samples: np.ndarray):
+        """ Feeds the next mono samples of the current signal. """
+        self._pending = np.concatenate([self._pending, np.asarray(samples, dtype=np.float32)])
+        if len(self._pending) < self.n_fft:
+            return
+        n_frames = 1 + (len(self._pending) - self.n_fft) // self.hop_length
+        self._add_frames(sliding_window_view(self._pending, self.n_fft)[::self.hop_length][:n_frames])
+        self._framed += n_frames
+        self._pending = self._pending[n_frames * self.hop_length:]
+
+    def end_signal(self, label: str | None = None):
+        """ Closes the current signal; the next push() starts a new one. """
+        if not self._framed and len(self._pending): # Shorter than one frame: use it zero-padded
+            self._add_frames(np.pad(self._pending, (0, self.n_fft - len(self._pending)))[None])
+        self._pending = np.empty(0, dtype=np.float32)
+        self._framed = 0
+        if label:
+            self.sources.append(label)
+
+    def add_file(self, path: str, block_size: int = 1 << 16):
+        """ Streams one file through the estimator (mono, from its memory-mapped ingest entry). """
+        y, sr = ingest.load_audio(path, mono=True)
+        if sr != self.sample_rate:
+            raise ValueError(f"{os.path.basename(path)} is {sr} Hz; this profile is being estimated at {self.sample_rate} Hz")
+        for start in range(0, len(y), block_size):
+            self.push(y[start:start + block_size])
+        self.end_signal(os.path.basename(path))
+
+    def result(self, name: str | None = None) -> NoiseProfile:
+        if not self.counted:
+            raise ValueError("No non-silent audio to estimate a noise profile from")
+        self._compact()
+        wanted = max(1, int(np.ceil(self.quietest * self.counted)))
+        take = min(wanted, self._buffered)
+        if take < wanted:
+            logger.warning(f"Using the {take} quietest frames (NOISE_PROFILE_MAX_FRAMES) instead of "
+                           f"{self.quietest:.0%} of {self.counted}")
+        chosen = self._magnitudes[0][np.argsort(self._powers[0])[:take]]
+        meta = {'frames': int(take), 'frames_seen': int(self.counted), 'quietest': self.quietest,
+                'sources': self.sources[:50], 'source_count': len(self.sources), 'created': time.time()}
+        return NoiseProfile(np.median(chosen, axis=0), self.sample_rate, self.n_fft, self.hop_length, name, meta)
+
+
+def _expand_inputs(inputs: list[str]) -> list[str]:
+    """ Files as given, and the audio files inside any directory, in name order. """
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            files += [os.path.join(item, f) for f in sorted(os.listdir(item))
+                      if os.path.splitext(f)[1].lower() in AUDIO_EXTENSIONS]
+        else:
+            files.append(item)
+    return files
+
+
+def estimate(inputs: list[str], name: str | None = None, quietest: float = config.NOISE_PROFILE_QUIETEST,
+             n_fft: int = 2048, hop_length: int = 512) -> NoiseProfile:
+    """
+    Estimates a profile from files (directories are expanded) in one streaming pass, and stores it
+    under `name` if one is given. The first file sets the sample rate; all others must match it.
+    Pass quietest=1.0 when the input is a pure noise clip: every one of its frames is then used, however
+    long it is (other fractions keep at most config.NOISE_PROFILE_MAX_FRAMES frames).
+    """
+    files = _expand_inputs(inputs)
+    if not files:
+        raise ValueError("No input files to estimate a noise profile from")
+    with metrics.timer("noise_profile_estimate") as timing:
+        max_frames = None if quietest >= 1.0 else config.NOISE_PROFILE_MAX_FRAMES
+        estimator = NoiseProfileEstimator(ingest.get_metadata(files[0])['sample_rate'], n_fft, hop_length, quietest,
+                                          max_frames)
+        for path in files:
+            estimator.add_file(path)
+        timing.audio_sec = estimator.counted * estimator.hop_length / estimator.sample_rate
+        profile = estimator.result(name)
+    if name:
+        os.makedirs(config.NOISE_PROFILE_DIR, exist_ok=True)
+        profile.save(profile_path(name))
+        logger.info(f"Saved noise profile '{name}' ({profile.meta['frames']} of {profile.meta['frames_seen']} frames "
+                    f"from {len(files)} file(s)) to {profile_path(name)}")
+    return profile
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build and inspect stored noise profiles.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Estimate a profile and store it under a name")
+    build.add_argument("name")
+    build.add_argument("inputs", nargs="+", help="Audio files and/or directories")
+    build.add_argument("--clip", action="store_true", help="The inputs are pure noise: use all of their frames (no length limit)")
+    build.add_argument("--quietest", type=float, default=config.NOISE_PROFILE_QUIETEST,
+                       help="Fraction of the quietest frames to use, at most NOISE_PROFILE_MAX_FRAMES "
+                            "frames (ignored with --clip)")
+    build.add_argument("--n-fft", type=int, default=2048)
+    build.add_argument("--hop-length", type=int, default=512)
+
+    commands.add_parser("list", help="Show all stored profiles")
+    show = commands.add_parser("show", help="Show one profile")
+    show.add_argument("name")
+
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "build":
+            profile = estimate(args.inputs, args.name, 1.0 if args.clip else args.quietest, args.n_fft, args.hop_length)
+            print(json.dumps(profile.summary(), indent=2))
+        elif args.command == "list":
+            print(json.dumps(list_profiles(), indent=2))
+        else:
+            print(json.dumps(load(args.name).summary(), indent=2))
+    except (OSError, ValueError) as e:
+        logger.error(str(e))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main())
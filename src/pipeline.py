@@ -0,0 +1,146 @@
+# src/pipeline.py
+# Fused download -> separate -> denoise -> normalize chain.
+# The source is decoded once (through the ingest cache); stages hand float32 buffers and the
+# sample rate to each other and only the final result is encoded to disk.
+import os
+import time
+import logging
+import numpy as np
+import soundfile as sf
+from src import config, ingest, metrics, processing, silence, storage
+from src.cache import source_label, source_name
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_STAGES = ("download", "separate", "denoise", "normalize")
+
+
+def _to_mono(y: np.ndarray) -> np.ndarray:
+    """ (channels, samples) -> (samples,), averaging channels like librosa.to_mono. """
+    return y.mean(axis=0).astype(np.float32) if y.ndim > 1 else y
+
+
+def run_pipeline(source: ingest.AudioSource,
+                 steps=PIPELINE_STAGES,
+                 target_lufs: float = config.DEFAULT_TARGET_LUFS,
+                 model: str | None = None,
+                 profile: str = config.DEMUCS_PROFILE,
+                 output_file: str | None = None,
+                 progress_callback=None,
+                 skip_silence: bool = config.SKIP_SILENCE) -> dict:
+    """
+    Runs the selected stages over one source.
+
+    Args:
+        source: A YouTube URL when 'download' is in steps, otherwise a local audio file path
+                or any other ingest.AudioSource (upload bytes/file object, (ndarray, sr)).
+        steps: Subset of PIPELINE_STAGES; they always run in pipeline order.
+        target_lufs: Loudness target for the 'normalize' stage.
+        model: Demucs model for the 'separate' stage (None = the profile's model).
+        profile: Demucs speed/quality profile (config.DEMUCS_PROFILES) or 'auto'.
+        output_file: Where to write the final WAV (defaults to config.PROCESSED_OUTPUT_DIR).
+        progress_callback: Optional callable(fraction, stage) invoked as each stage starts.
+        skip_silence: Separate and denoise only the active regions (src/silence.py); skipped audio is zeroed.
+
+    Returns:
+        A dictionary: {'success': bool, 'message': str, 'output_path': str | None,
+                       'timings': {stage: seconds}, 'sample_rate': int | None, 'silence': {stage: report}}
+    """
+    timings = {}
+    result = {'success': False, 'message': '', 'output_path': None, 'timings': timings, 'sample_rate': None,
+              'silence': {}}
+    started = time.perf_counter()
+
+    planned = [s for s in PIPELINE_STAGES if s in steps] + ["encode"]
+
+    def report(stage: str):
+        if progress_callback is not None:
+            progress_callback(planned.index(stage) / len(planned), stage)
+
+    def finish(success: bool, message: str) -> dict:
+        timings['total'] = round(time.perf_counter() - started, 3)
+        result.update(success=success, message=message)
+        for stage, seconds in timings.items():
+            metrics.observe("pipeline_stage_seconds", seconds, step=stage)
+        metrics.inc("pipelines_total", status="ok" if success else "failed")
+        if not success:
+            logger.error(f"Pipeline failed: {message}")
+        return result
+
+    unknown = [s for s in steps if s not in PIPELINE_STAGES]
+    if unknown:
+        return finish(False, f"Unknown pipeline stage(s): {', '.join(unknown)}")
+
+    try:
+        if "download" in steps:
+            # Stream bestaudio through a single ffmpeg decode at the Demucs rate: no m4a transcode, no re-decode
+            report("download")
+            from src import youtube # yt-dlp is only imported by pipelines that download
+            t0 = time.perf_counter()
+            download = youtube.fetch_audio_pcm(source)
+            timings['download'] = round(time.perf_counter() - t0, 3)
+            if not download['success']:
+                return finish(False, f"Download failed: {download['message']}")
+            y, sr = download['audio'], download['sample_rate']
+            input_path = download['video_id'] or "youtube"
+        else:
+            if ingest.is_path(source) and not os.path.exists(source):
+                return finish(False, f"Input file not found: {source}")
+            # Decode once, keeping channels so Demucs gets the stereo image
+            t0 = time.perf_counter()
+            y, sr = ingest.load_source(source, mono=False)
+            timings['decode'] = round(time.perf_counter() - t0, 3)
+            input_path = source_name(source) or "upload"
+
+        if "separate" in steps:
+            report("separate")
+            t0 = time.perf_counter()
+            part = silence.partition_for_skipping(y, sr) if skip_silence else None
+            separation = processing.separate_audio_array(y if part is None else part.compact(y), sr, model, "vocals",
+                                                         profile=profile)
+            if not separation['success']:
+                return finish(False, f"Separation failed: {separation['message']}")
+            vocals, stem_sr = separation['stems']['vocals'], separation['sample_rate']
+            if part is not None: # Back onto the full timeline, silent where nothing was separated
+                ratio = stem_sr / sr
+                full = np.zeros((vocals.shape[0], int(round(part.total * ratio))), dtype=np.float32)
+                vocals = part.expand(vocals, full, ratio)
+                result['silence']['separate'] = silence.record(part, "demucs")
+            y, sr = vocals, stem_sr
+            timings['separate'] = round(time.perf_counter() - t0, 3)
+
+        if "denoise" in steps:
+            report("denoise")
+            t0 = time.perf_counter()
+            mono = _to_mono(y)
+            part = silence.partition_for_skipping(mono, sr) if skip_silence else None
+            y, _ = processing.reduce_noise_array(mono, sr, partition=part, silence_fill="zero")
+            if part is not None and y is not mono: # A silent noise profile returns the input untouched
+                result['silence']['denoise'] = silence.record(part, "noise_reduction")
+            timings['denoise'] = round(time.perf_counter() - t0, 3)
+
+        if "normalize" in steps:
+            report("normalize")
+            t0 = time.perf_counter()
+            y, _ = processing.normalize_loudness_array(y, sr, target_lufs)
+            timings['normalize'] = round(time.perf_counter() - t0, 3)
+
+        # --- Encode the final artifact only ---
+        report("encode")
+        t0 = time.perf_counter()
+        if output_file is None:
+            base_name = os.path.splitext(os.path.basename(input_path))[0]
+            output_file = os.path.join(config.PROCESSED_OUTPUT_DIR, f"{base_name}_pipeline.wav")
+        with metrics.timer("encode", format="wav", target="file") as timing, \
+                storage.atomic_path(output_file) as part_file:
+            sf.write(part_file, y.T if y.ndim > 1 else y, sr)
+            timing.bytes = os.path.getsize(part_file)
+        timings['encode'] = round(time.perf_counter() - t0, 3)
+
+        result.update(output_path=output_file, sample_rate=sr)
+        logger.info(f"Pipeline complete for {source_label(source)}: {timings}")
+        return finish(True, "Pipeline complete!")
+
+    except Exception as e:
+        logger.error(f"An unexpected error occurred in the pipeline: {e}", exc_info=True)
+        return finish(False, f"Pipeline error: {e}")
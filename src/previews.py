@@ -0,0 +1,124 @@
+# src/previews.py
+# Compressed previews for the in-app players. Each output is encoded once to a small MP3/Opus/FLAC
+# file (content-addressed, so a re-run of the same result reuses it) and the players stream that
+# instead of the full WAV; full-quality files stay on disk until someone actually downloads them.
+import os
+import hashlib
+import logging
+import threading
+import numpy as np
+import soundfile as sf
+from src import config, metrics, storage
+from src.cache import hash_file, register_digest, source_name
+
+logger = logging.getLogger(__name__)
+
+# format name -> (soundfile format, subtype, extension, MIME type)
+PREVIEW_FORMATS = {
+    'mp3': ('MP3', 'MPEG_LAYER_III', '.mp3', 'audio/mpeg'),
+    'opus': ('OGG', 'OPUS', '.ogg', 'audio/ogg'),
+    'flac': ('FLAC', 'PCM_16', '.flac', 'audio/flac'),
+}
+OPUS_SAMPLE_RATE = 48000 # libopus only runs at 8/12/16/24/48 kHz
+
+# Already compressed sources are played as they are
+PASSTHROUGH_MIME = {'.m4a': 'audio/mp4', '.mp3': 'audio/mpeg', '.ogg': 'audio/ogg', '.opus': 'audio/ogg',
+                    '.webm': 'audio/webm', '.flac': 'audio/flac'}
+
+_preview_lock = threading.Lock()
+
+
+def _encode(input_file: str, output_file: str, fmt: str):
+    """ Encodes input_file into output_file block by block (Opus resamples the whole signal once). """
+    sf_format, subtype, _, _ = PREVIEW_FORMATS[fmt]
+    info = sf.info(input_file)
+    kwargs = {} if fmt == 'flac' else {'compression_level': config.PREVIEW_COMPRESSION_LEVEL}
+    if fmt == 'opus' and info.samplerate != OPUS_SAMPLE_RATE:
+        from scipy.signal import resample_poly
+        y, sr = sf.read(input_file, dtype='float32', always_2d=True)
+        divisor = np.gcd(OPUS_SAMPLE_RATE, sr)
+        y = resample_poly(y, OPUS_SAMPLE_RATE // divisor, sr // divisor, axis=0).astype(np.float32)
+        sf.write(output_file, np.clip(y, -1.0, 1.0), OPUS_SAMPLE_RATE, format=sf_format, subtype=subtype, **kwargs)
+        return
+    with sf.SoundFile(output_file, 'w', samplerate=info.samplerate, channels=info.channels,
+                      format=sf_format, subtype=subtype, **kwargs) as out:
+        for block in sf.blocks(input_file, blocksize=1 << 16, dtype='float32', always_2d=True):
+            out.write(block)
+
+
+def get_preview(file_path: str, fmt: str = config.PREVIEW_FORMAT) -> tuple[str, str]:
+    """
+    Returns (path, MIME type) of a compressed preview of file_path, encoding it on first use.
+    Falls back to the original file if it is already compressed or can't be encoded.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in PASSTHROUGH_MIME:
+        return file_path, PASSTHROUGH_MIME[extension]
+    if fmt not in PREVIEW_FORMATS:
+        logger.warning(f"Unknown preview format '{fmt}', using mp3.")
+        fmt = 'mp3'
+    preview_path = os.path.join(config.PREVIEW_DIR, hash_file(file_path) + PREVIEW_FORMATS[fmt][2])
+    mime = PREVIEW_FORMATS[fmt][3]
+    if os.path.exists(preview_path):
+        os.utime(preview_path) # Touch for LRU
+        return preview_path, mime
+
+    os.makedirs(config.PREVIEW_DIR, exist_ok=True)
+    part_path = f"{preview_path}.{threading.get_ident()}.part"
+    try:
+        with metrics.timer("encode", format=fmt, target="preview") as timing:
+            _encode(file_path, part_path, fmt)
+            timing.bytes = os.path.getsize(part_path)
+        os.replace(part_path, preview_path)
+    except Exception as e:
+        logger.warning(f"Could not encode {fmt} preview for {file_path}, playing the original: {e}")
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        return file_path, 'audio/wav'
+    logger.info(f"Encoded preview {os.path.basename(preview_path)} ({os.path.getsize(preview_path)} bytes) "
+                f"for {os.path.basename(file_path)} ({os.path.getsize(file_path)} bytes)")
+    evict()
+    return preview_path, mime
+
+
+def evict(max_bytes: int = config.PREVIEW_MAX_BYTES):
+    """ Drops least-recently-played previews until the preview dir fits in max_bytes. """
+    if not os.path.isdir(config.PREVIEW_DIR):
+        return
+    with _preview_lock:
+        entries = []
+        for entry in os.scandir(config.PREVIEW_DIR):
+            if entry.is_file() and not entry.name.endswith(".part"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError as e:
+                logger.warning(f"Could not evict preview {path}: {e}")
+
+
+def spill_audio_bytes(result: dict, suffix: str = "processed", source=None) -> dict:
+    """
+    Moves a result's in-memory 'audio_bytes' WAV to config.PROCESSED_OUTPUT_DIR and replaces it with
+    'output_path', so finished jobs don't keep whole WAVs in server memory. Other results pass through.
+    """
+    audio_bytes = result.get('audio_bytes') if isinstance(result, dict) else None
+    if not audio_bytes:
+        return result
+    digest = hashlib.sha256(audio_bytes).hexdigest()
+    base_name = os.path.splitext(source_name(source) or "audio")[0]
+    output_path = os.path.join(config.PROCESSED_OUTPUT_DIR, f"{base_name}_{suffix}_{digest[:8]}.wav")
+    if not os.path.exists(output_path):
+        with metrics.timer("file_write") as timing, storage.atomic_path(output_path) as part_path, open(part_path, "wb") as f:
+            f.write(audio_bytes)
+            timing.bytes = len(audio_bytes)
+    register_digest(output_path, digest) # The preview step can key on it without re-reading the file
+    result = {key: value for key, value in result.items() if key != 'audio_bytes'}
+    result['output_path'] = output_path
+    return result
@@ -1,14 +1,24 @@
 # src/processing.py
 import os
 import subprocess
-import librosa
+import functools
 import numpy as np
 import soundfile as sf
-import pyloudnorm as pyln
 import logging
 import sys
 import io
+import shutil
+import tempfile
+import time
 from src import config # Use config for paths and defaults
+from src import ingest
+from src import metrics
+from src import noise_profiles
+from src import silence
+from src import storage
+from src import spectral
+from src import streaming as streaming_stages
+from src.cache import cached_stage, source_label
 
 logger = logging.getLogger(__name__)
 
@@ -16,34 +26,100 @@ logger = logging.getLogger(__name__)
 
 
 # 1. Extract Vocals using Demucs
-def separate_audio_with_demucs(audio_path: str, # audio_path will now be the sanitized path from utils.py
-                               output_dir: str = config.DEMUCS_OUTPUT_DIR,
-                               model: str = config.DEFAULT_DEMUCS_MODEL,
-                               stems: str = config.DEFAULT_DEMUCS_STEMS) -> dict:
-    """
-    Separates audio using Demucs CLI.
-    Uses sanitized input path and forces UTF-8 IO encoding for subprocess robustness.
-    Args:
-        audio_path: Path to the input audio file.
-        output_dir: Directory to save separated stems.
-        model: Demucs model name.
-        stems: Stem to separate ('vocals' or 'four').
+STEM_EXTENSIONS = (".wav", ".mp3", ".flac") # What demucs writes, depending on the profile's output format
+# Profile output -> (extension, soundfile format, subtype) for stems this module writes itself
+STEM_FORMATS = {'int16': (".wav", "WAV", "PCM_16"), 'int24': (".wav", "WAV", "PCM_24"),
+                'float32': (".wav", "WAV", "FLOAT"), 'mp3': (".mp3", "MP3", "MPEG_LAYER_III")}
 
-    Returns:
-        A dictionary: {'success': bool, 'message': str, 'output_paths': dict | None}
-        output_paths might contain {'vocals': path, 'other': path}
+
+def demucs_profile(name: str) -> dict:
+    """ Settings of a named profile (see config.DEMUCS_PROFILES). """
+    if name not in config.DEMUCS_PROFILES:
+        raise ValueError(f"Unknown Demucs profile '{name}'. Choose from: auto, {', '.join(config.DEMUCS_PROFILES)}")
+    return config.DEMUCS_PROFILES[name]
+
+
+def estimate_demucs_seconds(profile: str, duration_sec: float, cpus: int = config.CPU_COUNT) -> float:
+    """ Predicted wall time of separating duration_sec of audio with profile on cpus cores (linear scaling). """
+    return duration_sec * demucs_profile(profile)['rtf'] * config.DEMUCS_PROFILE_REFERENCE_CPUS / max(1, cpus)
+
+
+def choose_demucs_profile(duration_sec: float | None, cpus: int = config.CPU_COUNT,
+                          budget_sec: float = config.DEMUCS_LATENCY_BUDGET_SEC) -> str:
     """
-    if not os.path.exists(audio_path):
-         # Log the path that was attempted
-         logger.error(f"Input file not found at expected sanitized path: {audio_path}")
-         return {'success': False, 'message': f"Input file not found: {audio_path}", 'output_paths': None}
+    The highest-quality profile expected to finish within budget_sec, or the fastest one when none does.
+    Profiles are ranked by their rtf. An unknown duration gets the default profile.
+    """
+    if duration_sec is None:
+        return config.DEMUCS_PROFILE if config.DEMUCS_PROFILE != "auto" else "balanced"
+    ranked = sorted(config.DEMUCS_PROFILES, key=lambda name: config.DEMUCS_PROFILES[name]['rtf'], reverse=True)
+    for name in ranked:
+        if estimate_demucs_seconds(name, duration_sec, cpus) <= budget_sec:
+            return name
+    return ranked[-1]
 
-    os.makedirs(output_dir, exist_ok=True)
+
+def resolve_demucs_profile(profile: str, duration_sec: float | None = None) -> tuple[str, dict]:
+    """ Turns a profile name or 'auto' into (profile name, settings). """
+    if profile == "auto":
+        profile = choose_demucs_profile(duration_sec)
+        logger.info(f"Auto-selected Demucs profile '{profile}' for {duration_sec or 0:.0f}s of audio "
+                    f"on {config.CPU_COUNT} CPUs (budget {config.DEMUCS_LATENCY_BUDGET_SEC:.0f}s)")
+    return profile, demucs_profile(profile)
+
+
+def _collect_demucs_outputs(audio_path: str, output_dir: str, model: str, stems: str) -> dict:
+    """
+    Locates the stems Demucs wrote for `audio_path` and builds the result dict.
+    Demucs writes output_dir / model / <track name> / <stem>.<ext>. Two-stem runs give {stems, 'other'}
+    (the no_<stems> file); four-stem runs give every source of the model (drums, bass, other, vocals).
+    """
+    base_name = os.path.splitext(os.path.basename(audio_path))[0]
+    expected_output_subdir = os.path.join(output_dir, model, base_name)
+
+    found_paths = {}
+    if os.path.isdir(expected_output_subdir):
+        for file_name in sorted(os.listdir(expected_output_subdir)):
+            stem_name, ext = os.path.splitext(file_name)
+            if ext.lower() not in STEM_EXTENSIONS:
+                continue
+            if stems != "four":
+                if stem_name not in (stems, f"no_{stems}"):
+                    continue # Left over from an earlier four-stem run of the same track
+                stem_name = stems if stem_name == stems else "other"
+            elif stem_name.startswith("no_"):
+                continue
+            found_paths[stem_name] = os.path.join(expected_output_subdir, file_name)
+            logger.info(f"Found output stem: {found_paths[stem_name]}")
+    if stems != "four" and stems not in found_paths:
+        logger.warning(f"Expected Demucs output stem '{stems}' not found in {expected_output_subdir}")
+
+    if not found_paths:
+         # If *no* expected files were found, report failure clearly
+         logger.error(f"Demucs ran, but no expected output files found in {expected_output_subdir}")
+         return {'success': False, 'message': f"Demucs ran, but no output files found in expected location: {expected_output_subdir}. Check logs and Demucs output.", 'output_paths': None}
+
+    return {'success': True, 'message': "Separation complete!", 'output_paths': found_paths}
+
+
+def _demucs_cli_args(stems: str, settings: dict) -> list[str]:
+    """ demucs CLI options for a profile. """
+    args = [] if stems == "four" else ["--two-stems", stems] # Four stems is the CLI's default
+    args += ["--shifts", str(settings['shifts']), "--overlap", str(settings['overlap'])]
+    if settings.get('segment'):
+        args += ["--segment", str(int(settings['segment']))]
+    if settings.get('jobs'):
+        args += ["-j", str(settings['jobs'])]
+    args += {'int16': [], 'int24': ["--int24"], 'float32': ["--float32"], 'mp3': ["--mp3"]}[settings['output']]
+    return args
+
+
+def _run_demucs_subprocess(audio_path: str, output_dir: str, model: str, stems: str, settings: dict) -> dict:
+    """ Runs the demucs CLI in a fresh interpreter (pays model loading on every call). """
     # Use subprocess for better control and error handling than os.system
     cmd = [
         sys.executable, "-m", "demucs", # Or just "demucs" if in PATH 
-        "--" + ("two-stems" if stems == "vocals" else "stems"), # Handle two-stems vs --stems
-        stems,
+        *_demucs_cli_args(stems, settings),
         "--out", output_dir,
         "-n", model,
         # Crucially, ensure the audio_path itself is passed correctly.
@@ -65,40 +141,7 @@ def separate_audio_with_demucs(audio_path: str, # audio_path will now be the san
         result = subprocess.run(cmd, check=True, capture_output=True, text=True, encoding='utf-8', errors='replace', env=process_env)
         logger.info("Demucs execution successful.")
         logger.debug(f"Demucs stdout:\n{result.stdout}")
-
-        # --- Determine output paths (This is crucial and depends on Demucs version/settings) ---
-        # Assuming default output: output_dir / model_name / filename_without_ext / stem.wav
-        base_name = os.path.splitext(os.path.basename(audio_path))[0]
-        # Note: Demucs output structure can vary. CHECK your actual output.
-        # This assumes the common structure like "output_demucs/htdemucs/YourSong/vocals.wav"
-        expected_output_subdir = os.path.join(output_dir, model, base_name)
-
-        # Adjust based on the stems you expect
-        expected_files = {}
-        if stems == "vocals":
-            expected_files["vocals"] = os.path.join(expected_output_subdir, "vocals.wav")
-            expected_files["other"] = os.path.join(expected_output_subdir, "no_vocals.wav") # Check if it's 'other' or 'no_vocals'
-        # Add elif for 'four' stems if needed (drums, bass, other, vocals)
-
-        # Verify files exist
-        found_paths = {}
-        all_found = True
-        for stem_name, file_path in expected_files.items():
-            if os.path.exists(file_path):
-                found_paths[stem_name] = file_path
-                logger.info(f"Found output stem: {file_path}")
-            else:
-                logger.warning(f"Expected Demucs output file not found: {file_path}")
-                all_found = False
-                # Attempt fallback? Maybe demucs output structure changed?
-                # Could check output_dir directly for .wav files? Risky.
-
-        if not found_paths:
-             # If *no* expected files were found, report failure clearly
-             logger.error(f"Demucs ran, but no expected output files found in {expected_output_subdir}")
-             return {'success': False, 'message': f"Demucs ran, but no output files found in expected location: {expected_output_subdir}. Check logs and Demucs output.", 'output_paths': None}
-
-        return {'success': True, 'message': "Separation complete!", 'output_paths': found_paths}
+        return _collect_demucs_outputs(audio_path, output_dir, model, stems)
 
     except subprocess.CalledProcessError as e:
         logger.error(f"Demucs execution failed with code {e.returncode}", exc_info=False)# exc_info=False as we log stderr below
@@ -106,57 +149,433 @@ def separate_audio_with_demucs(audio_path: str, # audio_path will now be the san
         stderr_decoded = e.stderr # Already decoded if text=True, but using env should fix internal print
         logger.error(f"Demucs stderr:\n{stderr_decoded}")
         return {'success': False, 'message': f"Demucs failed: {e.stderr[:500]}...", 'output_paths': None} # Show part of error
+
+
+def _run_demucs_pool(audio_path: str, output_dir: str, model: str, stems: str, settings: dict) -> dict:
+    """ Sends the job to the resident Demucs worker pool (models stay loaded between calls). """
+    from src import demucs_pool # Imported lazily so the subprocess backend never starts the pool
+    logger.info(f"Submitting Demucs job to worker pool: model={model}, stems={stems}, file={audio_path}")
+    demucs_pool.get_pool().separate(audio_path, output_dir, model, stems, settings)
+    logger.info("Demucs pool job finished.")
+    return _collect_demucs_outputs(audio_path, output_dir, model, stems)
+
+
+def _run_demucs_segmented(audio_path: str, output_dir: str, model: str, stems: str, settings: dict,
+                          segment_sec: float = config.DEMUCS_SEGMENT_SEC,
+                          overlap_sec: float = config.DEMUCS_SEGMENT_OVERLAP_SEC) -> dict:
+    """ Separates overlapping segments in parallel on the worker pool and writes the stitched stems like the CLI. """
+    from src import demucs_pool
+    wav, sr = ingest.load_audio(audio_path, mono=False)
+    named, stem_sr = demucs_pool.separate_segmented(wav, sr, model, stems, segment_sec, overlap_sec, settings=settings)
+
+    _write_stems(named, stem_sr, audio_path, output_dir, model, settings)
+    return _collect_demucs_outputs(audio_path, output_dir, model, stems)
+
+
+def _write_stems(named: dict, stem_sr: int, audio_path: str, output_dir: str, model: str, settings: dict):
+    """ Writes {stem name: (channels, samples)} where the demucs CLI would, in the profile's output format. """
+    base_name = os.path.splitext(os.path.basename(audio_path))[0]
+    track_dir = os.path.join(output_dir, model, base_name)
+    os.makedirs(track_dir, exist_ok=True)
+    ext, file_format, subtype = STEM_FORMATS[settings['output']]
+    for name, audio in named.items():
+        # Same clipping behaviour as demucs' default '--clip-mode rescale'
+        peak = float(np.max(np.abs(audio), initial=0.0))
+        with storage.atomic_path(os.path.join(track_dir, f"{name}{ext}")) as part_path:
+            sf.write(part_path, audio.T / max(1.01 * peak, 1.0), stem_sr, format=file_format, subtype=subtype)
+
+
+def _run_demucs_active_regions(audio_path: str, output_dir: str, model: str, stems: str, settings: dict,
+                               partition: silence.Partition, backend: str, fill: str) -> dict:
+    """
+    Separates only the active regions of audio_path, back to back in a single job (segment-parallel
+    when that is still long and the pool is used), and writes full-length stems like the CLI.
+    Skipped samples are zero in every stem; with fill='passthrough' the residual stem (no_<stem>, or
+    'other' for four stems) carries the original audio there, so the stems still sum to the input.
+    """
+    from src import demucs_pool
+    wav, sr = ingest.load_audio(audio_path, mono=False)
+    compacted = partition.compact(wav)
+    if backend == "pool" and compacted.shape[-1] >= config.DEMUCS_SEGMENT_MIN_SEC * sr:
+        named, stem_sr = demucs_pool.separate_segmented(compacted, sr, model, stems, settings=settings)
+    else:
+        named, stem_sr = _separate_array(compacted, sr, model, stems, backend, settings)
+    del compacted
+
+    ratio = stem_sr / sr
+    length = int(round(partition.total * ratio))
+    residual = f"no_{stems}" if f"no_{stems}" in named else "other"
+    full = {}
+    for name, audio in named.items():
+        out = np.zeros((audio.shape[0], length), dtype=np.float32)
+        if fill == "passthrough" and name == residual:
+            original = _resample(np.atleast_2d(wav), sr, stem_sr)
+            if original.shape[0] != out.shape[0]:
+                original = original.mean(axis=0, keepdims=True) # Fold down, then broadcast over the stem's channels
+            n = min(length, original.shape[-1])
+            out[:, :n] = original[:, :n]
+        full[name] = partition.expand(audio, out, ratio)
+    _write_stems(full, stem_sr, audio_path, output_dir, model, settings)
+    return _collect_demucs_outputs(audio_path, output_dir, model, stems)
+
+
+def _resample(y: np.ndarray, sr: int, target_sr: int) -> np.ndarray:
+    """ Polyphase resampling along the last axis (a float32 copy when the rates already match). """
+    if sr == target_sr:
+        return np.array(y, dtype=np.float32)
+    from scipy.signal import resample_poly # Lazy: only rate-changing callers pay for scipy.signal
+    g = int(np.gcd(sr, target_sr))
+    return resample_poly(y, target_sr // g, sr // g, axis=-1).astype(np.float32)
+
+
+def _should_segment(audio_path: str, segmented: bool | None, backend: str) -> bool:
+    """ Resolves segmented=None: use segments for long inputs when the worker pool is available. """
+    if segmented is not None:
+        return segmented
+    if backend != "pool":
+        return False
+    return _audio_duration(audio_path) >= config.DEMUCS_SEGMENT_MIN_SEC
+
+
+def _audio_duration(audio_path: str, decode: bool = True) -> float | None:
+    """ Duration in seconds. Without decode, formats soundfile can't read (e.g. m4a) give None. """
+    try:
+        return sf.info(audio_path).duration
+    except Exception: # e.g. m4a: the ingest cache knows the length after decoding
+        if not decode:
+            return None
+        meta = ingest.get_metadata(audio_path, mono=False)
+        return meta['frames'] / meta['sample_rate']
+
+
+def _run_demucs_in_process(audio_path: str, output_dir: str, model: str, stems: str, settings: dict) -> dict:
+    """ Separates in the calling process, keeping the model resident here (used by batch workers). """
+    from src import demucs_pool
+    demucs_pool.separate_in_process(audio_path, output_dir, model, stems, settings)
+    return _collect_demucs_outputs(audio_path, output_dir, model, stems)
+
+
+def _separate_path(audio_path: str, output_dir: str, model: str | None, stems: str, backend: str,
+                   segmented: bool | None, profile: str, skip_silence: bool = False,
+                   silence_fill: str = config.SILENCE_FILL) -> dict:
+    """ Resolves the profile, dispatches one on-disk input to the selected Demucs backend and times it. """
+    started = time.perf_counter()
+    if backend not in ("pool", "inprocess", "subprocess"):
+        return {'success': False, 'message': f"Unknown Demucs backend: {backend}", 'output_paths': None}
+    partition = None
+    if skip_silence:
+        wav, sr = ingest.load_audio(audio_path, mono=False)
+        partition = silence.partition_for_skipping(wav, sr)
+    duration = None
+    if profile == "auto": # Only the audio that is actually separated counts towards the latency budget
+        duration = (partition.active_samples / partition.sample_rate if partition is not None
+                    else _audio_duration(audio_path))
+    profile, settings = resolve_demucs_profile(profile, duration)
+    model = model or settings['model']
+    if partition is not None:
+        mode = "active_regions"
+        run = functools.partial(_run_demucs_active_regions, partition=partition, backend=backend, fill=silence_fill)
+    elif _should_segment(audio_path, segmented, backend):
+        mode, run = "segmented", _run_demucs_segmented
+    elif backend == "pool":
+        mode, run = backend, _run_demucs_pool
+    elif backend == "inprocess":
+        mode, run = backend, _run_demucs_in_process
+    else:
+        mode, run = backend, _run_demucs_subprocess
+    with metrics.timer("demucs", backend=mode, profile=profile) as timing:
+        result = run(audio_path, output_dir, model, stems, settings)
+        if not result['success']:
+            timing.mark_failed()
+        if config.METRICS_ENABLED:
+            timing.audio_sec = _audio_duration(audio_path, decode=False)
+    result['elapsed_sec'] = round(time.perf_counter() - started, 3)
+    result['profile'] = profile
+    if partition is not None and result['success']:
+        result['silence'] = silence.record(partition, "demucs")
+    logger.info(f"Demucs ({mode}, {profile} profile, {model}) took {result['elapsed_sec']:.1f}s for {os.path.basename(audio_path)}")
+    return result
+
+
+# 'auto' is cached under its own name: a repeat gets whatever profile the first call picked
+@cached_stage("demucs", params=("model", "stems", "profile", "skip_silence", "silence_fill"))
+def separate_audio_with_demucs(audio_path: ingest.AudioSource, # audio_path will now be the sanitized path from utils.py
+                               output_dir: str = config.DEMUCS_OUTPUT_DIR,
+                               model: str | None = None,
+                               stems: str = config.DEFAULT_DEMUCS_STEMS,
+                               backend: str = config.DEMUCS_BACKEND,
+                               segmented: bool | None = None,
+                               profile: str = config.DEMUCS_PROFILE,
+                               skip_silence: bool = config.SKIP_SILENCE,
+                               silence_fill: str = config.SILENCE_FILL) -> dict:
+    """
+    Separates audio using Demucs.
+    Uses sanitized input path and forces UTF-8 IO encoding for subprocess robustness.
+    Args:
+        audio_path: Path to the input audio file. Bytes, file-like objects and (ndarray, sr) pairs are
+                    accepted too; Demucs needs a path, so those are written to a temp file for the call.
+        output_dir: Directory to save separated stems.
+        model: Demucs model name (None = the profile's model).
+        stems: Stem to separate ('vocals' or 'four').
+        backend: 'pool' to use the resident worker pool (see src/demucs_pool.py),
+                 'inprocess' to load the model into the calling process and keep it there,
+                 'subprocess' to run the demucs CLI for this request only.
+        segmented: Split the input into overlapping segments separated in parallel on the worker pool
+                   (see config.DEMUCS_SEGMENT_*). None enables it for inputs longer than DEMUCS_SEGMENT_MIN_SEC.
+        profile: Speed/quality preset from config.DEMUCS_PROFILES (shifts, overlap, segment, jobs, output
+                 format, model), or 'auto' to pick one from the input duration, CPU count and
+                 config.DEMUCS_LATENCY_BUDGET_SEC.
+        skip_silence: Separate only the active regions (see src/silence.py) and put the stems back on the
+                      original timeline; the result then carries a 'silence' report with the savings.
+        silence_fill: What the stems hold where silence was skipped: 'zero', or 'passthrough' to give the
+                      original audio to the residual stem.
+
+    Returns:
+        A dictionary: {'success': bool, 'message': str, 'output_paths': dict | None}
+        output_paths might contain {'vocals': path, 'other': path}, or drums/bass/other/vocals for stems='four'
+    """
+    if ingest.is_path(audio_path) and not os.path.exists(audio_path):
+         # Log the path that was attempted
+         logger.error(f"Input file not found at expected sanitized path: {audio_path}")
+         return {'success': False, 'message': f"Input file not found: {audio_path}", 'output_paths': None}
+    if profile != "auto" and profile not in config.DEMUCS_PROFILES:
+        return {'success': False, 'message': f"Unknown Demucs profile '{profile}'", 'output_paths': None}
+    if silence_fill not in silence.FILLS:
+        return {'success': False, 'message': f"Unknown silence fill '{silence_fill}'", 'output_paths': None}
+
+    os.makedirs(output_dir, exist_ok=True)
+    try:
+        with ingest.source_path(audio_path) as path:
+            return _separate_path(path, output_dir, model, stems, backend, segmented, profile, skip_silence, silence_fill)
     except Exception as e:
         logger.error(f"An unexpected error occurred during Demucs processing: {e}", exc_info=True)
         return {'success': False, 'message': f"An unexpected error occurred: {e}", 'output_paths': None}
 
 
-# 2. Adaptive Noise Reduction
-def adaptive_noise_reduction(input_file: str) -> dict: #removed output_file parameter
-    """ Applies adaptive noise reduction and return audio bytes. """
-    logger.info(f"Applying adaptive noise reduction on {input_file}...")
+def compare_separation_modes(audio_path: str, output_dir: str | None = None,
+                             model: str = config.DEFAULT_DEMUCS_MODEL,
+                             stems: str = config.DEFAULT_DEMUCS_STEMS) -> dict:
+    """
+    Times the single-job pool path against the segment-parallel path on the same input (cache bypassed).
+    Returns {'single_sec', 'segmented_sec', 'speedup'}.
+    """
+    from src import demucs_pool
+    output_dir = output_dir or os.path.join(config.TEMP_DIR_BASE, "demucs_compare")
+    # Start the pool first so neither timing includes worker start-up and model loading
+    demucs_pool.get_pool().warm_up()
+    timings = {}
+    for label, segmented in (("single_sec", False), ("segmented_sec", True)):
+        started = time.perf_counter()
+        result = separate_audio_with_demucs.__wrapped__(audio_path, os.path.join(output_dir, label), model, stems,
+                                                        backend="pool", segmented=segmented)
+        if not result['success']:
+            raise RuntimeError(f"{label} run failed: {result['message']}")
+        timings[label] = round(time.perf_counter() - started, 3)
+    timings['speedup'] = round(timings['single_sec'] / timings['segmented_sec'], 2)
+    logger.info(f"Demucs speed comparison for {os.path.basename(audio_path)}: {timings}")
+    return timings
+
+
+def separate_audio_array(wav: np.ndarray, sr: int,
+                         model: str | None = None,
+                         stems: str = config.DEFAULT_DEMUCS_STEMS,
+                         backend: str = config.DEMUCS_BACKEND,
+                         profile: str = config.DEMUCS_PROFILE) -> dict:
+    """
+    Separates an in-memory buffer ((channels, samples) or mono) and returns the stems as arrays.
+    Only the 'subprocess' backend needs the audio on disk, so only it writes a temp file.
+    model and profile work as in separate_audio_with_demucs (the profile's output format doesn't apply).
+
+    Returns:
+        A dictionary: {'success': bool, 'message': str, 'stems': {name: ndarray} | None, 'sample_rate': int | None}
+        Stem names follow the Demucs files, e.g. {'vocals': ..., 'no_vocals': ...}
+    """
     try:
-        if not os.path.exists(input_file):
-             raise FileNotFoundError(f"Input file not found: {input_file}")
+        profile, settings = resolve_demucs_profile(profile, np.shape(wav)[-1] / sr)
+        named, stem_sr = _separate_array(wav, sr, model or settings['model'], stems, backend, settings)
+        return {'success': True, 'message': "Separation complete!", 'stems': named, 'sample_rate': stem_sr}
+    except Exception as e:
+        logger.error(f"An unexpected error occurred during Demucs processing: {e}", exc_info=True)
+        return {'success': False, 'message': f"An unexpected error occurred: {e}", 'stems': None, 'sample_rate': None}
 
-        y, sr = librosa.load(input_file, sr=None)
 
-        # Simple noise profile from the start (adjust duration if needed)
-        noise_duration_sec = 0.5
-        if len(y) < int(noise_duration_sec * sr):
-             logger.warning("Audio too short for noise profile, using entire clip.")
-             noise_profile = y
-        else:
-             noise_profile = y[:int(noise_duration_sec * sr)]
+def _separate_array(wav: np.ndarray, sr: int, model: str, stems: str, backend: str, settings: dict) -> tuple[dict, int]:
+    """ Runs one in-memory separation on `backend`. Returns ({stem file name: array}, sample rate); raises on failure. """
+    if backend in ("pool", "inprocess"):
+        from src import demucs_pool
+        if backend == "pool":
+            return demucs_pool.get_pool().submit_array(wav, sr, model, stems, settings).result()
+        return demucs_pool.separate_array_in_process(wav, sr, model, stems, settings)
 
-        # Check for silence in noise profile
-        if np.max(np.abs(noise_profile)) < 1e-5:
-            logger.warning("Noise profile seems silent. Noise reduction might be ineffective.")
-            bytes_io = io.BytesIO()
-            # Write original audio to bytes if silent
-            sf.write(bytes_io, y, sr, format='WAV') 
-            return {'success': True, 'message': 'Noise profile silent, returning original.', 'audio_bytes': bytes_io.getvalue()}
+    # The CLI only takes paths: round-trip through a temp WAV
+    os.makedirs(config.TEMP_DIR_BASE, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(dir=config.TEMP_DIR_BASE)
+    try:
+        temp_path = os.path.join(temp_dir, "input.wav")
+        sf.write(temp_path, np.atleast_2d(wav).T, sr, subtype='FLOAT')
+        # Float stems: they are read straight back, so skip the int16 round-trip
+        result = _run_demucs_subprocess(temp_path, temp_dir, model, stems, {**settings, 'output': "float32"})
+        if not result['success']:
+            raise RuntimeError(result['message'])
+        named, stem_sr = {}, None
+        for path in result['output_paths'].values():
+            audio, stem_sr = sf.read(path, dtype='float32', always_2d=True)
+            named[os.path.splitext(os.path.basename(path))[0]] = audio.T
+        return named, stem_sr
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
 
 
-        noise_stft = librosa.stft(noise_profile)
-        # Use median instead of mean for potentially better robustness to transients
-        noise_magnitude = np.median(np.abs(noise_stft), axis=1)
+# 2. Adaptive Noise Reduction
+def _should_stream(input_file: ingest.AudioSource, streaming: bool | None) -> bool:
+    """
+    Resolves streaming=None to 'stream if the input is long', using the file header only.
+    In-memory sources are already fully in memory, so they never stream.
+    """
+    if not ingest.is_path(input_file):
+        if streaming:
+            logger.info("Streaming needs a file on disk; processing the in-memory input directly.")
+        return False
+    if streaming is not None:
+        return streaming
+    try:
+        return sf.info(input_file).duration >= config.STREAMING_MIN_DURATION_SEC
+    except Exception: # Not readable by soundfile (e.g. m4a): only the in-memory path can decode it
+        return False
 
-        vocal_stft = librosa.stft(y)
-        vocal_magnitude, phase = librosa.magphase(vocal_stft)
 
-        # Apply subtraction (add a small floor to avoid subtracting too much)
-        noise_floor = 0.02 # Adjust this factor
-        vocal_magnitude_cleaned = np.maximum(0, vocal_magnitude - noise_magnitude[:, np.newaxis] * (1 + noise_floor) )
+def _default_output_path(input_file: str, suffix: str) -> str:
+    base_name = os.path.splitext(os.path.basename(input_file))[0]
+    return os.path.join(config.PROCESSED_OUTPUT_DIR, f"{base_name}_{suffix}.wav")
 
-        stft_cleaned = vocal_magnitude_cleaned * phase
-        y_cleaned = librosa.istft(stft_cleaned, length=len(y)) # Ensure original length
 
-         # --- Write processed audio to bytes ---
+def _encode_wav_bytes(y: np.ndarray, sr: int) -> bytes:
+    with metrics.timer("encode", format="wav", target="memory") as timing:
         bytes_io = io.BytesIO()
-        sf.write(bytes_io, y_cleaned, sr, format='WAV') # Must specify format for BytesIO
-        logger.info(f"Adaptive noise reduction complete for {input_file}.")
-        return {'success': True, 'message': 'Noise reduction complete!', 'audio_bytes': bytes_io.getvalue()} # Return bytes
+        sf.write(bytes_io, y, sr, format='WAV') # Must specify format for BytesIO
+        timing.bytes = bytes_io.tell()
+    return bytes_io.getvalue()
+
+
+def reduce_noise_array(y: np.ndarray, sr: int,
+                       noise_duration_sec: float = config.DEFAULT_NOISE_PROFILE_SEC,
+                       noise_floor: float = config.DEFAULT_NOISE_FLOOR,
+                       n_fft: int = 2048, hop_length: int = 512,
+                       partition: silence.Partition | None = None,
+                       silence_fill: str = config.SILENCE_FILL,
+                       noise_profile: "noise_profiles.NoiseProfile | str | None" = None) -> tuple[np.ndarray, str]:
+    """
+    Spectral-subtraction core of adaptive_noise_reduction on a mono buffer. Returns (audio, message).
+    With a partition (src/silence.py) only its active regions are denoised, in one batched STFT;
+    the rest of the output is silence_fill.
+    A stored noise_profile (src/noise_profiles.py: a profile, or its name or .npz path) replaces the
+    estimate from the first noise_duration_sec, and its n_fft / hop_length replace the arguments.
+    """
+    with metrics.timer("noise_reduction", mode="memory") as timing:
+        timing.audio_sec = len(y) / sr
+        profile = noise_profiles.resolve(noise_profile)
+        if profile is not None:
+            n_fft, hop_length = profile.n_fft, profile.hop_length
+        threshold = _noise_threshold(y, sr, noise_duration_sec, noise_floor, n_fft, hop_length, profile)
+        if threshold is None:
+            return y, 'Noise profile silent, returning original.'
+        engine = spectral.get_engine(n_fft, hop_length)
+        if partition is None:
+            return engine.reduce_noise(y, threshold), 'Noise reduction complete!'
+        out = silence.fill_like(y, silence_fill)
+        if len(partition.regions):
+            parts = engine.reduce_noise_batch(partition.split(y), [threshold] * len(partition.regions))
+            partition.join(parts, out)
+        return out, 'Noise reduction complete!'
+
+
+def _noise_threshold(y: np.ndarray, sr: int, noise_duration_sec: float, noise_floor: float,
+                     n_fft: int, hop_length: int,
+                     profile: "noise_profiles.NoiseProfile | None" = None) -> np.ndarray | None:
+    """
+    Per-bin subtraction threshold from the stored profile if one is given, otherwise from the start
+    of the signal (None if that part is silent).
+    """
+    if profile is not None:
+        profile.check_rate(sr)
+        return profile.threshold(noise_floor)
+
+    # Simple noise profile from the start (adjust noise_duration_sec if needed)
+    if len(y) < int(noise_duration_sec * sr):
+         logger.warning("Audio too short for noise profile, using entire clip.")
+         noise_profile = y
+    else:
+         noise_profile = y[:int(noise_duration_sec * sr)]
+
+    # Check for silence in noise profile
+    if silence.is_silent(noise_profile):
+        logger.warning("Noise profile seems silent. Noise reduction might be ineffective.")
+        return None
+
+    # Use median instead of mean for potentially better robustness to transients,
+    # and add a small floor to avoid subtracting too little
+    return spectral.get_engine(n_fft, hop_length).noise_profile(noise_profile) * np.float32(1 + noise_floor)
+
+
+@cached_stage("noise_reduction", params=("noise_duration_sec", "noise_floor", "streaming", "n_fft", "hop_length",
+                                          "skip_silence", "silence_fill", "noise_profile"),
+              fingerprints={'noise_profile': noise_profiles.fingerprint})
+def adaptive_noise_reduction(input_file: ingest.AudioSource,
+                             noise_duration_sec: float = config.DEFAULT_NOISE_PROFILE_SEC,
+                             noise_floor: float = config.DEFAULT_NOISE_FLOOR,
+                             streaming: bool | None = None,
+                             output_file: str | None = None,
+                             n_fft: int = 2048,
+                             hop_length: int = 512,
+                             skip_silence: bool = config.SKIP_SILENCE,
+                             silence_fill: str = config.SILENCE_FILL,
+                             noise_profile: "noise_profiles.NoiseProfile | str | None" = config.NOISE_PROFILE) -> dict:
+    """
+    Applies adaptive noise reduction and return audio bytes.
+    input_file may be a path, the raw bytes / file-like object of an upload, or an (ndarray, sr) pair;
+    non-path inputs are decoded straight from memory.
+
+    With streaming=True (or streaming=None and an input longer than config.STREAMING_MIN_DURATION_SEC)
+    the file is processed block-wise in constant memory (see src/streaming.py) and the result is
+    written to output_file; the dict then carries 'output_path' instead of 'audio_bytes'.
+
+    With skip_silence, dead air (see src/silence.py) is left out of the spectral processing and written
+    as silence_fill ('zero' or 'passthrough'); the dict then carries a 'silence' report with the savings.
+
+    noise_profile names a stored profile (src/noise_profiles.py; a name, .npz path or NoiseProfile) to
+    subtract instead of estimating the noise from the first noise_duration_sec of this input. The
+    profile's n_fft / hop_length are used, and its sample rate must match the input's.
+    """
+    label = source_label(input_file)
+    logger.info(f"Applying adaptive noise reduction on {label}...")
+    try:
+        if ingest.is_path(input_file) and not os.path.exists(input_file):
+             raise FileNotFoundError(f"Input file not found: {input_file}")
+        profile = noise_profiles.resolve(noise_profile)
+
+        if _should_stream(input_file, streaming):
+            output_file = output_file or _default_output_path(input_file, "noise_reduced")
+            logger.info(f"Using streaming noise reduction, writing to {output_file}")
+            with metrics.timer("noise_reduction", mode="streaming") as timing:
+                result = streaming_stages.stream_noise_reduction(input_file, output_file, noise_duration_sec, noise_floor,
+                                                                 n_fft=n_fft, hop_length=hop_length,
+                                                                 skip_silence=skip_silence, silence_fill=silence_fill,
+                                                                 noise_profile=profile)
+                timing.audio_sec = _audio_duration(output_file, decode=False) if result['success'] else None
+            logger.info(f"Adaptive noise reduction complete for {label}.")
+            return result
+
+        y, sr = ingest.load_source(input_file) # Paths: memory-mapped, decoded once per source
+        partition = silence.partition_for_skipping(y, sr) if skip_silence else None
+        y_cleaned, message = reduce_noise_array(y, sr, noise_duration_sec, noise_floor, n_fft, hop_length,
+                                                partition, silence_fill, profile)
+
+         # --- Write processed audio to bytes ---
+        logger.info(f"Adaptive noise reduction complete for {label}.")
+        result = {'success': True, 'message': message, 'audio_bytes': _encode_wav_bytes(y_cleaned, sr)} # Return bytes
+        if partition is not None and y_cleaned is not y: # A silent noise profile returns the input untouched
+            result['silence'] = silence.record(partition, "noise_reduction")
+        return result
 
     except FileNotFoundError as e:
         logger.error(f"Noise reduction failed: {e}")
@@ -166,41 +585,116 @@ def adaptive_noise_reduction(input_file: str) -> dict: #removed output_file para
         return {'success': False, 'message': f"Noise reduction error: {e}", 'output_path': None} # Return None for bytes
 
 
-# 3. Loudness Normalization
-def loudness_normalization(input_file: str, target_lufs: float = config.DEFAULT_TARGET_LUFS) -> dict: # Removed output_file parameter
-    """ Normalizes audio loudness to target LUFS and return audio bytes. """
-    logger.info(f"Applying loudness normalization ({target_lufs} LUFS) on {input_file}...")
-    try:
-        if not os.path.exists(input_file):
-             raise FileNotFoundError(f"Input file not found: {input_file}")
+def adaptive_noise_reduction_batch(input_files: list[str],
+                                   noise_duration_sec: float = config.DEFAULT_NOISE_PROFILE_SEC,
+                                   noise_floor: float = config.DEFAULT_NOISE_FLOOR,
+                                   n_fft: int = 2048, hop_length: int = 512,
+                                   noise_profile: "noise_profiles.NoiseProfile | str | None" = config.NOISE_PROFILE) -> list[dict]:
+    """
+    Denoises several (in-memory sized) files as one batched STFT computation.
+    Returns one adaptive_noise_reduction-style result dict per input, in order.
+    With a stored noise_profile every file is denoised with that profile (and its n_fft / hop_length).
+    """
+    profile = noise_profiles.resolve(noise_profile)
+    if profile is not None:
+        n_fft, hop_length = profile.n_fft, profile.hop_length
+    results = [None] * len(input_files)
+    batch = [] # (index, audio, sample rate, threshold)
+    for i, input_file in enumerate(input_files):
+        try:
+            if not os.path.exists(input_file):
+                raise FileNotFoundError(f"Input file not found: {input_file}")
+            y, sr = ingest.load_audio(input_file)
+            threshold = _noise_threshold(y, sr, noise_duration_sec, noise_floor, n_fft, hop_length, profile)
+            if threshold is None:
+                results[i] = {'success': True, 'message': 'Noise profile silent, returning original.', 'audio_bytes': _encode_wav_bytes(y, sr)}
+            else:
+                batch.append((i, y, sr, threshold))
+        except Exception as e:
+            logger.error(f"Noise reduction failed for {input_file}: {e}")
+            results[i] = {'success': False, 'message': f"Noise reduction error: {e}", 'audio_bytes': None}
 
-        y, sr = librosa.load(input_file, sr=None)
+    if batch:
+        engine = spectral.get_engine(n_fft, hop_length)
+        cleaned = engine.reduce_noise_batch([y for _, y, _, _ in batch], [t for _, _, _, t in batch])
+        for (i, _, sr, _), y_cleaned in zip(batch, cleaned):
+            results[i] = {'success': True, 'message': 'Noise reduction complete!', 'audio_bytes': _encode_wav_bytes(y_cleaned, sr)}
+    logger.info(f"Batch noise reduction complete for {len(input_files)} files ({len(batch)} processed).")
+    return results
 
-        # Check for silence
-        if np.max(np.abs(y)) < 1e-5:
-             logger.warning("Input audio is silent. Skipping normalization.")
-             bytes_io = io.BytesIO()
-             sf.write(bytes_io, y, sr, format='WAV') # Write original silent file
-             return {'success': True, 'message': 'Input silent, saved original.', 'audio_bytes': bytes_io.getvalue()}
 
-        meter = pyln.Meter(sr)
-        loudness = meter.integrated_loudness(y)
+# 3. Loudness Normalization
+def normalize_loudness_array(y: np.ndarray, sr: int, target_lufs: float = config.DEFAULT_TARGET_LUFS,
+                             true_peak_limit: float | None = config.TRUE_PEAK_LIMIT_DBTP) -> tuple[np.ndarray, str]:
+    """
+    Measures and normalizes a buffer to target_lufs. Returns (audio, message); silence is returned unchanged.
+    With true_peak_limit (dBTP) set, overs created by the gain are caught by a look-ahead true-peak limiter.
+    """
+    with metrics.timer("loudness_normalization", mode="memory") as timing:
+        timing.audio_sec = y.shape[-1] / sr
+        return _normalize_loudness_array(y, sr, target_lufs, true_peak_limit)
+
+
+def _normalize_loudness_array(y: np.ndarray, sr: int, target_lufs: float,
+                              true_peak_limit: float | None = None) -> tuple[np.ndarray, str]:
+    # Check for silence
+    if silence.is_silent(y):
+         logger.warning("Input audio is silent. Skipping normalization.")
+         return y, 'Input silent, saved original.'
+
+    from src import loudness as bs1770 # Pulls in scipy.signal (~1s cold); only loudness work should pay for it
+    measured = bs1770.integrated_loudness(y, sr)
+
+    # Check loudness is valid (not -inf)
+    if measured == -float('inf'):
+         logger.warning("Could not measure loudness (likely silence). Skipping normalization.")
+         return y, 'Could not measure loudness (silence?), saved original.'
+
+    y_normalized = y * np.float32(10.0 ** ((target_lufs - measured) / 20.0))
+    if true_peak_limit is not None:
+        y_normalized = bs1770.limit_true_peak(y_normalized, sr, true_peak_limit)
+    elif np.max(np.abs(y_normalized)) >= 1.0:
+        logger.warning("Possible clipped samples in output.")
+    return y_normalized, 'Loudness normalization complete!'
+
+
+@cached_stage("loudness_normalization", params=("target_lufs", "streaming", "true_peak_limit"))
+def loudness_normalization(input_file: ingest.AudioSource, target_lufs: float = config.DEFAULT_TARGET_LUFS,
+                           streaming: bool | None = None,
+                           output_file: str | None = None,
+                           true_peak_limit: float | None = config.TRUE_PEAK_LIMIT_DBTP) -> dict:
+    """
+    Normalizes audio loudness to target LUFS and return audio bytes.
+    input_file may be a path, the raw bytes / file-like object of an upload, or an (ndarray, sr) pair.
+    Loudness is measured with the native BS.1770 engine (src/loudness.py); true_peak_limit (dBTP, None = off)
+    adds a true-peak limiter after the gain.
+
+    With streaming=True (or streaming=None and an input longer than config.STREAMING_MIN_DURATION_SEC)
+    the file is measured and normalized in two block-wise passes (see src/streaming.py) and written to
+    output_file; the dict then carries 'output_path' instead of 'audio_bytes'.
+    """
+    label = source_label(input_file)
+    logger.info(f"Applying loudness normalization ({target_lufs} LUFS) on {label}...")
+    try:
+        if ingest.is_path(input_file) and not os.path.exists(input_file):
+             raise FileNotFoundError(f"Input file not found: {input_file}")
 
-        # Check loudness is valid (not -inf)
-        if loudness == -float('inf'):
-             logger.warning(f"Could not measure loudness (likely silence). Skipping normalization for {input_file}")
-             # Write original audio to bytes if loudness invalid
-             bytes_io = io.BytesIO()
-             sf.write(bytes_io, y, sr, format='WAV') 
-             return {'success': True, 'message': 'Could not measure loudness (silence?), saved original.', 'audio_bytes': bytes_io.getvalue()}
+        if _should_stream(input_file, streaming):
+            output_file = output_file or _default_output_path(input_file, "loudness_normalized")
+            logger.info(f"Using streaming loudness normalization, writing to {output_file}")
+            with metrics.timer("loudness_normalization", mode="streaming") as timing:
+                result = streaming_stages.stream_loudness_normalization(input_file, output_file, target_lufs,
+                                                                        true_peak_limit=true_peak_limit)
+                timing.audio_sec = _audio_duration(output_file, decode=False) if result['success'] else None
+            logger.info(f"Loudness normalization complete for {label}.")
+            return result
 
-        y_normalized = pyln.normalize.loudness(y, loudness, target_lufs)
+        y, sr = ingest.load_source(input_file) # Paths: memory-mapped, decoded once per source
+        y_normalized, message = normalize_loudness_array(y, sr, target_lufs, true_peak_limit)
 
         # --- Write processed audio to bytes ---
-        bytes_io = io.BytesIO()
-        sf.write(bytes_io, y_normalized, sr, format='WAV') # Must specify format for BytesIO
-        logger.info(f"Loudness normalization complete for {input_file}.")
-        return {'success': True, 'message': 'Loudness normalization complete!', 'audio_bytes': bytes_io.getvalue()} # Return bytes
+        logger.info(f"Loudness normalization complete for {label}.")
+        return {'success': True, 'message': message, 'audio_bytes': _encode_wav_bytes(y_normalized, sr)} # Return bytes
 
     except FileNotFoundError as e:
         logger.error(f"Loudness normalization failed: {e}")
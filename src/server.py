@@ -0,0 +1,421 @@
+# src/server.py
+# Standalone HTTP API for the processing engine, for running behind a load balancer.
+#
+#     python -m src.server [--host 0.0.0.0] [--port 8600] [--workers N] [--max-active N]
+#
+# Endpoints (uploads are the raw audio file as the request body; pass ?filename=song.mp3 or a
+# Content-Type so compressed formats decode; results are streamed back as the audio file):
+#
+#     POST /v1/separate?profile=fast&stems=vocals&stem=vocals     Demucs; returns one stem
+#                                                                  (profile: fast|balanced|best|auto, stems: vocals|four)
+#     POST /v1/denoise?noise_duration_sec=0.5&noise_floor=0.02     Adaptive noise reduction
+#                                                                  (noise_profile=NAME: use a stored noise profile)
+#     (separate and denoise also take skip_silence=1&silence_fill=zero|passthrough to process only the
+#     active regions; the fraction of audio skipped comes back in the X-Silence-Savings header)
+#     POST /v1/normalize?target_lufs=-23&true_peak_limit=-1         Loudness normalization (limiter optional)
+#     POST /v1/youtube?url=...&native=0                            Downloads and returns the audio
+#     GET  /health                                                 Liveness (always 200 while running)
+#     GET  /ready                                                  Readiness (503 when saturated or draining)
+#     GET  /metrics                                                Prometheus text (src/metrics.py)
+#
+# Requests are admitted while fewer than --max-active are uploading or processing; the rest get 429
+# with Retry-After before their body is read. Processing runs on a thread pool (the heavy parts
+# release the GIL or run in the Demucs worker processes). On SIGTERM the server stops accepting,
+# reports not-ready, and waits for running requests before exiting.
+import os
+import abc
+import time
+import uuid
+import json
+import signal
+import shutil
+import asyncio
+import logging
+import argparse
+import tempfile
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+import tornado.web
+from src import config, metrics, noise_profiles, processing, silence, storage, warmup, __version__
+
+logger = logging.getLogger(__name__)
+
+# Content-Type -> suffix for uploads without a filename (soundfile/ffmpeg pick the decoder from it)
+UPLOAD_SUFFIXES = {'audio/wav': '.wav', 'audio/x-wav': '.wav', 'audio/wave': '.wav', 'audio/mpeg': '.mp3',
+                   'audio/mp4': '.m4a', 'audio/x-m4a': '.m4a', 'audio/flac': '.flac', 'audio/ogg': '.ogg',
+                   'audio/webm': '.webm'}
+
+
+def _flag(value: str) -> bool:
+    return value in ("1", "true", "yes")
+
+
+class Service:
+    """ State shared by all handlers of one server process. Only touched from the event loop thread. """
+
+    def __init__(self, workers: int = config.SERVER_WORKERS, max_active: int = config.SERVER_MAX_ACTIVE):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vocalizer-http")
+        self.workers = workers
+        self.max_active = max_active
+        self.active = 0
+        self.draining = False
+        self.started = time.time()
+
+    def try_admit(self) -> bool:
+        if self.draining or self.active >= self.max_active:
+            return False
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+
+    def status(self) -> dict:
+        return {'status': "draining" if self.draining else ("busy" if self.active >= self.max_active else "ok"),
+                'active': self.active, 'max_active': self.max_active, 'workers': self.workers,
+                'uptime_sec': round(time.time() - self.started, 1), 'version': __version__}
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    """ JSON errors, request IDs, metrics and executor dispatch shared by every endpoint. """
+    endpoint = "other"
+    admitted_only = False # True: counts against max_active and may be rejected with 429
+
+    def initialize(self, service: Service):
+        self.service = service
+        self.admitted = False
+        self.work_dir = None
+        self.disconnected = False
+        self.running = 0 # Processing calls of this request still on the executor
+
+    def prepare(self):
+        self.request_id = self.request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        self.set_header("X-Request-ID", self.request_id)
+        if not self.admitted_only:
+            return
+        if not self.service.try_admit():
+            self.set_header("Retry-After", str(config.SERVER_RETRY_AFTER_SEC))
+            status, reason = (503, "Server is shutting down") if self.service.draining else (429, "Server busy")
+            self.write_json(status, {'error': reason, 'active': self.service.active})
+            self.finish()
+            return
+        self.admitted = True
+        # Per-request scratch dir (upload, outputs); protected from the janitor until the request ends
+        os.makedirs(config.TEMP_DIR_BASE, exist_ok=True)
+        self.work_dir = tempfile.mkdtemp(prefix="http-", dir=config.TEMP_DIR_BASE)
+        self._in_use = storage.in_use(self.work_dir)
+        self._in_use.__enter__()
+
+    def write_json(self, status: int, payload: dict):
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps(payload))
+
+    def write_error(self, status_code: int, **kwargs):
+        message = self._reason
+        if "exc_info" in kwargs and isinstance(kwargs["exc_info"][1], tornado.web.HTTPError):
+            message = kwargs["exc_info"][1].log_message or message
+        self.write_json(status_code, {'error': message, 'request_id': getattr(self, 'request_id', None)})
+
+    def param(self, name: str, default, cast=str):
+        """ Query argument converted with cast; a bad value is a 400, not a 500. """
+        value = self.get_query_argument(name, None)
+        if value is None:
+            return default
+        try:
+            return cast(value)
+        except ValueError:
+            raise tornado.web.HTTPError(400, f"Invalid value for {name}: {value!r}")
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Runs func on the processing pool under this request's correlation ID. If the client hung up
+        meanwhile, the request ends here (nothing to send); its slot and work dir were kept until now.
+        """
+        def call():
+            with metrics.correlation(self.request_id):
+                return func(*args, **kwargs)
+        self.running += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.service.executor, call)
+        finally:
+            self.running -= 1
+        if self.disconnected:
+            raise tornado.web.Finish()
+        return result
+
+    async def stream_file(self, path: str, download_name: str | None = None):
+        """ Sends a file in SERVER_CHUNK_BYTES chunks, waiting for each to reach the socket. """
+        mime = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.set_header("Content-Type", mime)
+        self.set_header("Content-Length", str(os.path.getsize(path)))
+        self.set_header("Content-Disposition", f'attachment; filename="{download_name or os.path.basename(path)}"')
+        with open(path, "rb") as f:
+            while chunk := f.read(config.SERVER_CHUNK_BYTES):
+                self.write(chunk)
+                await self.flush()
+
+    async def stream_bytes(self, data: bytes, download_name: str, mime: str = "audio/wav"):
+        self.set_header("Content-Type", mime)
+        self.set_header("Content-Length", str(len(data)))
+        self.set_header("Content-Disposition", f'attachment; filename="{download_name}"')
+        view = memoryview(data)
+        for start in range(0, len(view), config.SERVER_CHUNK_BYTES):
+            self.write(bytes(view[start:start + config.SERVER_CHUNK_BYTES]))
+            await self.flush()
+
+    async def send_result(self, result: dict, download_name: str):
+        """ Streams a processing result dict (output_path or audio_bytes), or reports its failure as 422. """
+        if not result.get('success'):
+            self.write_json(422, {'error': result.get('message'), 'request_id': self.request_id})
+            return
+        if result.get('silence'):
+            self.set_header("X-Silence-Savings", str(result['silence']['savings']))
+        if result.get('output_path'):
+            await self.stream_file(result['output_path'], download_name)
+        else:
+            await self.stream_bytes(result['audio_bytes'], download_name)
+
+    def on_finish(self):
+        self._cleanup()
+        status = self.get_status()
+        metrics.inc("http_requests_total", endpoint=self.endpoint, status=str(status))
+        metrics.observe("http_request_seconds", self.request.request_time(), endpoint=self.endpoint)
+
+    def on_connection_close(self):
+        # Client went away mid-upload or mid-response. A running job still holds its admission slot and
+        # uses the work dir, so then both are only released in on_finish, once run() returns.
+        self.disconnected = True
+        if not self.running:
+            self._cleanup()
+
+    def _cleanup(self):
+        if self.admitted:
+            self.admitted = False
+            self.service.release()
+        if self.work_dir is not None:
+            self._in_use.__exit__(None, None, None)
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+            self.work_dir = None
+
+
+@tornado.web.stream_request_body
+class UploadHandler(BaseHandler, abc.ABC):
+    """ Streams the request body to a file in the request's work dir, then calls process(path). """
+    admitted_only = True
+
+    def prepare(self):
+        super().prepare()
+        if self._finished:
+            return
+        self.request.connection.set_max_body_size(config.SERVER_MAX_UPLOAD_BYTES)
+        filename = os.path.basename(self.get_query_argument("filename", "") or "upload")
+        content_type = self.request.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        suffix = os.path.splitext(filename)[1] or UPLOAD_SUFFIXES.get(content_type, ".wav")
+        self.upload_name = os.path.splitext(filename)[0] or "upload"
+        self.upload_path = os.path.join(self.work_dir, "input" + suffix)
+        self.upload_bytes = 0
+        self._upload = open(self.upload_path, "wb")
+
+    def data_received(self, chunk: bytes):
+        if self._finished: # Rejected in prepare()
+            return
+        self._upload.write(chunk)
+        self.upload_bytes += len(chunk)
+
+    async def post(self):
+        self._upload.close()
+        if not self.upload_bytes:
+            raise tornado.web.HTTPError(400, "Empty request body: send the audio file as the body")
+        metrics.inc("http_upload_bytes_total", self.upload_bytes, endpoint=self.endpoint)
+        await self.process(self.upload_path)
+
+    def _cleanup(self):
+        if getattr(self, '_upload', None) is not None:
+            self._upload.close()
+        super()._cleanup()
+
+    def silence_fill(self) -> str:
+        fill = self.param("silence_fill", config.SILENCE_FILL)
+        if fill not in silence.FILLS:
+            raise tornado.web.HTTPError(400, f"Unknown silence_fill {fill!r}")
+        return fill
+
+    def noise_profile(self) -> str | None:
+        """ Name of a stored noise profile (never a path: clients can't point the server at arbitrary files). """
+        name = self.param("noise_profile", config.NOISE_PROFILE)
+        if name is None:
+            return None
+        try:
+            path = noise_profiles.profile_path(name)
+        except ValueError as e:
+            raise tornado.web.HTTPError(400, str(e))
+        if not os.path.exists(path):
+            raise tornado.web.HTTPError(400, f"Unknown noise profile {name!r}")
+        return name
+
+    @abc.abstractmethod
+    async def process(self, path: str):
+        """ Processes the uploaded file at path and sends the response; each endpoint implements it. """
+
+
+class SeparateHandler(UploadHandler):
+    endpoint = "separate"
+
+    async def process(self, path: str):
+        model = self.param("model", None)
+        stems = self.param("stems", config.DEFAULT_DEMUCS_STEMS)
+        stem = self.param("stem", "vocals")
+        profile = self.param("profile", config.DEMUCS_PROFILE)
+        if profile != "auto" and profile not in config.DEMUCS_PROFILES:
+            raise tornado.web.HTTPError(400, f"Unknown profile {profile!r}")
+        result = await self.run(processing.separate_audio_with_demucs, path, self.work_dir, model, stems,
+                                profile=profile, skip_silence=self.param("skip_silence", config.SKIP_SILENCE, _flag),
+                                silence_fill=self.silence_fill())
+        if result.get('success') and stem not in result['output_paths']:
+            self.write_json(404, {'error': f"No stem '{stem}'", 'stems': sorted(result['output_paths'])})
+            return
+        if result.get('success'):
+            result = {'success': True, 'output_path': result['output_paths'][stem], 'silence': result.get('silence')}
+        ext = os.path.splitext(result.get('output_path') or ".wav")[1]
+        await self.send_result(result, f"{self.upload_name}_{stem}{ext}")
+
+
+class DenoiseHandler(UploadHandler):
+    endpoint = "denoise"
+
+    async def process(self, path: str):
+        result = await self.run(processing.adaptive_noise_reduction, path,
+                                self.param("noise_duration_sec", config.DEFAULT_NOISE_PROFILE_SEC, float),
+                                self.param("noise_floor", config.DEFAULT_NOISE_FLOOR, float),
+                                output_file=os.path.join(self.work_dir, "output.wav"),
+                                skip_silence=self.param("skip_silence", config.SKIP_SILENCE, _flag),
+                                silence_fill=self.silence_fill(), noise_profile=self.noise_profile())
+        await self.send_result(result, f"{self.upload_name}_noise_reduced.wav")
+
+
+class NormalizeHandler(UploadHandler):
+    endpoint = "normalize"
+
+    async def process(self, path: str):
+        result = await self.run(processing.loudness_normalization, path,
+                                self.param("target_lufs", config.DEFAULT_TARGET_LUFS, float),
+                                output_file=os.path.join(self.work_dir, "output.wav"),
+                                true_peak_limit=self.param("true_peak_limit", config.TRUE_PEAK_LIMIT_DBTP, float))
+        await self.send_result(result, f"{self.upload_name}_normalized.wav")
+
+
+class YouTubeHandler(BaseHandler):
+    endpoint = "youtube"
+    admitted_only = True
+
+    async def post(self):
+        url = self.get_query_argument("url", None)
+        if url is None and self.request.body:
+            try:
+                url = json.loads(self.request.body).get("url")
+            except (ValueError, AttributeError):
+                raise tornado.web.HTTPError(400, "Body must be JSON like {\"url\": \"...\"}")
+        if not url:
+            raise tornado.web.HTTPError(400, "Missing url")
+        from src import youtube
+        native = self.param("native", config.YOUTUBE_NATIVE_AUDIO, _flag)
+        result = await self.run(youtube.download_audio_yt_dlp, url, config.YOUTUBE_OUTPUT_DIR, native)
+        if not result['success']:
+            self.write_json(422, {'error': result['message'], 'request_id': self.request_id})
+            return
+        with storage.in_use(result['file_path']): # The store's copy; only protected while we send it
+            await self.stream_file(result['file_path'])
+
+
+class HealthHandler(BaseHandler):
+    endpoint = "health"
+
+    def get(self):
+        self.write_json(200, self.service.status())
+
+
+class ReadyHandler(BaseHandler):
+    endpoint = "ready"
+
+    def get(self):
+        status = self.service.status()
+        if status['status'] != "ok":
+            self.set_header("Retry-After", str(config.SERVER_RETRY_AFTER_SEC))
+        self.write_json(200 if status['status'] == "ok" else 503, status)
+
+
+class MetricsHandler(BaseHandler):
+    endpoint = "metrics"
+
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(metrics.registry.render())
+
+
+def _log_request(handler: tornado.web.RequestHandler):
+    """ Access log line (replaces tornado's) carrying the request ID; probes only at debug level. """
+    status = handler.get_status()
+    if getattr(handler, 'endpoint', None) in ("health", "ready", "metrics") and status < 500:
+        log = logger.debug
+    else:
+        log = logger.info if status < 400 else logger.warning if status < 500 else logger.error
+    log(f"{status} {handler.request.method} {handler.request.uri} {1000 * handler.request.request_time():.0f}ms "
+        f"[{getattr(handler, 'request_id', '-')}]")
+
+
+def make_app(service: Service) -> tornado.web.Application:
+    args = {'service': service}
+    return tornado.web.Application([
+        (r"/v1/separate", SeparateHandler, args),
+        (r"/v1/denoise", DenoiseHandler, args),
+        (r"/v1/normalize", NormalizeHandler, args),
+        (r"/v1/youtube", YouTubeHandler, args),
+        (r"/health", HealthHandler, args),
+        (r"/ready", ReadyHandler, args),
+        (r"/metrics", MetricsHandler, args),
+    ], log_function=_log_request)
+
+
+async def serve(host: str = config.SERVER_HOST, port: int = config.SERVER_PORT,
+                workers: int = config.SERVER_WORKERS, max_active: int = config.SERVER_MAX_ACTIVE):
+    """ Runs the server until SIGINT/SIGTERM, then drains running requests (up to SERVER_DRAIN_TIMEOUT_SEC). """
+    config.ensure_dirs()
+    service = Service(workers, max_active)
+    server = make_app(service).listen(port, address=host, max_body_size=config.SERVER_MAX_UPLOAD_BYTES)
+    storage.start_janitor()
+    warmup.start_warmup()
+    logger.info(f"Vocalizer API listening on {host}:{port} ({workers} workers, admission limit {max_active})")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    logger.info(f"Shutting down: draining {service.active} active requests")
+    service.draining = True
+    server.stop()
+    deadline = time.monotonic() + config.SERVER_DRAIN_TIMEOUT_SEC
+    while service.active and time.monotonic() < deadline:
+        await asyncio.sleep(0.2)
+    await server.close_all_connections()
+    service.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Serve the Vocalizer processing API over HTTP.")
+    parser.add_argument("--host", default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=config.SERVER_WORKERS, help="Processing threads")
+    parser.add_argument("--max-active", type=int, default=config.SERVER_MAX_ACTIVE,
+                        help="Requests uploading or processing at once before answering 429")
+    args = parser.parse_args(argv)
+    asyncio.run(serve(args.host, args.port, max(1, args.workers), max(1, args.max_active)))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    metrics.configure_logging()
+    raise SystemExit(main())
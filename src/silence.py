@@ -0,0 +1,169 @@
+# src/silence.py
+# Silence-aware partitioning for the heavy stages. Frame RMS over the whole signal (vectorised, a chunk
+# of frames at a time, so a memory-mapped ingest entry is never loaded whole) marks the active regions.
+# Demucs and noise reduction then run on those regions only, and their output is put back on the
+# original timeline with the dead air in between zeroed or passed through unchanged.
+import math
+import logging
+import numpy as np
+from src import config, metrics
+
+logger = logging.getLogger(__name__)
+
+SILENCE_AMPLITUDE = 1e-5 # Peak below which a buffer counts as digital silence
+FILLS = ("zero", "passthrough")
+CHUNK_FRAMES = 4096 # RMS frames computed per vectorised step
+
+
+def is_silent(y: np.ndarray) -> bool:
+    """ True if no sample of y reaches SILENCE_AMPLITUDE (an empty buffer is silent). """
+    return float(np.max(np.abs(y), initial=0.0)) < SILENCE_AMPLITUDE
+
+
+def frame_rms(y: np.ndarray, frame_length: int) -> np.ndarray:
+    """
+    RMS of consecutive, non-overlapping frames of a mono (samples,) or (channels, samples) signal,
+    averaged over the channels. A trailing partial frame is zero-padded.
+    """
+    total = y.shape[-1]
+    rms = np.empty(-(-total // frame_length), dtype=np.float32)
+    step = CHUNK_FRAMES * frame_length
+    for start in range(0, total, step):
+        chunk = np.asarray(y[..., start:start + step], dtype=np.float32)
+        count = -(-chunk.shape[-1] // frame_length)
+        short = count * frame_length - chunk.shape[-1]
+        if short:
+            chunk = np.pad(chunk, [(0, 0)] * (chunk.ndim - 1) + [(0, short)])
+        power = np.mean(np.square(chunk.reshape(*chunk.shape[:-1], count, frame_length)), axis=-1)
+        if power.ndim > 1:
+            power = power.mean(axis=0)
+        first = start // frame_length
+        rms[first:first + count] = np.sqrt(power)
+    return rms
+
+
+def _bridge(starts: np.ndarray, ends: np.ndarray, min_gap: int) -> tuple[np.ndarray, np.ndarray]:
+    """ Merges neighbouring runs separated by fewer than min_gap frames. """
+    keep = starts[1:] - ends[:-1] >= min_gap
+    return starts[np.concatenate(([True], keep))], ends[np.concatenate((keep, [True]))]
+
+
+def active_runs(active: np.ndarray, min_gap: int, pad: int) -> np.ndarray:
+    """
+    (start, end) frame pairs of the runs of True in `active`. Gaps shorter than min_gap frames are
+    bridged, and every run is widened by pad frames on both sides (merging runs that then touch).
+    """
+    edges = np.diff(np.concatenate(([0], active.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    if not len(starts):
+        return np.empty((0, 2), dtype=np.int64)
+    starts, ends = _bridge(starts, ends, max(1, min_gap))
+    starts, ends = _bridge(np.maximum(starts - pad, 0), np.minimum(ends + pad, len(active)), 1)
+    return np.stack([starts, ends], axis=1).astype(np.int64)
+
+
+class Partition:
+    """
+    Active regions of a signal as (start, end) sample pairs on its own timeline, with helpers to
+    cut them out and to put processed regions back.
+    """
+
+    def __init__(self, regions: np.ndarray, total: int, sample_rate: int):
+        self.regions = regions
+        self.total = total
+        self.sample_rate = sample_rate
+
+    @property
+    def active_samples(self) -> int:
+        return int(np.sum(self.regions[:, 1] - self.regions[:, 0]))
+
+    @property
+    def savings(self) -> float:
+        """ Fraction of the samples the heavy stages don't have to process. """
+        return 1.0 - self.active_samples / self.total if self.total else 0.0
+
+    def worthwhile(self, min_savings: float = config.SILENCE_MIN_SAVINGS) -> bool:
+        """ Whether skipping saves enough to be worth splitting the input up. """
+        return self.savings >= min_savings
+
+    def split(self, y: np.ndarray) -> list[np.ndarray]:
+        """ The active regions of y (views along the last axis). """
+        return [y[..., start:end] for start, end in self.regions]
+
+    def compact(self, y: np.ndarray) -> np.ndarray:
+        """ The active regions of y back to back, as one contiguous buffer. """
+        if not len(self.regions):
+            return np.asarray(y[..., :0], dtype=np.float32)
+        return np.concatenate([np.asarray(part, dtype=np.float32) for part in self.split(y)], axis=-1)
+
+    def join(self, parts: list[np.ndarray], out: np.ndarray, ratio: float = 1.0) -> np.ndarray:
+        """
+        Writes processed regions into `out` (which holds the fill for the skipped samples) at their
+        original positions. ratio = output rate / input rate for stages that resample.
+        """
+        for (start, _), part in zip(self.regions, parts):
+            lo = int(round(start * ratio))
+            n = min(part.shape[-1], out.shape[-1] - lo)
+            out[..., lo:lo + n] = part[..., :n]
+        return out
+
+    def expand(self, compacted: np.ndarray, out: np.ndarray, ratio: float = 1.0) -> np.ndarray:
+        """ Inverse of compact(): spreads a processed compacted buffer over `out` (see join()). """
+        bounds = np.round(np.cumsum(self.regions[:, 1] - self.regions[:, 0]) * ratio).astype(np.int64)
+        return self.join(np.split(compacted, bounds[:-1], axis=-1), out, ratio)
+
+    def report(self) -> dict:
+        return {'regions': len(self.regions), 'processed_samples': self.active_samples, 'total_samples': self.total,
+                'processed_fraction': round(1.0 - self.savings, 4), 'savings': round(self.savings, 4)}
+
+
+def partition(y: np.ndarray, sr: int,
+              threshold_dbfs: float = config.SILENCE_THRESHOLD_DBFS,
+              min_silence_sec: float = config.SILENCE_MIN_SEC,
+              pad_sec: float = config.SILENCE_PAD_SEC,
+              frame_sec: float = config.SILENCE_FRAME_SEC) -> Partition:
+    """
+    Finds the active regions of a mono or (channels, samples) signal: frames whose RMS reaches
+    threshold_dbfs (and never less than SILENCE_AMPLITUDE), with pauses shorter than min_silence_sec
+    kept inside their region and pad_sec of context added around each one.
+    """
+    total = y.shape[-1]
+    frame = max(1, int(frame_sec * sr))
+    with metrics.timer("silence_partition") as timing:
+        timing.audio_sec = total / sr
+        active = frame_rms(y, frame) >= max(10.0 ** (threshold_dbfs / 20.0), SILENCE_AMPLITUDE)
+        runs = active_runs(active, math.ceil(min_silence_sec * sr / frame), math.ceil(pad_sec * sr / frame))
+        regions = np.minimum(runs * frame, total)
+    result = Partition(regions, total, sr)
+    logger.info(f"Found {len(regions)} active region(s) covering {1.0 - result.savings:.1%} of {total / sr:.1f}s")
+    return result
+
+
+def partition_for_skipping(y: np.ndarray, sr: int, min_savings: float = config.SILENCE_MIN_SAVINGS) -> Partition | None:
+    """ partition(y, sr) if skipping its silence saves at least min_savings of the samples, else None. """
+    part = partition(y, sr)
+    if not part.worthwhile(min_savings):
+        logger.info(f"Only {part.savings:.1%} of the input is silence; processing all of it")
+        return None
+    return part
+
+
+def check_fill(fill: str):
+    if fill not in FILLS:
+        raise ValueError(f"Unknown silence fill '{fill}'. Choose from: {', '.join(FILLS)}")
+
+
+def fill_like(y: np.ndarray, fill: str) -> np.ndarray:
+    """ Writable float32 output buffer for y: a copy ('passthrough') or zeros ('zero'). """
+    check_fill(fill)
+    if fill == "passthrough":
+        return np.array(y, dtype=np.float32)
+    return np.zeros(y.shape, dtype=np.float32)
+
+
+def record(part: Partition, stage: str) -> dict:
+    """ Counts the skipped audio for `stage` in the metrics and returns part.report(). """
+    skipped_sec = (part.total - part.active_samples) / part.sample_rate
+    metrics.inc("silence_skipped_seconds_total", skipped_sec, stage=stage)
+    logger.info(f"{stage}: skipped {skipped_sec:.1f}s of silence ({part.savings:.1%} of the input)")
+    return part.report()
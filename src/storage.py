@@ -0,0 +1,289 @@
+# src/storage.py
+# Disk quota manager for the output and temp directories. Each managed directory has a size and an
+# age quota (see config.STORAGE_QUOTAS); the janitor deletes whole entries (a file, or a track
+# directory for Demucs) in least-recently-used order until both quotas hold again. An entry's last use
+# is the latest access or modification time of its files, or the download store's last_access for
+# indexed YouTube downloads (file atimes are often not updated on noatime/relatime mounts).
+# Files are protected while they are in use: registered through in_use() by any process sharing the
+# directory, used within the last config.STORAGE_MIN_AGE_SEC, or still being written (atomic_path() temp names).
+import os
+import time
+import uuid
+import shutil
+import logging
+import threading
+import contextlib
+from src import config, store
+
+logger = logging.getLogger(__name__)
+
+PART_PREFIX = ".~part-" # Temp names used by atomic_path(); only removed once orphaned
+
+
+# --- Protection ---
+
+@contextlib.contextmanager
+def in_use(path: str):
+    """
+    Marks path (a file or directory) as in use so the janitor never removes it or its parents' entry.
+    The mark is a small file in config.IN_USE_DIR naming path and this process, so janitors in other
+    processes (the app, the API server, batch runs) respect it too.
+    """
+    os.makedirs(config.IN_USE_DIR, exist_ok=True)
+    marker = os.path.join(config.IN_USE_DIR, f"{os.getpid()}-{uuid.uuid4().hex[:8]}")
+    with open(marker, "w", encoding="utf-8") as f:
+        f.write(os.path.abspath(path))
+    try:
+        yield path
+    finally:
+        try:
+            os.remove(marker)
+        except OSError as e:
+            logger.warning(f"Could not remove in-use marker {marker}: {e}")
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        return True # No harmless liveness probe on Windows; clear_orphans() ages these markers out instead
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass # Alive, owned by another user
+    return True
+
+
+def _markers():
+    """ Yields (marker path, owning pid, marked abs path) for every in-use marker on disk. """
+    try:
+        scanned = list(os.scandir(config.IN_USE_DIR))
+    except OSError:
+        return
+    for entry in scanned:
+        try:
+            pid = int(entry.name.split("-", 1)[0])
+            with open(entry.path, "r", encoding="utf-8") as f:
+                marked = f.read()
+        except (OSError, ValueError):
+            continue # Removed meanwhile, or not ours
+        yield entry.path, pid, marked
+
+
+def _is_in_use(entry_path: str) -> bool:
+    """ True if entry_path or anything below it is marked through in_use() by a live process. """
+    prefix = os.path.abspath(entry_path)
+    return any((marked == prefix or marked.startswith(prefix + os.sep)) and _pid_alive(pid)
+               for _, pid, marked in _markers())
+
+
+@contextlib.contextmanager
+def atomic_path(final_path: str):
+    """
+    Yields a temp path next to final_path (same extension, so soundfile still infers the format) and
+    renames it into place once the block succeeds. Readers and the janitor never see a half-written file.
+    """
+    directory, name = os.path.split(final_path)
+    os.makedirs(directory or ".", exist_ok=True)
+    temp_path = os.path.join(directory, f"{PART_PREFIX}{uuid.uuid4().hex[:8]}-{name}")
+    try:
+        yield temp_path
+        os.replace(temp_path, final_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+# --- Scanning ---
+
+def _last_used(st: os.stat_result) -> float:
+    return max(st.st_atime, st.st_mtime)
+
+
+def _entry_stats(path: str) -> tuple[float, int]:
+    """ (latest file access/modification time, total bytes) of a file or a directory tree (empty dirs use their own). """
+    if not os.path.isdir(path):
+        st = os.stat(path)
+        return _last_used(st), st.st_size
+    latest, total = None, 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            latest = _last_used(st) if latest is None else max(latest, _last_used(st))
+            total += st.st_size
+    return (_last_used(os.stat(path)) if latest is None else latest), total
+
+
+def _indexed_access(quota: dict) -> dict:
+    """ {abs path: last_access} from the download store index in the quota's directory, if it has one. """
+    if not quota.get('index') or not os.path.exists(os.path.join(quota['path'], quota['index'])):
+        return {}
+    try:
+        return store.get_store(quota['path']).last_access()
+    except Exception as e:
+        logger.warning(f"Could not read the download index in {quota['path']}: {e}")
+        return {}
+
+
+def _entries(quota: dict):
+    """ Yields (path, last_used, size) for the eviction units of a quota: children at quota['depth']. """
+    level = [quota['path']]
+    for depth in range(1, quota['depth'] + 1):
+        children = []
+        for directory in level:
+            try:
+                scanned = list(os.scandir(directory))
+            except OSError:
+                continue
+            # Intermediate levels (e.g. output_demucs/<model>) are only descended into, never removed
+            children += [e.path for e in scanned
+                         if e.name not in quota['exclude'] and (e.is_dir() or depth == quota['depth'])]
+        level = children
+    indexed = _indexed_access(quota)
+    for path in level:
+        try:
+            last_used, size = _entry_stats(path)
+        except OSError:
+            continue
+        yield path, max(last_used, indexed.get(os.path.abspath(path), 0)), size
+
+
+def _remove(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+# --- Sweeping ---
+
+def sweep(name: str, quota: dict, now: float | None = None) -> dict:
+    """
+    Enforces one quota: first drops entries unused for longer than max_age_sec, then the least recently used
+    ones until the directory fits in max_bytes (0 disables either limit). Returns what was removed.
+    """
+    now = now or time.time()
+    removed, freed = 0, 0
+    entries = sorted(_entries(quota), key=lambda entry: entry[1]) if os.path.isdir(quota['path']) else []
+    total = sum(size for _, _, size in entries)
+    for path, last_used, size in entries:
+        age = now - last_used
+        too_old = quota['max_age_sec'] and age > quota['max_age_sec']
+        too_big = quota['max_bytes'] and total > quota['max_bytes']
+        if not (too_old or too_big):
+            continue
+        partial = os.path.basename(path).startswith(PART_PREFIX)
+        if age < (config.STORAGE_ORPHAN_AGE_SEC if partial else config.STORAGE_MIN_AGE_SEC) or _is_in_use(path):
+            continue # Still being written or read
+        try:
+            _remove(path)
+        except OSError as e:
+            logger.warning(f"Could not remove {path}: {e}")
+            continue
+        removed += 1
+        freed += size
+        total -= size
+    if removed:
+        logger.info(f"Storage sweep of {name}: removed {removed} entries ({freed} bytes), {total} bytes left")
+    return {'removed': removed, 'freed_bytes': freed, 'bytes': total}
+
+
+def sweep_all() -> dict:
+    """ Sweeps every configured directory. Returns {name: sweep result}. """
+    return {name: sweep(name, quota) for name, quota in config.STORAGE_QUOTAS.items()}
+
+
+def usage() -> dict:
+    """ Current size, entry count and quotas of every managed directory. """
+    stats = {}
+    for name, quota in config.STORAGE_QUOTAS.items():
+        entries = list(_entries(quota)) if os.path.isdir(quota['path']) else []
+        stats[name] = {'path': quota['path'], 'entries': len(entries), 'bytes': sum(size for _, _, size in entries),
+                       'max_bytes': quota['max_bytes'], 'max_age_sec': quota['max_age_sec']}
+    return stats
+
+
+def clear_orphans(max_age: float | None = None) -> int:
+    """
+    Removes leftovers of crashed runs from the temp dir: uploads, Demucs scratch dirs and half-written
+    ingest/cache files older than max_age (default config.STORAGE_ORPHAN_AGE_SEC), and in-use markers
+    of processes that have exited. Returns the count.
+    """
+    max_age = config.STORAGE_ORPHAN_AGE_SEC if max_age is None else max_age
+    cutoff = time.time() - max_age
+    candidates = []
+    if os.path.isdir(config.TEMP_DIR_BASE):
+        kept = {os.path.abspath(config.INGEST_DIR), os.path.abspath(config.IN_USE_DIR)}
+        candidates += [e.path for e in os.scandir(config.TEMP_DIR_BASE) if os.path.abspath(e.path) not in kept]
+    if os.path.isdir(config.INGEST_DIR):
+        candidates += [e.path for e in os.scandir(config.INGEST_DIR) if e.name.endswith(".part")]
+    if os.path.isdir(config.CACHE_DIR):
+        candidates += [e.path for e in os.scandir(config.CACHE_DIR) if e.name.startswith(".staging-")]
+
+    for marker, pid, _ in _markers():
+        try:
+            if not _pid_alive(pid) or (os.name == "nt" and os.path.getmtime(marker) < cutoff):
+                os.remove(marker)
+        except OSError:
+            pass
+
+    removed = 0
+    for path in candidates:
+        try:
+            if _entry_stats(path)[0] > cutoff or _is_in_use(path):
+                continue
+            _remove(path)
+            removed += 1
+        except OSError as e:
+            logger.warning(f"Could not remove orphaned {path}: {e}")
+    if removed:
+        logger.info(f"Removed {removed} orphaned temp entries")
+    return removed
+
+
+# --- Background janitor ---
+
+class Janitor:
+    """ Daemon thread that runs sweep_all() every `interval` seconds. """
+
+    def __init__(self, interval: float = config.STORAGE_SWEEP_INTERVAL_SEC):
+        self.interval = interval
+        self.last_run = None
+        self.last_result = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="vocalizer-janitor", daemon=True)
+
+    def start(self) -> "Janitor":
+        self._thread.start()
+        logger.info(f"Storage janitor started (every {self.interval:.0f}s)")
+        return self
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.last_result = sweep_all()
+                self.last_run = time.time()
+            except Exception as e:
+                logger.error(f"Storage sweep failed: {e}", exc_info=True)
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+
+
+_janitor = None
+_janitor_lock = threading.Lock()
+
+
+def start_janitor() -> Janitor:
+    """ Starts the process-wide janitor once; later calls return the running one. """
+    global _janitor
+    with _janitor_lock:
+        if _janitor is None:
+            _janitor = Janitor().start()
+        return _janitor
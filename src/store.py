@@ -0,0 +1,116 @@
+# src/store.py
+# Video-ID keyed store for YouTube downloads. A small SQLite index records what is already on disk,
+# so a repeat request is answered from the index before yt-dlp is even constructed.
+import os
+import time
+import sqlite3
+import logging
+import threading
+from src import config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS downloads (
+    video_id    TEXT PRIMARY KEY,
+    path        TEXT NOT NULL,
+    duration    REAL,
+    format      TEXT,
+    size        INTEGER NOT NULL,
+    fetched_at  REAL NOT NULL,
+    last_access REAL NOT NULL
+)
+"""
+
+
+class DownloadStore:
+    """
+    Index of downloaded audio keyed by YouTube video ID.
+    With max_bytes set, the least-recently-used downloads are deleted once the store grows past it.
+    Safe to share between threads and processes (each call opens its own short-lived connection).
+    """
+
+    def __init__(self, output_dir: str = config.YOUTUBE_OUTPUT_DIR, max_bytes: int = config.YOUTUBE_STORE_MAX_BYTES):
+        self.output_dir = output_dir
+        self.db_path = os.path.join(output_dir, config.YOUTUBE_INDEX_FILENAME)
+        self.max_bytes = max_bytes
+        os.makedirs(output_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def lookup(self, video_id: str) -> dict | None:
+        """ Returns the index row for video_id (and marks it used), or None if unknown or the file is gone. """
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM downloads WHERE video_id = ?", (video_id,)).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(row['path']):
+                logger.warning(f"Indexed file for {video_id} is missing, dropping index entry: {row['path']}")
+                conn.execute("DELETE FROM downloads WHERE video_id = ?", (video_id,))
+                return None
+            conn.execute("UPDATE downloads SET last_access = ? WHERE video_id = ?", (time.time(), video_id))
+            return dict(row)
+
+    def record(self, video_id: str, path: str, duration: float | None = None, fmt: str | None = None):
+        """ Adds or replaces the entry for video_id, then enforces the size cap. """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO downloads (video_id, path, duration, format, size, fetched_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (video_id, path, duration, fmt, os.path.getsize(path), now, now),
+            )
+        self.evict(keep=video_id)
+
+    def evict(self, keep: str | None = None):
+        """ Deletes least-recently-used downloads until the store fits in max_bytes (no-op without a cap). """
+        if not self.max_bytes:
+            return
+        with self._connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM downloads").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for row in conn.execute("SELECT video_id, path, size FROM downloads ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                if row['video_id'] == keep:
+                    continue
+                try:
+                    if os.path.exists(row['path']):
+                        os.remove(row['path'])
+                except OSError as e:
+                    logger.warning(f"Could not evict {row['path']}: {e}")
+                    continue
+                conn.execute("DELETE FROM downloads WHERE video_id = ?", (row['video_id'],))
+                total -= row['size']
+                logger.info(f"Evicted download {row['video_id']} ({row['size']} bytes)")
+
+    def last_access(self) -> dict:
+        """ {abs path: last_access} for every indexed download, for the storage janitor's LRU order. """
+        with self._connect() as conn:
+            rows = conn.execute("SELECT path, last_access FROM downloads").fetchall()
+        return {os.path.abspath(row['path']): row['last_access'] for row in rows}
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM downloads").fetchone()
+        return {'entries': count, 'bytes': total, 'max_bytes': self.max_bytes}
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(output_dir: str = config.YOUTUBE_OUTPUT_DIR) -> DownloadStore:
+    """ One store per output directory, created on first use. """
+    key = os.path.abspath(output_dir)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = DownloadStore(output_dir)
+        return _stores[key]
@@ -0,0 +1,199 @@
+# src/streaming.py
+# Block-wise versions of the processing stages for recordings too long to hold in memory.
+# Everything here reads block by block from the memory-mapped ingest entry (src/ingest.py) and
+# writes straight to an output file, so peak memory depends on the block size, not on the input length.
+import os
+import logging
+import numpy as np
+import soundfile as sf
+from numpy.lib.stride_tricks import sliding_window_view
+from src import config, ingest, loudness, noise_profiles, silence, spectral
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOCK_SIZE = 1 << 16 # Samples read per block
+
+
+class OverlapAdd:
+    """
+    Streaming STFT -> per-frame processing -> inverse STFT with overlap-add.
+
+    Frames follow librosa.stft(center=True, pad_mode='constant'), and the output is normalised by
+    the summed squared window exactly like librosa.istft, so feeding the whole signal through
+    push()/finish() yields the same samples as the in-memory round trip.
+    """
+
+    def __init__(self, process_frames, n_fft: int = 2048, hop_length: int = 512):
+        self.process_frames = process_frames # callable: complex spectra (frames, bins) -> processed spectra
+        self.engine = spectral.get_engine(n_fft, hop_length)
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self._pad = n_fft // 2
+        self._pending = np.zeros(self._pad, dtype=np.float32) # Input not yet consumed by a full frame
+        self._ola = np.zeros(0, dtype=np.float32) # Overlap-add numerator, aligned with _pending
+        self._wss = np.zeros(0, dtype=np.float32) # Summed squared window, aligned with _pending
+        self._to_skip = self._pad # Leading padded samples that are not part of the output
+
+    def _run_frames(self, final: bool) -> np.ndarray:
+        n_fft, hop = self.n_fft, self.hop_length
+        if len(self._pending) < n_fft:
+            n_frames = 0
+        else:
+            n_frames = 1 + (len(self._pending) - n_fft) // hop
+        span = (n_frames - 1) * hop + n_fft if n_frames else 0
+        ola = np.zeros(max(span, len(self._ola)), dtype=np.float32)
+        wss = np.zeros_like(ola)
+        ola[:len(self._ola)] += self._ola
+        wss[:len(self._wss)] += self._wss
+
+        if n_frames:
+            frames = sliding_window_view(self._pending, n_fft)[::hop][:n_frames] * self.engine.window
+            spectra = self.process_frames(self.engine.rfft(frames))
+            frames_out = self.engine.irfft(spectra).astype(np.float32, copy=False)
+            frames_out *= self.engine.window
+            self.engine.overlap_add(frames_out, ola, wss)
+
+        # Samples before the next frame start can't receive any more contributions
+        done = len(ola) if final else n_frames * hop
+        out = ola[:done]
+        norm = wss[:done]
+        np.divide(out, norm, out=out, where=norm > spectral.TINY)
+
+        self._ola = ola[done:]
+        self._wss = wss[done:]
+        self._pending = self._pending[n_frames * hop:]
+
+        if self._to_skip:
+            skipped = min(self._to_skip, len(out))
+            out = out[skipped:]
+            self._to_skip -= skipped
+        return out
+
+    def push(self, samples: np.ndarray) -> np.ndarray:
+        """ Feeds mono samples; returns the output samples that are now final. """
+        self._pending = np.concatenate([self._pending, samples.astype(np.float32, copy=False)])
+        return self._run_frames(final=False)
+
+    def finish(self) -> np.ndarray:
+        """ Flushes the trailing padding and returns the remaining output samples. """
+        self._pending = np.concatenate([self._pending, np.zeros(self._pad, dtype=np.float32)])
+        return self._run_frames(final=True)
+
+
+def _write_span(out: sf.SoundFile, y: np.ndarray, start: int, end: int, fill: str, block_size: int):
+    """ Writes y[start:end] unchanged ('passthrough') or as zeros ('zero'), block by block. """
+    for lo in range(start, end, block_size):
+        hi = min(lo + block_size, end)
+        out.write(np.asarray(y[lo:hi]) if fill == "passthrough" else np.zeros(hi - lo, dtype=np.float32))
+
+
+def stream_noise_reduction(input_file: str, output_file: str,
+                           noise_duration_sec: float = config.DEFAULT_NOISE_PROFILE_SEC,
+                           noise_floor: float = config.DEFAULT_NOISE_FLOOR,
+                           n_fft: int = 2048, hop_length: int = 512,
+                           block_size: int = DEFAULT_BLOCK_SIZE,
+                           skip_silence: bool = False,
+                           silence_fill: str = config.SILENCE_FILL,
+                           noise_profile: "noise_profiles.NoiseProfile | None" = None) -> dict:
+    """
+    Spectral-subtraction noise reduction in constant memory.
+    Same algorithm and output (mono, 16-bit WAV) as processing.adaptive_noise_reduction,
+    but reads the input block by block and writes the result straight to output_file.
+    With skip_silence, only the active regions (src/silence.py) are denoised, each as its own
+    stream; the samples between them are written as silence_fill.
+    A stored noise_profile (src/noise_profiles.py) replaces the lead-in estimate and sets n_fft / hop_length.
+    """
+    silence.check_fill(silence_fill)
+    y, sr = ingest.load_audio(input_file, mono=True)
+    total = len(y)
+
+    if noise_profile is not None:
+        noise_profile.check_rate(sr)
+        n_fft, hop_length = noise_profile.n_fft, noise_profile.hop_length
+        lead_in = None
+    else:
+        lead_in = np.asarray(y[:int(noise_duration_sec * sr)])
+        if len(lead_in) < int(noise_duration_sec * sr):
+            logger.warning("Audio too short for noise profile, using entire clip.")
+
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    with sf.SoundFile(output_file, 'w', samplerate=sr, channels=1, format='WAV') as out:
+        if lead_in is not None and silence.is_silent(lead_in):
+            logger.warning("Noise profile seems silent. Noise reduction might be ineffective.")
+            for block in ingest.iter_mono_blocks(input_file, block_size):
+                out.write(block)
+            return {'success': True, 'message': 'Noise profile silent, returning original.', 'output_path': output_file}
+
+        if noise_profile is not None:
+            threshold = noise_profile.threshold(noise_floor)
+        else:
+            threshold = spectral.get_engine(n_fft, hop_length).noise_profile(lead_in) * np.float32(1 + noise_floor)
+        part = silence.partition_for_skipping(y, sr) if skip_silence else None
+        regions = part.regions if part is not None else [(0, total)]
+        position = 0
+        for start, end in regions:
+            _write_span(out, y, position, start, silence_fill, block_size)
+            engine = OverlapAdd(lambda spectra: spectral.SpectralEngine.subtract(spectra, threshold),
+                                n_fft=n_fft, hop_length=hop_length)
+            length, written = end - start, 0
+            for lo in range(start, end, block_size):
+                chunk = engine.push(np.asarray(y[lo:min(lo + block_size, end)]))[:length - written]
+                out.write(chunk)
+                written += len(chunk)
+            chunk = engine.finish()[:length - written]
+            out.write(chunk)
+            written += len(chunk)
+            if written < length: # istft(length=...) zero-pads a short tail
+                out.write(np.zeros(length - written, dtype=np.float32))
+            position = end
+        _write_span(out, y, position, total, silence_fill, block_size)
+
+    result = {'success': True, 'message': 'Noise reduction complete!', 'output_path': output_file}
+    if part is not None:
+        result['silence'] = silence.record(part, "noise_reduction")
+    return result
+
+
+def stream_loudness_normalization(input_file: str, output_file: str,
+                                  target_lufs: float = config.DEFAULT_TARGET_LUFS,
+                                  block_size: int = DEFAULT_BLOCK_SIZE,
+                                  true_peak_limit: float | None = None) -> dict:
+    """
+    Two-pass loudness normalization in constant memory.
+    Pass 1 measures gated loudness chunk by chunk (src/loudness.py), pass 2 applies the gain, and the
+    true-peak limiter if true_peak_limit is set, and writes straight to output_file.
+    Output is mono 16-bit WAV like processing.loudness_normalization.
+    """
+    y, sr = ingest.load_audio(input_file, mono=True)
+
+    # --- Pass 1: measure ---
+    meter = loudness.LoudnessMeter(sr)
+    for block in ingest.iter_mono_blocks(input_file, block_size):
+        meter.push(block)
+    input_lufs = meter.integrated_loudness()
+
+    limit = False
+    if meter.peak < silence.SILENCE_AMPLITUDE:
+        logger.warning("Input audio is silent. Skipping normalization.")
+        gain, message = 1.0, 'Input silent, saved original.'
+    elif input_lufs == -float('inf'):
+        logger.warning(f"Could not measure loudness (likely silence). Skipping normalization for {input_file}")
+        gain, message = 1.0, 'Could not measure loudness (silence?), saved original.'
+    else:
+        gain, message = 10.0 ** ((target_lufs - input_lufs) / 20.0), 'Loudness normalization complete!'
+        logger.info(f"Measured {input_lufs:.2f} LUFS, applying {20 * np.log10(gain):+.2f} dB")
+        limit = true_peak_limit is not None
+        if meter.peak * gain >= 1.0 and not limit:
+            logger.warning("Possible clipped samples in output.")
+
+    # --- Pass 2: apply gain and write ---
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    context = loudness.limiter_context(sr) if limit else 0 # The limiter looks this far ahead and behind
+    with sf.SoundFile(output_file, 'w', samplerate=sr, channels=1, format='WAV') as out:
+        for start in range(0, len(y), block_size):
+            lo, hi = max(0, start - context), min(len(y), start + block_size + context)
+            block = np.asarray(y[lo:hi]) * np.float32(gain)
+            if limit:
+                block = loudness.limit_true_peak(block, sr, true_peak_limit)
+            out.write(block[start - lo:start - lo + block_size])
+    return {'success': True, 'message': message, 'output_path': output_file, 'input_lufs': input_lufs}
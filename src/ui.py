@@ -1,7 +1,8 @@
 # src/ui.py
 import streamlit as st
 import os
-from src import config, youtube, utils # Import youtube core logic, not UI parts
+import mimetypes
+from src import config, previews, utils # youtube (yt-dlp) is imported by the downloader view only
 
 logger = utils.logger # Use the logger from utils
 
@@ -17,21 +18,24 @@ def display_file_uploader(label="Upload an audio file", types=["mp3", "wav", "m4
     )
 
 def display_audio_player_from_file(file_path, title="Audio"):
-    """Displays an audio player if the file exists."""
+    """
+    Displays an audio player for a file on disk. The player streams a small compressed preview;
+    the full-quality file is only read into memory once the user asks for the download.
+    """
     st.markdown(f"#### {title}")
     if file_path and os.path.exists(file_path):
         try:
-            with open(file_path, "rb") as f:
-                audio_bytes = f.read()
-            st.audio(audio_bytes) # format determined automatically usually
-             # Add download button
-            with open(file_path, "rb") as fp:
-                st.download_button(
-                    label=f"Download {title}",
-                    data=fp,
-                    file_name=os.path.basename(file_path), # Sensible default filename
-                    mime="audio/wav" # Adjust MIME type if needed
-                )
+            preview_path, preview_mime = previews.get_preview(file_path)
+            st.audio(preview_path, format=preview_mime)
+            size_mb = os.path.getsize(file_path) / (1024 * 1024)
+            if st.checkbox(f"Prepare full-quality download ({size_mb:.1f} MB)", key=f"prepare_download_{file_path}"):
+                with open(file_path, "rb") as fp:
+                    st.download_button(
+                        label=f"Download {title}",
+                        data=fp,
+                        file_name=os.path.basename(file_path), # Sensible default filename
+                        mime=mimetypes.guess_type(file_path)[0] or "audio/wav"
+                    )
         except Exception as e:
             st.error(f"Could not load audio for '{title}': {e}")
     else:
@@ -52,6 +56,7 @@ def render_youtube_downloader():
     if download_button and url:
         with st.spinner("Attempting to download..."):
             # Call the CORE youtube download function
+            from src import youtube
             result = youtube.download_audio_yt_dlp(url, output_dir)
 
         if result['success']:
@@ -66,6 +71,31 @@ def render_youtube_downloader():
          status_placeholder.warning("Please enter a YouTube URL.")
 
 
+def render_bulk_youtube_downloader():
+    """Renders the UI for downloading playlists, channels or lists of URLs."""
+    st.subheader("Bulk Download")
+    sources_text = st.text_area("Playlist, channel or video URLs (one per line):", key="yt_bulk_urls")
+    download_button = st.button("Download All", key="yt_bulk_download")
+    results_placeholder = st.container()
+    sources = [line.strip() for line in sources_text.splitlines() if line.strip()]
+    return sources, download_button, results_placeholder
+
+def display_bulk_download_results(result_data, placeholder):
+     """Displays the per-item outcome of a bulk download."""
+     with placeholder:
+        if result_data.get('success'):
+            st.success(result_data['message'])
+        else:
+            st.warning(result_data.get('message', 'Some downloads failed.'))
+        items = result_data.get('items') or []
+        if items:
+            st.dataframe(
+                [{"Video": item['video_id'] or item['url'], "Status": item['status'],
+                  "File": item['file_path'] or "", "Message": item['message']} for item in items],
+                use_container_width=True
+            )
+
+
 def render_demucs_separator():
     """Renders the UI for Demucs Vocal Separator."""
     st.header("Extract Vocals (Demucs)")
@@ -87,7 +117,12 @@ def display_demucs_results(result_data, placeholder):
             if output_paths:
                 # Use the file-based player for demucs outputs
                 display_audio_player_from_file(output_paths.get("vocals"), title="Vocals")
-                display_audio_player_from_file(output_paths.get("other"), title="Accompaniment") # Or no_vocals
+                if "drums" in output_paths: # Four-stem run: 'other' is the remaining instruments, not the full mix
+                    display_audio_player_from_file(output_paths.get("drums"), title="Drums")
+                    display_audio_player_from_file(output_paths.get("bass"), title="Bass")
+                    display_audio_player_from_file(output_paths.get("other"), title="Other")
+                else:
+                    display_audio_player_from_file(output_paths.get("other"), title="Accompaniment") # Or no_vocals
             else:
                 st.warning("Processing successful, but no output file paths returned.")
         else:
@@ -103,20 +138,14 @@ def render_noise_reduction():
     return uploaded_file, process_button, results_placeholder
 
 def display_nr_results(result_data, placeholder):
-     """Displays the outcome of Noise Reduction processing using audio bytes."""
+     """Displays the outcome of Noise Reduction processing from the result file (through its compressed preview)."""
      with placeholder:
         if result_data.get('success'):
             st.success(result_data.get('message', 'Success!'))
-            audio_bytes = result_data.get('audio_bytes')
-            if audio_bytes:
-                st.markdown("#### Noise Reduced Audio")
-                st.audio(audio_bytes, format='audio/wav') # Pass bytes directly
-                st.download_button(
-                    label="Download Noise Reduced Audio",
-                    data= audio_bytes,
-                    file_name="noise_reduced_wav",
-                    mime="audio/wav"
-                )
+            # In-memory WAVs are written out first so the player streams a preview, not the full WAV
+            result_data = previews.spill_audio_bytes(result_data, "noise_reduced")
+            if result_data.get('output_path'):
+                display_audio_player_from_file(result_data['output_path'], title="Noise Reduced Audio")
             else:
                 st.warning("Processing successful, but no audio data returned.")
         else:
@@ -139,26 +168,60 @@ def render_loudness_normalization():
     return uploaded_file, target_lufs, process_button, results_placeholder
 
 def display_ln_results(result_data, placeholder):
-     """Displays the outcome of Loudness Normalization using audio bytes."""
+     """Displays the outcome of Loudness Normalization from the result file (through its compressed preview)."""
      with placeholder:
         if result_data['success']:
             st.success(result_data.get('message', 'Success!'))
-            audio_bytes = result_data.get('audio_bytes')
-            if audio_bytes:
-                st.markdown("#### Normalized Audio")
-                st.audio(audio_bytes, format='audio/wav') # Pass bytes directly
-                st.download_button(
-                    label="Download Normalized Audio",
-                    data=audio_bytes, # Pass bytes directly
-                    file_name="loudness_normalized.wav", # Provide a filename for download
-                    mime="audio/wav"
-                )
+            # In-memory WAVs are written out first so the player streams a preview, not the full WAV
+            result_data = previews.spill_audio_bytes(result_data, "loudness_normalized")
+            if result_data.get('output_path'):
+                display_audio_player_from_file(result_data['output_path'], title="Normalized Audio")
             else:
                 st.warning("Processing successful, but no audio data returned.")
         else:
             st.error(f"Loudness Normalization Error: {result_data.get('message', 'Unknown error')}")
 
 
+def render_pipeline():
+    """Renders the UI for the full download -> separate -> denoise -> normalize pipeline."""
+    st.header("Full Pipeline")
+    source_kind = st.radio("Source", ["YouTube URL", "Upload a file"], horizontal=True, key="pipeline_source")
+    url, uploaded_file = None, None
+    if source_kind == "YouTube URL":
+        url = st.text_input("YouTube Video URL:", key="pipeline_url")
+    else:
+        uploaded_file = display_file_uploader(key_suffix="pipeline")
+    col1, col2, col3 = st.columns(3)
+    steps = []
+    if col1.checkbox("Extract vocals", value=True, key="pipeline_separate"):
+        steps.append("separate")
+    if col2.checkbox("Reduce noise", value=True, key="pipeline_denoise"):
+        steps.append("denoise")
+    if col3.checkbox("Normalize loudness", value=True, key="pipeline_normalize"):
+        steps.append("normalize")
+    target_lufs = st.number_input(
+        "Target LUFS:",
+        min_value=-70.0, max_value=0.0,
+        value=config.DEFAULT_TARGET_LUFS,
+        step=0.5,
+        key="pipeline_lufs"
+        )
+    process_button = st.button("Run Pipeline", key="pipeline_process")
+    results_placeholder = st.container()
+    return url, uploaded_file, steps, target_lufs, process_button, results_placeholder
+
+def display_pipeline_results(result_data, placeholder):
+     """Displays the final pipeline output and the time spent in each stage."""
+     with placeholder:
+        if result_data.get('success'):
+            st.success(result_data.get('message', 'Success!'))
+            st.markdown("#### Stage Timings")
+            st.table({"Stage": list(result_data['timings']), "Seconds": list(result_data['timings'].values())})
+            display_audio_player_from_file(result_data.get('output_path'), title="Pipeline Output")
+        else:
+            st.error(f"Pipeline Error: {result_data.get('message', 'Unknown error')}")
+
+
 def display_sidebar():
     """Displays the sidebar navigation."""
     st.sidebar.header("Choose a Functionality")
@@ -169,6 +232,7 @@ def display_sidebar():
             "Extract Vocals (Demucs)",
             "Adaptive Noise Reduction",
             "Loudness Normalization",
+            "Full Pipeline",
         ],
         key="app_mode_radio"
     )
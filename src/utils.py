@@ -1,13 +1,18 @@
 # src/utils.py
 import os
+import shutil
 import tempfile
 import streamlit as st
 import logging
 import re
+import hashlib
 from src import config # Import your config
+from src import cache
+from src import metrics
 
 # Basic Logging Setup
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+metrics.configure_logging() # Correlation IDs, and JSON lines with VOCALIZER_LOG_JSON=1
 logger = logging.getLogger(__name__)
 
 def sanitize_filename(filename):
@@ -45,9 +50,16 @@ def save_uploaded_file(uploaded_file) -> str | None:
             dir=config.TEMP_DIR_BASE,
             suffix=suffix # Helps tools identify file type
         )
+        # Hash while writing so the result cache can key on the content without re-reading the file
+        hasher = hashlib.sha256()
+        buffer = uploaded_file.getbuffer()
         with temp_file: # Use context manager to ensure it's properly handled
-            temp_file.write(uploaded_file.getbuffer())
+            for start in range(0, len(buffer), cache.HASH_CHUNK_SIZE):
+                chunk = buffer[start:start + cache.HASH_CHUNK_SIZE]
+                hasher.update(chunk)
+                temp_file.write(chunk)
             file_path = temp_file.name # Get the path
+        cache.register_digest(file_path, hasher.hexdigest())
         
         logger.info(f"Uploaded file '{original_name}' saved temporarily as '{os.path.basename(file_path)}' to: {file_path}")
         return file_path # Return the actual path
@@ -57,20 +69,30 @@ def save_uploaded_file(uploaded_file) -> str | None:
          return None
 
 def clean_temp_directory(file_path: str | None):
-    """Removes the temporary directory containing the given file path."""
-    if file_path and config.TEMP_DIR_BASE in file_path:
-        temp_dir = os.path.dirname(file_path)
-        try:
-            # Ideally use shutil.rmtree(temp_dir) but be CAREFUL
-            # For simplicity, just remove the file if that's all you need
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                logger.info(f"Removed temporary file: {file_path}")
-            # If using mkdtemp, you should remove the directory after processing is fully done
-            # shutil.rmtree(temp_dir)
-            # logger.info(f"Removed temporary directory: {temp_dir}")
-        except Exception as e:
-            logger.error(f"Error cleaning up temporary file/directory for {file_path}: {e}")
+    """
+    Removes a temporary file and, if it sits in its own directory below config.TEMP_DIR_BASE
+    (e.g. one made with tempfile.mkdtemp), that whole directory.
+    """
+    if not file_path:
+        return
+    temp_base = os.path.abspath(config.TEMP_DIR_BASE)
+    abs_path = os.path.abspath(file_path)
+    if os.path.commonpath([temp_base, abs_path]) != temp_base or abs_path == temp_base:
+        logger.warning(f"Refusing to clean {file_path}: not inside {config.TEMP_DIR_BASE}")
+        return
+    temp_dir = os.path.dirname(abs_path)
+    try:
+        if temp_dir != temp_base and os.path.abspath(config.INGEST_DIR) not in (temp_dir, abs_path):
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            logger.info(f"Removed temporary directory: {temp_dir}")
+        elif os.path.isdir(abs_path):
+            shutil.rmtree(abs_path, ignore_errors=True)
+            logger.info(f"Removed temporary directory: {abs_path}")
+        elif os.path.exists(abs_path):
+            os.remove(abs_path)
+            logger.info(f"Removed temporary file: {abs_path}")
+    except Exception as e:
+        logger.error(f"Error cleaning up temporary file/directory for {file_path}: {e}")
 
 # You might add functions here later like:
 # - get_audio_duration(file_path)
@@ -0,0 +1,196 @@
+# src/warmup.py
+# Startup warm-up and import-time report.
+#
+# The app imports the heavy processing modules lazily, per mode. Once the UI is up, a background
+# thread pays the remaining first-use costs so the first request doesn't: it imports the processing
+# stack, primes the STFT engine and loudness meter on a tiny signal, and starts the Demucs pool
+# (whose workers load the default models).
+#
+#     python -m src.warmup                                  # run the warm-up in the foreground, print step times
+#     python -m src.warmup --imports [--budget-ms 1500]     # cold import cost per module, each in a fresh interpreter
+import sys
+import json
+import time
+import logging
+import argparse
+import importlib
+import subprocess
+import threading
+from src import config, metrics
+
+logger = logging.getLogger(__name__)
+
+# Modules the app imports per mode, from the UI shell down to the heavy dependencies
+REPORT_MODULES = ("src.ui", "src.youtube", "src.processing", "src.pipeline", "scipy.signal", "librosa", "demucs.pretrained")
+
+
+# --- Warm-up steps ---
+
+def _warm_imports():
+    for module in ("src.processing", "src.pipeline", "src.loudness", "scipy.signal", "librosa.core.audio"):
+        importlib.import_module(module)
+
+
+def _warm_spectral():
+    """ Builds the window/frame caches and scipy.fft plans for the default noise reduction settings. """
+    import numpy as np
+    from src import spectral
+    engine = spectral.get_engine(2048, 512)
+    y = np.random.default_rng(0).standard_normal(8192).astype(np.float32) * 0.01
+    engine.reduce_noise(y, engine.noise_profile(y))
+
+
+def _warm_loudness():
+    """ Designs the K-weighting filter for the default rate; one short measurement exercises that path. """
+    import numpy as np
+    from src import processing
+    y = np.random.default_rng(0).standard_normal(config.DEMUCS_SAMPLE_RATE).astype(np.float32) * 0.1
+    processing.normalize_loudness_array(y, config.DEMUCS_SAMPLE_RATE)
+
+
+def _warm_demucs():
+    """ Starts the resident Demucs workers (they load config.DEMUCS_POOL_MODELS on start) or loads in-process. """
+    from src import demucs_pool
+    if config.DEMUCS_BACKEND == "pool":
+        demucs_pool.get_pool().warm_up()
+    elif config.DEMUCS_BACKEND == "inprocess":
+        demucs_pool.get_resident_model(config.DEFAULT_DEMUCS_MODEL)
+
+
+def steps() -> list:
+    """ (name, function) pairs in the order they run; Demucs is skipped for the subprocess backend or when disabled. """
+    planned = [("imports", _warm_imports), ("spectral", _warm_spectral), ("loudness", _warm_loudness)]
+    if config.WARMUP_DEMUCS and config.DEMUCS_BACKEND in ("pool", "inprocess"):
+        planned.append(("demucs", _warm_demucs))
+    return planned
+
+
+def warm_up() -> dict:
+    """ Runs every step, returning {step: seconds or error string}. A failing step never stops the others. """
+    results = {}
+    for name, func in steps():
+        started = time.perf_counter()
+        try:
+            with metrics.timer("warmup", step=name):
+                func()
+            results[name] = round(time.perf_counter() - started, 3)
+        except Exception as e: # e.g. demucs/torch not installed; the real request will report it properly
+            logger.warning(f"Warm-up step '{name}' failed: {e}")
+            results[name] = f"error: {e}"
+    logger.info(f"Warm-up finished: {results}")
+    return results
+
+
+class WarmUp:
+    """ Daemon thread running warm_up() once. `results` is None until it finishes. """
+
+    def __init__(self):
+        self.results = None
+        self.finished = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="vocalizer-warmup", daemon=True)
+
+    def start(self) -> "WarmUp":
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            self.results = warm_up()
+        finally:
+            self.finished.set()
+
+
+_warmup = None
+_warmup_lock = threading.Lock()
+
+
+def start_warmup() -> WarmUp | None:
+    """ Starts the process-wide warm-up once (None when config.WARMUP_ENABLED is off); later calls return it. """
+    global _warmup
+    if not config.WARMUP_ENABLED:
+        return None
+    with _warmup_lock:
+        if _warmup is None:
+            _warmup = WarmUp().start()
+        return _warmup
+
+
+# --- Import-time report ---
+
+def _parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    """ (module, self µs, cumulative µs) for each line of `python -X importtime` output. """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def import_cost(module: str, top: int = 5) -> dict:
+    """
+    Imports `module` in a fresh interpreter with -X importtime. Returns its cumulative import time,
+    the wall time of the whole interpreter run, and the top packages by self time.
+    """
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                             capture_output=True, text=True, cwd=config.BASE_DIR)
+    wall_ms = (time.perf_counter() - started) * 1000
+    rows = _parse_importtime(process.stderr)
+    if process.returncode != 0:
+        error = process.stderr.strip().splitlines()[-1] if process.stderr.strip() else f"exit code {process.returncode}"
+        return {'module': module, 'error': error}
+    by_package = {}
+    for name, self_us, _ in rows:
+        package = name.split(".")[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+    cumulative_us = next((cumulative for name, _, cumulative in rows if name == module), 0)
+    return {
+        'module': module,
+        'import_ms': round(cumulative_us / 1000, 1),
+        'wall_ms': round(wall_ms, 1),
+        'modules_loaded': len(rows),
+        'top_packages': {package: round(us / 1000, 1)
+                         for package, us in sorted(by_package.items(), key=lambda item: -item[1])[:top]},
+    }
+
+
+def import_report(modules=REPORT_MODULES) -> list[dict]:
+    return [import_cost(module) for module in modules]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Warm up Vocalizer or report cold import times.")
+    parser.add_argument("--imports", action="store_true", help="Report cold import time per module instead of warming up")
+    parser.add_argument("--modules", default=",".join(REPORT_MODULES), help="Comma-separated modules for --imports")
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="With --imports: exit with code 1 if any module takes longer than this to import")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args(argv)
+
+    if not args.imports:
+        results = warm_up()
+        print(json.dumps(results, indent=2) if args.json else
+              "\n".join(f"{name:<10} {value if isinstance(value, str) else f'{value:.3f}s'}" for name, value in results.items()))
+        return 0 if all(not isinstance(value, str) for value in results.values()) else 2
+
+    report = import_report([m.strip() for m in args.modules.split(",") if m.strip()])
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for entry in report:
+            if 'error' in entry:
+                print(f"{entry['module']:<20} ERROR {entry['error']}")
+                continue
+            top = ", ".join(f"{package} {ms:.0f}ms" for package, ms in entry['top_packages'].items())
+            print(f"{entry['module']:<20} {entry['import_ms']:>8.1f} ms  ({entry['modules_loaded']} modules; {top})")
+    over = [e for e in report if args.budget_ms is not None and e.get('import_ms', 0) > args.budget_ms]
+    for entry in over:
+        logger.error(f"{entry['module']} imports in {entry['import_ms']:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    raise SystemExit(main())
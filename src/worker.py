@@ -0,0 +1,303 @@
+# src/worker.py
+# Worker fleet for the durable job queue (src/jobqueue.py).
+#
+#     python -m src.worker [run] [--processes N] [--kinds separate,denoise,normalize] [--once]
+#     python -m src.worker enqueue <separate|denoise|normalize> <input> [--output PATH] [--param key=value ...]
+#     python -m src.worker status [--status dead]
+#     python -m src.worker requeue <job id>
+#
+# Every worker process claims one job at a time, renews its lease from a heartbeat thread while the job
+# runs, and records the result or the failure (retried with backoff, dead-lettered once attempts run
+# out). Start more workers, on this host or on others sharing the queue file and the data volume,
+# to add throughput. SIGINT/SIGTERM let running jobs finish before the workers exit.
+import os
+import sys
+import json
+import signal
+import sqlite3
+import logging
+import argparse
+import threading
+import multiprocessing
+from src import config, metrics, silence, storage
+from src.jobqueue import JobQueue, worker_id
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("separate", "denoise", "normalize")
+NUMERIC_PARAMS = ("noise_duration_sec", "noise_floor", "target_lufs", "true_peak_limit")
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(processName)s - %(message)s'
+
+
+class PermanentError(Exception):
+    """ A failure retrying can't fix (e.g. the input file doesn't exist); the job is dead-lettered at once. """
+
+
+def _flag(value) -> bool:
+    """ A boolean job parameter: JSON true/false, or "1"/"true"/"yes" from --param. """
+    return value if isinstance(value, bool) else str(value).lower() in ("1", "true", "yes")
+
+
+def check_params(params: dict) -> dict:
+    """
+    Validates job parameters and returns them with numbers and flags converted. Raises ValueError for
+    values no retry can fix, so enqueue rejects them and workers dead-letter the job at once.
+    """
+    checked = dict(params)
+    for name in NUMERIC_PARAMS:
+        if name in checked:
+            try:
+                checked[name] = float(checked[name])
+            except (TypeError, ValueError):
+                raise ValueError(f"Parameter {name} must be a number, got {checked[name]!r}") from None
+    if 'skip_silence' in checked:
+        checked['skip_silence'] = _flag(checked['skip_silence'])
+    if checked.get('silence_fill', config.SILENCE_FILL) not in silence.FILLS:
+        raise ValueError(f"Unknown silence fill {checked['silence_fill']!r}. Choose from: {', '.join(silence.FILLS)}")
+    profile = checked.get('profile', config.DEMUCS_PROFILE)
+    if profile != "auto" and profile not in config.DEMUCS_PROFILES:
+        raise ValueError(f"Unknown Demucs profile {profile!r}")
+    if checked.get('noise_profile'):
+        from src import noise_profiles
+        noise_profiles.profile_path(checked['noise_profile']) # Raises ValueError for an invalid name
+    return checked
+
+
+def _write_output(result: dict, output_file: str) -> str:
+    """ Puts an in-memory (audio_bytes) or on-disk (output_path) stage result at output_file. """
+    if result.get('output_path'):
+        if os.path.abspath(result['output_path']) != os.path.abspath(output_file):
+            with storage.atomic_path(output_file) as part_path:
+                with open(result['output_path'], "rb") as src, open(part_path, "wb") as dst:
+                    while chunk := src.read(1 << 20):
+                        dst.write(chunk)
+    else:
+        with storage.atomic_path(output_file) as part_path, open(part_path, "wb") as f:
+            f.write(result['audio_bytes'])
+    return output_file
+
+
+def execute(kind: str, payload: dict) -> dict:
+    """
+    Runs one job and returns its JSON-serialisable result. Raises PermanentError for bad jobs and
+    RuntimeError for failures that may succeed on another attempt.
+    """
+    from src import processing # Only worker processes pay for the processing imports
+    input_file = payload.get('input')
+    if not input_file or not os.path.exists(input_file):
+        raise PermanentError(f"Input file not found: {input_file}")
+    base_name = os.path.splitext(os.path.basename(input_file))[0]
+    try:
+        params = check_params(payload.get('params', {}))
+    except ValueError as e:
+        raise PermanentError(str(e)) from None
+    silence = {'skip_silence': _flag(params.get('skip_silence', config.SKIP_SILENCE)),
+               'silence_fill': params.get('silence_fill', config.SILENCE_FILL)}
+
+    if kind == "separate":
+        result = processing.separate_audio_with_demucs(
+            input_file, payload.get('output') or config.DEMUCS_OUTPUT_DIR,
+            params.get('model'), params.get('stems', config.DEFAULT_DEMUCS_STEMS),
+            backend=params.get('backend', "inprocess"), # Each worker keeps its own model resident
+            profile=params.get('profile', config.DEMUCS_PROFILE), **silence)
+        if not result['success']:
+            raise RuntimeError(result['message'])
+        return {'message': result['message'], 'output_paths': result['output_paths'], 'profile': result.get('profile'),
+                'silence': result.get('silence')}
+
+    if kind == "denoise":
+        output_file = payload.get('output') or os.path.join(config.PROCESSED_OUTPUT_DIR, f"{base_name}_noise_reduced.wav")
+        result = processing.adaptive_noise_reduction(
+            input_file, float(params.get('noise_duration_sec', config.DEFAULT_NOISE_PROFILE_SEC)),
+            float(params.get('noise_floor', config.DEFAULT_NOISE_FLOOR)), output_file=output_file,
+            noise_profile=params.get('noise_profile', config.NOISE_PROFILE), **silence)
+    elif kind == "normalize":
+        output_file = payload.get('output') or os.path.join(config.PROCESSED_OUTPUT_DIR, f"{base_name}_normalized.wav")
+        result = processing.loudness_normalization(
+            input_file, float(params.get('target_lufs', config.DEFAULT_TARGET_LUFS)), output_file=output_file,
+            true_peak_limit=float(params['true_peak_limit']) if 'true_peak_limit' in params else config.TRUE_PEAK_LIMIT_DBTP)
+    else:
+        raise PermanentError(f"Unknown job kind: {kind}")
+    if not result['success']:
+        raise RuntimeError(result['message'])
+    return {'message': result['message'], 'output_path': _write_output(result, output_file), 'silence': result.get('silence')}
+
+
+class Heartbeat:
+    """ Renews a job's lease every lease_sec / 3 on a background thread until stopped. """
+
+    def __init__(self, queue: JobQueue, job_id: str, owner: str):
+        self.queue, self.job_id, self.owner = queue, job_id, owner
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="vocalizer-heartbeat", daemon=True)
+
+    def _loop(self):
+        while not self._stop.wait(self.queue.lease_sec / 3):
+            try:
+                if not self.queue.heartbeat(self.job_id, self.owner):
+                    self.lost = True
+                    logger.warning(f"Lost the lease on job {self.job_id}; its result will be discarded")
+                    return
+            except Exception as e: # A transient DB error must not kill the job; the next beat retries
+                logger.warning(f"Heartbeat for job {self.job_id} failed: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def run_worker(queue_path: str = config.QUEUE_PATH, kinds=KINDS, once: bool = False,
+               stop: threading.Event | None = None) -> int:
+    """ Claims and runs jobs until stop is set (or, with once, until the queue has nothing runnable). Returns jobs run. """
+    queue = JobQueue(queue_path)
+    owner = worker_id()
+    stop = stop or threading.Event()
+    done = 0
+    logger.info(f"Worker {owner} polling {queue_path} for {', '.join(kinds)} jobs")
+    while not stop.is_set():
+        try:
+            job = queue.claim(owner, kinds)
+        except sqlite3.OperationalError as e: # e.g. "database is locked" on a busy shared volume
+            logger.warning(f"Could not claim a job, retrying in {config.QUEUE_POLL_SEC:.0f}s: {e}")
+            stop.wait(config.QUEUE_POLL_SEC)
+            continue
+        if job is None:
+            if once:
+                break
+            stop.wait(config.QUEUE_POLL_SEC)
+            continue
+
+        logger.info(f"Running job {job['id']} ({job['kind']}, attempt {job['attempts']}/{job['max_attempts']})")
+        with metrics.correlation(job['id']), Heartbeat(queue, job['id'], owner) as heartbeat, \
+                metrics.timer("queue_job", kind=job['kind']) as timing:
+            try:
+                result = execute(job['kind'], job['payload'])
+            except PermanentError as e:
+                timing.mark_failed()
+                queue.fail(job['id'], owner, str(e), retryable=False)
+            except Exception as e:
+                timing.mark_failed()
+                logger.error(f"Job {job['id']} failed: {e}", exc_info=True)
+                queue.fail(job['id'], owner, f"{type(e).__name__}: {e}")
+            else:
+                if not heartbeat.lost and queue.complete(job['id'], owner, result):
+                    logger.info(f"Job {job['id']} done: {result['message']}")
+        done += 1
+    logger.info(f"Worker {owner} stopping after {done} job(s)")
+    return done
+
+
+def _worker_process(queue_path: str, kinds, once: bool, processes: int):
+    """ Entry point of each fleet process: runs until SIGTERM/SIGINT, finishing its current job first. """
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT) # Spawned children start with bare logging
+    metrics.configure_logging()
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    if "separate" in kinds:
+        try:
+            import torch
+            torch.set_num_threads(max(1, config.CPU_COUNT // processes)) # The fleet already fills every core
+        except ImportError:
+            pass # Separation jobs will fail (and retry) with a clear error
+    run_worker(queue_path, kinds, once, stop)
+
+
+def run_fleet(processes: int = config.WORKER_PROCESSES, queue_path: str = config.QUEUE_PATH,
+              kinds=KINDS, once: bool = False) -> int:
+    """ Starts `processes` worker processes and waits for them; signals are forwarded so they drain. """
+    if processes <= 1:
+        stop = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+        run_worker(queue_path, kinds, once, stop)
+        return 0
+    context = multiprocessing.get_context("spawn") # Fresh interpreters: no forked SQLite handles or torch state
+    workers = [context.Process(target=_worker_process, args=(queue_path, kinds, once, processes), name=f"vocalizer-worker-{i}")
+               for i in range(processes)]
+    for process in workers:
+        process.start()
+
+    def forward(signum, _frame):
+        for process in workers:
+            if process.is_alive():
+                os.kill(process.pid, signum)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, forward)
+    for process in workers:
+        process.join()
+    return 0 if all(process.exitcode == 0 for process in workers) else 1
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run or feed Vocalizer queue workers.")
+    parser.add_argument("--queue", default=config.QUEUE_PATH, help="Queue database file")
+    commands = parser.add_subparsers(dest="command")
+
+    run = commands.add_parser("run", help="Process jobs (the default)")
+    run.add_argument("--processes", type=int, default=config.WORKER_PROCESSES)
+    run.add_argument("--kinds", default=",".join(KINDS), help="Comma-separated job kinds this fleet runs")
+    run.add_argument("--once", action="store_true", help="Exit once no job is runnable instead of polling")
+
+    enqueue = commands.add_parser("enqueue", help="Add a job")
+    enqueue.add_argument("kind", choices=KINDS)
+    enqueue.add_argument("input", help="Input audio path (must be readable by the workers)")
+    enqueue.add_argument("--output", help="Output file (denoise/normalize) or directory (separate)")
+    enqueue.add_argument("--param", action="append", default=[], metavar="KEY=VALUE",
+                         help="Stage parameter, e.g. target_lufs=-16, profile=fast, skip_silence=1, noise_profile=session1")
+    enqueue.add_argument("--max-attempts", type=int, default=config.QUEUE_MAX_ATTEMPTS)
+    enqueue.add_argument("--id", help="Job ID; re-enqueueing the same ID is a no-op")
+
+    status = commands.add_parser("status", help="Show counts and recent jobs")
+    status.add_argument("--status", choices=("queued", "running", "done", "dead"))
+    status.add_argument("--limit", type=int, default=20)
+
+    requeue = commands.add_parser("requeue", help="Retry a dead-lettered job")
+    requeue.add_argument("job_id")
+
+    args = parser.parse_args(argv)
+    command = args.command or "run"
+
+    if command == "run":
+        kinds = tuple(k.strip() for k in getattr(args, "kinds", ",".join(KINDS)).split(",") if k.strip())
+        unknown = [k for k in kinds if k not in KINDS]
+        if unknown or not kinds:
+            parser.error(f"Unknown job kind(s): {', '.join(unknown) or '(none given)'}")
+        return run_fleet(max(1, getattr(args, "processes", config.WORKER_PROCESSES)), args.queue, kinds,
+                         getattr(args, "once", False))
+
+    queue = JobQueue(args.queue)
+    if command == "enqueue":
+        params = {}
+        for item in args.param:
+            key, sep, value = item.partition("=")
+            if not sep:
+                parser.error(f"--param expects KEY=VALUE, got {item!r}")
+            params[key.strip()] = value.strip()
+        try:
+            check_params(params)
+        except ValueError as e:
+            parser.error(str(e))
+        payload = {'input': os.path.abspath(args.input), 'params': params}
+        if args.output:
+            payload['output'] = os.path.abspath(args.output)
+        print(queue.enqueue(args.kind, payload, args.max_attempts, args.id))
+    elif command == "status":
+        print(json.dumps({'counts': queue.stats(), 'jobs': queue.list(args.status, args.limit)}, indent=2, default=str))
+    elif command == "requeue":
+        if not queue.requeue(args.job_id):
+            logger.error(f"Job {args.job_id} is not dead-lettered (or doesn't exist)")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+    metrics.configure_logging()
+    sys.exit(main())
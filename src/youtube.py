@@ -2,8 +2,16 @@
 import yt_dlp
 import re
 import os
+import time
 import logging
-from src import config # Use config for output path
+import tempfile
+import threading
+import subprocess
+import numpy as np
+import soundfile as sf
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src import config, metrics, storage, store # Use config for output path
 
 logger = logging.getLogger(__name__)
 
@@ -26,17 +34,30 @@ def get_yt_vid_id(url):
     return None
 
 
-def download_audio_yt_dlp(video_url: str, output_dir: str = config.YOUTUBE_OUTPUT_DIR) -> dict:
+def download_audio_yt_dlp(video_url: str, output_dir: str = config.YOUTUBE_OUTPUT_DIR,
+                          native_audio: bool = config.YOUTUBE_NATIVE_AUDIO) -> dict:
     """
     Downloads the audio of a YouTube video using yt_dlp.
+    Videos already in the download store are returned straight from its index without contacting YouTube.
 
     Args:
         video_url: The URL of the YouTube video.
         output_dir: Directory where the audio file will be saved.
+        native_audio: Keep the native bestaudio stream (opus/webm or m4a) as-is instead of
+                      re-encoding it to m4a with FFmpegExtractAudio.
 
     Returns:
         A dictionary: {'success': bool, 'message': str, 'file_path': str | None}
     """
+    video_id = get_yt_vid_id(video_url)
+    download_store = store.get_store(output_dir)
+    if video_id:
+        entry = download_store.lookup(video_id)
+        if entry is not None:
+            logger.info(f"Store hit for {video_id}: {entry['path']}")
+            metrics.inc("download_store_total", result="hit")
+            return {'success': True, 'message': 'Audio already downloaded (served from store).', 'file_path': entry['path']}
+
     final_file_path = None # Keep track of the downloaded file path
 
     def hook(d):
@@ -47,12 +68,12 @@ def download_audio_yt_dlp(video_url: str, output_dir: str = config.YOUTUBE_OUTPU
         # You can add more hooks here for progress reporting if needed later
 
     ydl_opts = {
-        'format': 'm4a/bestaudio/best',
-        'postprocessors': [{
+        'format': 'bestaudio/best' if native_audio else 'm4a/bestaudio/best',
+        'postprocessors': [] if native_audio else [{
             'key': 'FFmpegExtractAudio',
             'preferredcodec': 'm4a',
         }],
-        'outtmpl': os.path.join(output_dir, '%(title)s.%(ext)s'), # Use os.path.join
+        'outtmpl': os.path.join(output_dir, '%(id)s.%(ext)s'), # Named by video ID, the store's key
         'quiet': True, # Suppress yt-dlp stdout unless debugging
         'progress_hooks': [hook], # Use hook to get filename
         'noplaylist': True, # Ensure only single video is downloaded
@@ -62,10 +83,25 @@ def download_audio_yt_dlp(video_url: str, output_dir: str = config.YOUTUBE_OUTPU
     try:
         # Ensure output directory exists just before download
         os.makedirs(output_dir, exist_ok=True)
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([video_url])
+        metrics.inc("download_store_total", result="miss")
+        with metrics.timer("download", mode="native" if native_audio else "m4a") as timing:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.extract_info(video_url, download=True)
+
+            # The hook sees the pre-postprocessing name; prefer the final path yt-dlp reports
+            requested = (info or {}).get('requested_downloads') or []
+            if requested and requested[-1].get('filepath'):
+                final_file_path = requested[-1]['filepath']
+            if final_file_path and os.path.exists(final_file_path):
+                timing.bytes = os.path.getsize(final_file_path)
+                timing.audio_sec = (info or {}).get('duration')
+            else:
+                timing.mark_failed()
 
         if final_file_path and os.path.exists(final_file_path):
+             download_store.record(info.get('id') or video_id, final_file_path,
+                                   duration=info.get('duration'),
+                                   fmt=os.path.splitext(final_file_path)[1].lstrip('.') or info.get('ext'))
              return {'success': True, 'message': 'Audio download complete!', 'file_path': final_file_path}
         else:
              # This case might happen if hook didn't capture or file was moved/deleted unexpectedly
@@ -80,4 +116,240 @@ def download_audio_yt_dlp(video_url: str, output_dir: str = config.YOUTUBE_OUTPU
         return {'success': False, 'message': f"An unexpected error occurred: {e}", 'file_path': None}
 
 # REMOVE the handle_youtube_operations function entirely from this file.
-# It will be recreated in ui.py
\ No newline at end of file
+# It will be recreated in ui.py
+
+# --- PCM fast path ---
+
+PCM_READ_CHUNK_SIZE = 1 << 20 # Bytes per read from ffmpeg's stdout
+
+def decode_pcm(source: str, sample_rate: int = config.DEMUCS_SAMPLE_RATE, channels: int = 2,
+               http_headers: dict | None = None) -> np.ndarray:
+    """
+    Decodes a local file or a media URL with a single ffmpeg process, resampling to sample_rate.
+    Returns float32 audio shaped (channels, samples) like librosa.load(mono=False). The samples are
+    read straight into one growing buffer and the result is a transposed view of it, so the decoded
+    audio is held in memory once.
+    """
+    cmd = ["ffmpeg", "-nostdin", "-loglevel", "error"]
+    if http_headers:
+        cmd += ["-headers", "".join(f"{key}: {value}\r\n" for key, value in http_headers.items())]
+    cmd += ["-i", source, "-vn", "-f", "f32le", "-acodec", "pcm_f32le", "-ac", str(channels), "-ar", str(sample_rate), "-"]
+    with metrics.timer("decode_pcm", source="url" if "://" in source else "file") as timing, \
+            tempfile.TemporaryFile() as stderr:
+        # stderr goes to a file so a chatty ffmpeg can't fill its pipe while we are reading stdout
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+        pcm = bytearray()
+        chunk = bytearray(PCM_READ_CHUNK_SIZE)
+        with process.stdout:
+            while read := process.stdout.readinto(chunk):
+                pcm += memoryview(chunk)[:read]
+        if process.wait() != 0:
+            stderr.seek(0)
+            raise RuntimeError(f"ffmpeg decode failed: {stderr.read().decode(errors='replace').strip()}")
+        del pcm[len(pcm) - len(pcm) % (4 * channels):] # A truncated stream can end mid-frame
+        timing.bytes = len(pcm)
+        timing.audio_sec = len(pcm) / (4 * channels * sample_rate)
+    return np.frombuffer(pcm, dtype=np.float32).reshape(-1, channels).T
+
+
+def fetch_audio_pcm(video_url: str, output_dir: str = config.YOUTUBE_OUTPUT_DIR,
+                    sample_rate: int = config.DEMUCS_SAMPLE_RATE, channels: int = 2,
+                    output_file: str | None = None) -> dict:
+    """
+    Fast path for processing: streams the video's bestaudio straight into one ffmpeg decode, skipping
+    the download-to-m4a transcode. Videos already in the download store are decoded from disk instead.
+
+    Args:
+        video_url: The URL of the YouTube video.
+        output_dir: Download store to check first.
+        sample_rate: Output rate, by default the rate Demucs runs at.
+        channels: Output channel count.
+        output_file: Optional path; the audio is also written there as a float WAV.
+
+    Returns:
+        A dictionary: {'success': bool, 'message': str, 'audio': ndarray | None, 'sample_rate': int,
+                       'video_id': str | None, 'title': str | None, 'file_path': str | None}
+    """
+    result = {'success': False, 'message': '', 'audio': None, 'sample_rate': sample_rate,
+              'video_id': get_yt_vid_id(video_url), 'title': None, 'file_path': None}
+    try:
+        entry = store.get_store(output_dir).lookup(result['video_id']) if result['video_id'] else None
+        if entry is not None:
+            logger.info(f"Decoding stored download for {result['video_id']}: {entry['path']}")
+            source, headers = entry['path'], None
+        else:
+            with metrics.timer("resolve_stream"), \
+                    yt_dlp.YoutubeDL({'format': 'bestaudio/best', 'quiet': True, 'noplaylist': True}) as ydl:
+                info = ydl.extract_info(video_url, download=False)
+            source, headers = info['url'], info.get('http_headers')
+            result.update(video_id=info.get('id') or result['video_id'], title=info.get('title'))
+            logger.info(f"Streaming {info.get('format_id')} ({info.get('ext')}) for {result['video_id']} into ffmpeg")
+
+        audio = decode_pcm(source, sample_rate, channels, headers)
+        if output_file:
+            os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+            with metrics.timer("file_write") as timing:
+                sf.write(output_file, audio.T, sample_rate, subtype='FLOAT')
+                timing.bytes = os.path.getsize(output_file)
+            result['file_path'] = output_file
+        result.update(success=True, message="Audio decoded!", audio=audio)
+        return result
+
+    except (yt_dlp.utils.DownloadError, RuntimeError) as e:
+        logger.error(f"PCM fetch failed for {video_url}: {e}", exc_info=True)
+        result['message'] = f"Download Error: {e}"
+        return result
+    except Exception as e:
+        logger.error(f"An unexpected error occurred during PCM fetch: {e}", exc_info=True)
+        result['message'] = f"An unexpected error occurred: {e}"
+        return result
+
+# --- Bulk downloads ---
+
+class DownloadArchive:
+    """ Video IDs we already downloaded, persisted one per line so lookups are instant across runs. """
+
+    def __init__(self, path: str = config.YOUTUBE_ARCHIVE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._ids = set()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self._ids = {line.strip() for line in f if line.strip()}
+
+    def __contains__(self, video_id) -> bool:
+        return video_id in self._ids
+
+    def add(self, video_id: str):
+        with self._lock:
+            if video_id in self._ids:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(video_id + "\n")
+            self._ids.add(video_id)
+
+    def discard(self, video_id: str):
+        """ Forgets video_id (its file is gone), rewriting the archive without it. """
+        with self._lock:
+            if video_id not in self._ids:
+                return
+            self._ids.discard(video_id)
+            with storage.atomic_path(self.path) as part_path, open(part_path, "w", encoding="utf-8") as f:
+                f.writelines(f"{i}\n" for i in sorted(self._ids))
+
+
+class HostRateLimiter:
+    """ Spaces out requests to the same host by at least min_interval seconds, across threads. """
+
+    def __init__(self, min_interval: float = config.YOUTUBE_MIN_REQUEST_INTERVAL_SEC):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, url: str):
+        host = urlparse(url).netloc.lower().removeprefix("www.")
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def expand_sources(sources: list[str], rate_limiter: HostRateLimiter | None = None) -> list[str]:
+    """
+    Turns a mix of video, playlist and channel URLs into a de-duplicated list of video URLs.
+    Playlists/channels are listed with extract_flat, so no media is fetched here.
+    """
+    video_urls, seen = [], set()
+
+    def add(url):
+        key = get_yt_vid_id(url) or url
+        if key not in seen:
+            seen.add(key)
+            video_urls.append(url)
+
+    def walk(info, depth):
+        for entry in info.get('entries') or []:
+            if not entry:
+                continue
+            if entry.get('_type') in ('playlist', 'url') and entry.get('ie_key') == 'YoutubeTab' and depth < 2:
+                # Channel tabs (Videos, Shorts, ...) are nested playlists
+                walk(ydl.extract_info(entry['url'], download=False), depth + 1)
+            elif entry.get('id'):
+                add(f"https://www.youtube.com/watch?v={entry['id']}")
+
+    with yt_dlp.YoutubeDL({'extract_flat': 'in_playlist', 'quiet': True, 'skip_download': True}) as ydl:
+        for source in sources:
+            source = source.strip()
+            if not source:
+                continue
+            if get_yt_vid_id(source) and "list=" not in source:
+                add(source) # Plain video URL: nothing to expand
+                continue
+            if rate_limiter:
+                rate_limiter.wait(source)
+            try:
+                info = ydl.extract_info(source, download=False)
+            except yt_dlp.utils.DownloadError as e:
+                logger.error(f"Could not list {source}: {e}")
+                add(source) # Let the download step report the failure for this item
+                continue
+            if info.get('entries') is not None:
+                walk(info, 0)
+            else:
+                add(source)
+    return video_urls
+
+
+def download_bulk(sources: list[str], output_dir: str = config.YOUTUBE_OUTPUT_DIR,
+                  max_workers: int = config.YOUTUBE_BULK_WORKERS,
+                  archive_path: str | None = None,
+                  progress_callback=None) -> dict:
+    """
+    Downloads the audio of many videos (URLs, playlists or channels) with a bounded thread pool.
+    IDs in the download archive (by default output_dir/download_archive.txt) whose file is still in the
+    store are skipped without contacting YouTube; IDs whose file was evicted are dropped from the
+    archive and downloaded again.
+
+    Returns:
+        A dictionary: {'success': bool, 'message': str, 'items': [{'url', 'video_id', 'status', 'file_path', 'message'}],
+                       'counts': {'downloaded': int, 'skipped': int, 'failed': int}}
+        where status is 'downloaded', 'skipped' or 'failed' per item.
+    """
+    rate_limiter = HostRateLimiter()
+    archive = DownloadArchive(archive_path or os.path.join(output_dir, config.YOUTUBE_ARCHIVE_FILENAME))
+    urls = expand_sources(sources, rate_limiter)
+    logger.info(f"Bulk download: {len(urls)} videos from {len(sources)} sources")
+
+    def fetch(url):
+        video_id = get_yt_vid_id(url)
+        if video_id and video_id in archive:
+            entry = store.get_store(output_dir).lookup(video_id)
+            if entry is not None:
+                return {'url': url, 'video_id': video_id, 'status': 'skipped',
+                        'file_path': entry['path'], 'message': 'Already downloaded'}
+            logger.info(f"{video_id} is archived but its file is gone; downloading it again")
+            archive.discard(video_id)
+        rate_limiter.wait(url)
+        result = download_audio_yt_dlp(url, output_dir)
+        if result['success'] and video_id:
+            archive.add(video_id)
+        return {'url': url, 'video_id': video_id, 'status': 'downloaded' if result['success'] else 'failed',
+                'file_path': result['file_path'], 'message': result['message']}
+
+    items = []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="yt-download") as executor:
+        futures = [executor.submit(fetch, url) for url in urls]
+        for done, future in enumerate(as_completed(futures), start=1):
+            items.append(future.result())
+            if progress_callback is not None:
+                progress_callback(done / len(futures), f"{done}/{len(futures)} videos")
+
+    order = {url: i for i, url in enumerate(urls)}
+    items.sort(key=lambda item: order[item['url']])
+    counts = {status: sum(1 for item in items if item['status'] == status) for status in ('downloaded', 'skipped', 'failed')}
+    message = f"{counts['downloaded']} downloaded, {counts['skipped']} already present, {counts['failed']} failed."
+    logger.info(f"Bulk download finished: {message}")
+    return {'success': counts['failed'] == 0, 'message': message, 'items': items, 'counts': counts}
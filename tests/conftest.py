@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _work_dir(tmp_path, monkeypatch):
+    """ Every output, cache and temp directory in config is relative, so each test gets its own tree. """
+    monkeypatch.chdir(tmp_path)
@@ -0,0 +1,86 @@
+import os
+import json
+import numpy as np
+import soundfile as sf
+import pytest
+from src import batch, config
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(config, "CACHE_ENABLED", False)
+
+
+def _write_tone(path, seconds=1.0, sr=16000):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    t = np.arange(int(seconds * sr)) / sr
+    sf.write(path, (0.1 * np.sin(2 * np.pi * 440 * t)).astype(np.float32), sr, subtype='FLOAT')
+    return path
+
+
+def test_manifests_resolve_relative_paths(tmp_path):
+    (tmp_path / "lists").mkdir()
+    csv_manifest = tmp_path / "lists" / "takes.csv"
+    csv_manifest.write_text("path,note\n../a/one.wav,x\n,empty\n/abs/two.wav,y\n../a/one.wav,again\n")
+    assert batch.load_inputs(str(csv_manifest)) == [str(tmp_path / "a" / "one.wav"), "/abs/two.wav"]
+
+    json_manifest = tmp_path / "takes.json"
+    json_manifest.write_text(json.dumps(["a/one.wav", {'path': "b/two.wav"}]))
+    assert batch.load_inputs(str(json_manifest)) == [str(tmp_path / "a" / "one.wav"), str(tmp_path / "b" / "two.wav")]
+
+    with pytest.raises(ValueError):
+        batch.load_inputs(str(tmp_path / "takes.txt"))
+
+
+def test_directories_are_walked(tmp_path):
+    _write_tone(str(tmp_path / "in" / "b" / "x.wav"))
+    _write_tone(str(tmp_path / "in" / "a.wav"))
+    (tmp_path / "in" / "notes.txt").write_text("not audio")
+    assert batch.load_inputs(str(tmp_path / "in")) == [str(tmp_path / "in" / "a.wav"), str(tmp_path / "in" / "b" / "x.wav")]
+
+
+def test_output_names_never_collide():
+    names = batch.output_names(["/in/a/take1.wav", "/in/b/take1.wav", "/in/b/take1.mp3", "/in/c/solo.wav"])
+    assert names["/in/a/take1.wav"] == os.path.join("a", "take1")
+    assert names["/in/c/solo.wav"] == os.path.join("c", "solo")
+    assert names["/in/b/take1.wav"].startswith(os.path.join("b", "take1_"))
+    assert len(set(names.values())) == 4
+    assert batch.output_names(["/in/a/take1.wav"]) == {"/in/a/take1.wav": "take1"}
+
+
+def test_same_file_names_in_different_folders_keep_their_outputs(tmp_path):
+    inputs = [_write_tone(str(tmp_path / "in" / folder / "take1.wav")) for folder in ("a", "b")]
+    out = str(tmp_path / "out")
+    report = batch.run_batch(inputs, ["normalize"], out, workers=2)
+    assert report['succeeded'] == 2
+    outputs = sorted(f['outputs']['normalized'] for f in report['files'])
+    assert outputs == [os.path.join(out, folder, "take1", "take1_normalized.wav") for folder in ("a", "b")]
+    assert all(os.path.exists(path) for path in outputs)
+
+
+def test_failures_are_summarised_per_file(tmp_path):
+    good = _write_tone(str(tmp_path / "in" / "good.wav"))
+    bad = str(tmp_path / "in" / "bad.wav")
+    with open(bad, "wb") as f:
+        f.write(b"not audio at all")
+    out = str(tmp_path / "out")
+    report = batch.run_batch([good, bad], ["denoise", "normalize"], out, workers=1)
+    assert (report['total'], report['succeeded'], report['failed']) == (2, 1, 1)
+    assert [f['input'] for f in report['failures']] == [bad]
+    assert report['failures'][0]['error'].startswith("denoise: ")
+    by_input = {f['input']: f for f in report['files']}
+    assert set(by_input[good]['stages']) == {"denoise", "normalize"}
+    assert set(by_input[bad]['stages']) == {"denoise"} # The chain stops at the failed stage
+    with open(os.path.join(out, "batch_report.json"), encoding="utf-8") as f:
+        assert json.load(f)['failed'] == 1
+
+
+def test_cli_exit_codes(tmp_path):
+    _write_tone(str(tmp_path / "in" / "one.wav"))
+    out = str(tmp_path / "out")
+    assert batch.main([str(tmp_path / "in"), "--steps", "normalize", "--workers", "1", "--output-dir", out]) == 0
+    assert os.path.exists(os.path.join(out, "one", "one_normalized.wav"))
+    (tmp_path / "empty").mkdir()
+    assert batch.main([str(tmp_path / "empty"), "--output-dir", out]) == 1
+    with pytest.raises(SystemExit):
+        batch.main([str(tmp_path / "in"), "--steps", "sharpen"])
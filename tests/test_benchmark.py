@@ -0,0 +1,43 @@
+import numpy as np
+import soundfile as sf
+import pytest
+from src import benchmark
+
+
+def test_synthetic_inputs_are_deterministic():
+    y = benchmark.synthesize(2.5, 8000, 2, seed=1)
+    assert y.shape == (20000, 2) and y.dtype == np.float32
+    np.testing.assert_array_equal(y, benchmark.synthesize(2.5, 8000, 2, seed=1))
+    assert not np.array_equal(y, benchmark.synthesize(2.5, 8000, 2, seed=2))
+
+    path = benchmark.synthetic_file(2.5, 8000, 2, seed=1)
+    assert benchmark.synthetic_file(2.5, 8000, 2, seed=1) == path
+    written, sr = sf.read(path, dtype='float32')
+    assert sr == 8000
+    np.testing.assert_allclose(written, y, atol=1 / 32768) # Block-wise file matches the in-memory signal (PCM_16)
+
+
+def _report(**cases):
+    return {'results': [{'stage': stage, 'duration_sec': 10, 'sample_rate': 44100, 'channels': 1, **case}
+                        for stage, case in cases.items()]}
+
+
+def test_compare_flags_regressions_over_the_threshold():
+    baseline = _report(denoise={'rtf': 0.10, 'peak_rss_mb': 200}, normalize={'rtf': 0.05, 'peak_rss_mb': 100},
+                       separate={'error': "no model"})
+    current = _report(denoise={'rtf': 0.13, 'peak_rss_mb': 210}, normalize={'error': "crashed"},
+                      separate={'rtf': 9.0, 'peak_rss_mb': 5000})
+    regressions = benchmark.compare(current, baseline, threshold=0.2)
+    assert [(r['case'], r['metric']) for r in regressions] == [("denoise/10s/44100hz/1ch", "rtf"),
+                                                                ("normalize/10s/44100hz/1ch", "error")]
+    assert regressions[0]['change'] == 0.3
+    assert benchmark.compare(current, baseline, threshold=0.5)[0]['metric'] == "error"
+
+
+def test_run_benchmarks_reports_each_case():
+    report = benchmark.run_benchmarks(stages=("normalize",), durations=(1,), rates=(8000,), channels=(1,), repeats=1)
+    assert report['meta']['demucs'] == "stub" and report['meta']['repeats'] == 1
+    [case] = report['results']
+    assert 'error' not in case, case.get('error')
+    assert benchmark.case_key(case) == "normalize/1s/8000hz/1ch"
+    assert case['wall_sec'] > 0 and case['rtf'] == pytest.approx(case['wall_sec'], abs=1e-4) # 1 s of audio
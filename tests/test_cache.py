@@ -0,0 +1,160 @@
+import os
+import time
+import numpy as np
+import pytest
+from src import cache, config
+
+
+@pytest.fixture
+def result_cache(tmp_path, monkeypatch):
+    store = cache.ResultCache(str(tmp_path / "cache"), max_bytes=1 << 30)
+    monkeypatch.setattr(cache, "result_cache", store)
+    monkeypatch.setattr(config, "CACHE_ENABLED", True)
+    return store
+
+
+def _write(path, content):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return str(path)
+
+
+def test_make_key_depends_on_stage_input_params_and_version(monkeypatch):
+    key = cache.ResultCache.make_key("denoise", "abc", {'floor': 0.02})
+    assert key == cache.ResultCache.make_key("denoise", "abc", {'floor': 0.02})
+    assert key != cache.ResultCache.make_key("normalize", "abc", {'floor': 0.02})
+    assert key != cache.ResultCache.make_key("denoise", "abd", {'floor': 0.02})
+    assert key != cache.ResultCache.make_key("denoise", "abc", {'floor': 0.03})
+    monkeypatch.setattr(config, "CACHE_VERSION", config.CACHE_VERSION + 1)
+    assert key != cache.ResultCache.make_key("denoise", "abc", {'floor': 0.02})
+
+
+def test_hash_source_matches_across_input_kinds(tmp_path):
+    path = tmp_path / "a.bin"
+    path.write_bytes(b"audio" * 1000)
+    assert cache.hash_source(str(path)) == cache.hash_source(path.read_bytes())
+    y = np.zeros(10, dtype=np.float32)
+    assert cache.hash_source((y, 44100)) != cache.hash_source((y, 48000))
+
+
+def test_cached_stage_hit_and_miss(result_cache, tmp_path):
+    calls = []
+
+    @cache.cached_stage("stage", params=("gain",))
+    def stage(input_file, gain=1.0, output_file=None):
+        calls.append(gain)
+        return {'success': True, 'message': "done", 'audio_bytes': b"x" * int(gain), 'elapsed_sec': 0.5,
+                'input_lufs': np.float32(-20.0)}
+
+    source = _write(tmp_path / "in.wav", "same content")
+    first = stage(source, 2.0)
+    second = stage(source, 2.0)
+    assert calls == [2.0]
+    assert second['cached'] and second['audio_bytes'] == b"xx"
+    assert {k: v for k, v in second.items() if k != 'cached'} == first # Same shape as the stored run
+
+    stage(source, 3.0) # Another param value is another key
+    stage(_write(tmp_path / "copy.wav", "same content"), 2.0) # Same content under another name hits
+    assert calls == [2.0, 3.0]
+    assert result_cache.stats()['hits'] == 2
+
+
+def test_failures_are_not_cached(result_cache, tmp_path):
+    calls = []
+
+    @cache.cached_stage("stage")
+    def stage(input_file):
+        calls.append(1)
+        return {'success': False, 'message': "boom"}
+
+    source = _write(tmp_path / "in.wav", "x")
+    stage(source)
+    stage(source)
+    assert len(calls) == 2
+
+
+def test_hit_writes_output_file(result_cache, tmp_path):
+    @cache.cached_stage("stage")
+    def stage(input_file, output_file=None):
+        return {'success': True, 'message': "done", 'output_path': _write(output_file, "result")}
+
+    source = _write(tmp_path / "in.wav", "x")
+    stage(source, output_file=str(tmp_path / "first.wav"))
+    hit = stage(source, output_file=str(tmp_path / "second.wav"))
+    assert hit['cached']
+    assert hit['output_path'] == str(tmp_path / "second.wav")
+    assert open(hit['output_path'], encoding="utf-8").read() == "result"
+
+
+def test_hit_without_a_destination_is_copied_out_of_the_cache(result_cache, tmp_path):
+    @cache.cached_stage("stage")
+    def stage(input_file, output_file=None):
+        return {'success': True, 'message': "done", 'output_path': _write(output_file or str(tmp_path / "default.wav"), "result")}
+
+    source = _write(tmp_path / "in.wav", "x")
+    stage(source)
+    first, second = stage(source), stage(source)
+    for hit in (first, second):
+        assert hit['cached']
+        assert os.path.dirname(os.path.dirname(hit['output_path'])) == config.PROCESSED_OUTPUT_DIR
+    assert first['output_path'] != second['output_path'] # Each caller owns its copy
+
+    result_cache.max_bytes = 0
+    result_cache.evict()
+    assert not os.listdir(result_cache.cache_dir)
+    assert open(first['output_path'], encoding="utf-8").read() == "result"
+
+
+def test_hit_materialises_stems_in_output_dir(result_cache, tmp_path):
+    @cache.cached_stage("separate", params=("model",))
+    def separate(audio_path, output_dir, model="m"):
+        track_dir = os.path.join(output_dir, model, os.path.splitext(os.path.basename(audio_path))[0])
+        os.makedirs(track_dir, exist_ok=True)
+        return {'success': True, 'message': "done", 'profile': "fast",
+                'output_paths': {'vocals': _write(os.path.join(track_dir, "vocals.wav"), "v"),
+                                 'other': _write(os.path.join(track_dir, "no_vocals.wav"), "o")}}
+
+    separate(_write(tmp_path / "song.wav", "x"), str(tmp_path / "run1"))
+    hit = separate(_write(tmp_path / "take.wav", "x"), str(tmp_path / "run2"))
+    assert hit['cached'] and hit['profile'] == "fast"
+    assert hit['output_paths'] == {'vocals': os.path.join(str(tmp_path / "run2"), "m", "take", "vocals.wav"),
+                                   'other': os.path.join(str(tmp_path / "run2"), "m", "take", "no_vocals.wav")}
+    assert open(hit['output_paths']['other'], encoding="utf-8").read() == "o"
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    store = cache.ResultCache(str(tmp_path / "cache"), max_bytes=2500)
+    for i, key in enumerate(("old", "mid", "new")):
+        store.put(key, {'success': True, 'message': key, 'audio_bytes': b"x" * 1000})
+        os.utime(os.path.join(store.cache_dir, key, "meta.json"), (time.time() + i, time.time() + i))
+    assert store.get("old") is None
+    assert store.get("mid")['message'] == "mid"
+    assert store.get("new")['message'] == "new"
+    assert store.stats()['entries'] == 2
+
+
+def test_disabled_cache_always_runs(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "CACHE_ENABLED", False)
+    calls = []
+
+    @cache.cached_stage("stage")
+    def stage(input_file):
+        calls.append(1)
+        return {'success': True, 'message': "done"}
+
+    source = _write(tmp_path / "in.wav", "x")
+    stage(source)
+    stage(source)
+    assert len(calls) == 2
+
+
+def test_stems_outside_output_dir_are_copied_out_of_the_cache(result_cache, tmp_path):
+    @cache.cached_stage("separate")
+    def separate(audio_path, output_dir):
+        return {'success': True, 'message': "done", 'output_paths': {'vocals': _write(tmp_path / "elsewhere.wav", "v")}}
+
+    separate(_write(tmp_path / "song.wav", "x"), str(tmp_path / "run1"))
+    hit = separate(_write(tmp_path / "song.wav", "x"), str(tmp_path / "run2"))
+    assert hit['cached']
+    assert os.path.dirname(os.path.dirname(hit['output_paths']['vocals'])) == str(tmp_path / "run2")
+    assert open(hit['output_paths']['vocals'], encoding="utf-8").read() == "v"
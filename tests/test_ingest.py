@@ -0,0 +1,74 @@
+import os
+import numpy as np
+import soundfile as sf
+import pytest
+from src import config, ingest
+
+
+@pytest.fixture
+def stereo_file(tmp_path):
+    rng = np.random.default_rng(0)
+    y = (0.1 * rng.standard_normal((2, 22050))).astype(np.float32)
+    path = str(tmp_path / "stereo.wav")
+    sf.write(path, y.T, 22050, subtype='FLOAT')
+    return path, y
+
+
+def test_round_trip_is_memory_mapped_and_exact(stereo_file):
+    path, y = stereo_file
+    multi, sr = ingest.load_audio(path, mono=False)
+    assert sr == 22050
+    assert isinstance(multi, np.memmap) and not multi.flags.writeable
+    assert multi.dtype == np.float32 and multi.shape == (2, 22050)
+    np.testing.assert_array_equal(multi, y)
+
+    mono, _ = ingest.load_audio(path, mono=True)
+    assert mono.shape == (22050,)
+    np.testing.assert_allclose(mono, y.mean(axis=0), atol=1e-7)
+
+
+def test_second_load_reuses_the_entry(stereo_file, monkeypatch):
+    path, _ = stereo_file
+    ingest.load_audio(path)
+
+    def no_decode(*args):
+        raise AssertionError("decoded twice")
+    monkeypatch.setattr(ingest, "_decode_to_npy", no_decode)
+    y, sr = ingest.load_audio(path)
+    assert sr == 22050 and len(y) == 22050
+    assert ingest.get_metadata(path)['channels'] == 2
+
+
+def test_mono_blocks_cover_the_file(stereo_file):
+    path, y = stereo_file
+    blocks = list(ingest.iter_mono_blocks(path, 5000))
+    assert [len(b) for b in blocks] == [5000] * 4 + [2050]
+    np.testing.assert_allclose(np.concatenate(blocks), y.mean(axis=0), atol=1e-7)
+
+
+def test_buffers_and_arrays_decode_like_paths(stereo_file):
+    path, y = stereo_file
+    with open(path, "rb") as f:
+        data = f.read()
+    from_bytes, sr = ingest.load_source(data, mono=False)
+    assert sr == 22050
+    np.testing.assert_array_equal(from_bytes, y)
+    from_array, sr = ingest.load_source((y, 22050), mono=True)
+    np.testing.assert_allclose(from_array, y.mean(axis=0), atol=1e-7)
+
+
+def test_evict_keeps_the_most_recent_entries(tmp_path):
+    paths = []
+    for i in range(3):
+        path = str(tmp_path / f"{i}.wav")
+        sf.write(path, np.full(1000, 0.1 * (i + 1), dtype=np.float32), 8000, subtype='FLOAT')
+        ingest.load_audio(path)
+        meta = [name for name in os.listdir(config.INGEST_DIR) if name.endswith(".json")]
+        for name in meta: # Age every entry so the newest is unambiguous
+            full = os.path.join(config.INGEST_DIR, name)
+            os.utime(full, (os.path.getmtime(full) - 10, os.path.getmtime(full) - 10))
+        paths.append(path)
+    ingest.evict(max_bytes=5000) # Each entry is ~4 kB of samples
+    remaining = [name for name in os.listdir(config.INGEST_DIR) if name.endswith(".npy")]
+    assert len(remaining) == 1
+    assert remaining[0].startswith(ingest.hash_file(paths[-1]))
@@ -0,0 +1,116 @@
+import time
+import sqlite3
+import threading
+import pytest
+from src import config, jobqueue, worker
+from src.jobqueue import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobqueue, "backoff_delay", lambda attempts: 0.0) # Retries are runnable at once
+    return JobQueue(str(tmp_path / "jobs.sqlite3"), lease_sec=60, max_attempts=2)
+
+
+def test_claim_takes_each_job_once(queue):
+    first = queue.enqueue("denoise", {'input': "a.wav"})
+    second = queue.enqueue("normalize", {'input': "b.wav"})
+    assert queue.enqueue("denoise", {'input': "other.wav"}, job_id=first) == first # Idempotent by ID
+
+    job = queue.claim("w1")
+    assert job['id'] == first and job['status'] == "running" and job['attempts'] == 1
+    assert job['payload'] == {'input': "a.wav"}
+    assert queue.claim("w2", kinds=("denoise",)) is None
+    assert queue.claim("w2")['id'] == second
+    assert queue.claim("w3") is None
+
+
+def test_complete_records_the_result(queue):
+    job_id = queue.enqueue("denoise", {})
+    queue.claim("w1")
+    assert not queue.complete(job_id, "someone-else", {'message': "no"})
+    assert queue.complete(job_id, "w1", {'message': "ok"})
+    job = queue.get(job_id)
+    assert job['status'] == "done" and job['result'] == {'message': "ok"}
+    assert queue.stats() == {'queued': 0, 'running': 0, 'done': 1, 'dead': 0}
+
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), lease_sec=0.05, max_attempts=3)
+    job_id = queue.enqueue("denoise", {})
+    assert queue.claim("dead-worker")['id'] == job_id
+    time.sleep(0.1)
+    job = queue.claim("w2")
+    assert job['id'] == job_id and job['attempts'] == 2 and job['lease_owner'] == "w2"
+    assert not queue.heartbeat(job_id, "dead-worker")
+    assert not queue.complete(job_id, "dead-worker", {'message': "late"})
+    assert queue.heartbeat(job_id, "w2")
+
+
+def test_lease_lost_on_the_last_attempt_dead_letters(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), lease_sec=0.05, max_attempts=1)
+    job_id = queue.enqueue("denoise", {})
+    queue.claim("w1")
+    time.sleep(0.1)
+    assert queue.claim("w2") is None
+    assert queue.get(job_id)['status'] == "dead"
+
+
+def test_failures_retry_then_dead_letter(queue):
+    job_id = queue.enqueue("denoise", {})
+    queue.claim("w1")
+    assert queue.fail(job_id, "w1", "transient") == "queued"
+    job = queue.claim("w1")
+    assert job['id'] == job_id and job['attempts'] == 2
+    assert queue.fail(job_id, "w1", "still failing") == "dead"
+    assert queue.claim("w1") is None
+    assert queue.get(job_id)['error'] == "still failing"
+
+    assert queue.requeue(job_id)
+    assert queue.claim("w1")['attempts'] == 1
+
+
+def test_permanent_failure_dead_letters_at_once(queue):
+    job_id = queue.enqueue("denoise", {})
+    queue.claim("w1")
+    assert queue.fail(job_id, "w1", "bad input", retryable=False) == "dead"
+
+
+def test_backoff_delay_grows_and_is_capped():
+    assert jobqueue.backoff_delay(1, base=10, cap=1000) <= 12
+    assert 32 <= jobqueue.backoff_delay(3, base=10, cap=1000) <= 48
+    assert jobqueue.backoff_delay(30, base=10, cap=100) <= 120
+
+
+def test_bad_params_dead_letter_without_retries(queue, tmp_path):
+    source = tmp_path / "in.wav"
+    source.write_bytes(b"")
+    job_id = queue.enqueue("normalize", {'input': str(source), 'params': {'target_lufs': "loud"}}, max_attempts=3)
+    assert worker.run_worker(queue.path, once=True) == 1
+    job = queue.get(job_id)
+    assert job['status'] == "dead" and job['attempts'] == 1
+    assert "target_lufs" in job['error']
+
+
+def test_check_params_converts_and_rejects():
+    checked = worker.check_params({'target_lufs': "-16", 'skip_silence': "yes"})
+    assert checked == {'target_lufs': -16.0, 'skip_silence': True}
+    for params in ({'noise_floor': "x"}, {'silence_fill': "noise"}, {'profile': "fastest"}, {'noise_profile': "../x"}):
+        with pytest.raises(ValueError):
+            worker.check_params(params)
+
+
+def test_worker_survives_a_locked_database(queue, monkeypatch):
+    monkeypatch.setattr(config, "QUEUE_POLL_SEC", 0.01)
+    stop = threading.Event()
+    calls = []
+
+    def claim(self, owner, kinds=None):
+        calls.append(owner)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        stop.set()
+        return None
+    monkeypatch.setattr(JobQueue, "claim", claim)
+    assert worker.run_worker(queue.path, stop=stop) == 0
+    assert len(calls) == 2
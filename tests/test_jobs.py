@@ -0,0 +1,108 @@
+import time
+import threading
+import pytest
+from src.jobs import Job, JobManager, JobRejected
+
+
+@pytest.fixture
+def manager():
+    manager = JobManager(max_workers=2, max_active=2)
+    yield manager
+    manager.shutdown()
+
+
+def _wait(manager, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while manager.get(job_id).active:
+        assert time.time() < deadline, "job did not finish"
+        time.sleep(0.01)
+    return manager.get(job_id)
+
+
+def test_submit_runs_the_job(manager):
+    job = _wait(manager, manager.submit("add", lambda a, b=0: a + b, 2, b=3))
+    assert (job.status, job.result, job.error, job.progress) == ("done", 5, None, 1.0)
+    assert job.name == "add" and job.finished >= job.started >= job.submitted
+    assert manager.stats() == {'queued': 0, 'running': 0, 'done': 1, 'failed': 0}
+
+
+def test_failures_are_recorded(manager):
+    def fail():
+        raise ValueError("bad input")
+    job = _wait(manager, manager.submit("fail", fail))
+    assert job.status == "failed" and job.error == "bad input" and job.result is None
+
+
+def test_submissions_past_the_limit_are_rejected(manager):
+    release = threading.Event()
+    running = [manager.submit(f"hold {i}", release.wait, 5) for i in range(2)]
+    with pytest.raises(JobRejected):
+        manager.submit("one too many", lambda: None)
+    assert len([job for job in map(manager.get, running) if job.active]) == 2
+    release.set()
+    for job_id in running:
+        _wait(manager, job_id)
+    _wait(manager, manager.submit("after", lambda: None)) # Finished jobs free their slot
+
+
+def test_progress_is_reported_and_clamped(manager):
+    seen, submitted, release = [], threading.Event(), threading.Event()
+
+    def work(progress_callback):
+        submitted.wait(5) # Until job_id is assigned
+        progress_callback(0.5, "halfway")
+        seen.append((manager.get(job_id).progress, manager.get(job_id).stage))
+        progress_callback(1.5)
+        seen.append(manager.get(job_id).progress)
+        release.wait(5)
+        return "ok"
+
+    job_id = manager.submit("work", work)
+    submitted.set()
+    deadline = time.time() + 5
+    while len(seen) < 2:
+        assert time.time() < deadline and manager.get(job_id).active, manager.get(job_id).error
+        time.sleep(0.01)
+    assert seen == [(0.5, "halfway"), 1.0]
+    assert manager.get(job_id).status == "running" and manager.get(job_id).stage == "halfway"
+    release.set()
+    assert _wait(manager, job_id).result == "ok"
+
+    job = Job("direct")
+    job.set_progress(-1)
+    assert job.progress == 0.0 and job.stage is None
+
+
+def test_prune_forgets_old_finished_jobs(manager):
+    done = manager.submit("done", lambda: None)
+    _wait(manager, done)
+    release = threading.Event()
+    running = manager.submit("running", release.wait, 5)
+    manager.prune(max_age=60)
+    assert manager.get(done) is not None
+    manager.get(done).finished -= 120
+    manager.prune(max_age=60)
+    assert manager.get(done) is None
+    assert manager.get(running) is not None # Active jobs are never pruned
+    release.set()
+    _wait(manager, running)
+
+
+def test_on_result_and_cleanup(manager):
+    cleaned = []
+    job = _wait(manager, manager.submit("ok", lambda: {'audio_bytes': b"x"},
+                                       on_result=lambda result: {'output_path': "out.wav"},
+                                       cleanup=lambda: cleaned.append("ok")))
+    assert job.result == {'output_path': "out.wav"} and cleaned == ["ok"]
+
+    def fail():
+        raise RuntimeError("boom")
+
+    def broken_cleanup():
+        cleaned.append("failed")
+        raise OSError("already gone")
+
+    job = _wait(manager, manager.submit("fail", fail, on_result=lambda result: pytest.fail("on_result ran"),
+                                        cleanup=broken_cleanup))
+    assert job.status == "failed" and job.error == "boom"
+    assert cleaned == ["ok", "failed"] # Cleanup runs after a failure too; its own error doesn't hide the job's
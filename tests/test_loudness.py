@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from src import loudness
+
+SR = 48000
+
+
+def _tone(freq, seconds=1.0, amplitude=1.0, phase=0.0, sr=SR):
+    """ A sine with 10 ms fades, so no reading comes from the ringing of a hard start or stop. """
+    t = np.arange(int(seconds * sr)) / sr
+    fade = np.minimum(1.0, np.minimum(t, t[-1] - t) / 0.01)
+    return amplitude * fade * np.sin(2 * np.pi * freq * t + phase)
+
+
+def test_true_peak_finds_inter_sample_peaks():
+    y = _tone(SR / 4, phase=np.pi / 4) # Every sample is at +-0.707; the waveform peaks at 1.0 between them
+    assert np.abs(y).max() == pytest.approx(np.sqrt(0.5))
+    assert loudness.true_peak(y) == pytest.approx(0.0, abs=0.1)
+
+
+@pytest.mark.parametrize("freq", [997, 10000, 15000, 19000, 20000])
+def test_true_peak_holds_up_to_20_khz(freq):
+    for phase in np.linspace(0, np.pi, 9):
+        assert loudness.true_peak(_tone(freq, phase=phase)) == pytest.approx(0.0, abs=0.2)
+
+
+def test_meter_true_peak_matches_the_whole_buffer():
+    y = np.stack([_tone(19000, amplitude=0.5), _tone(SR / 4, amplitude=0.8, phase=np.pi / 4)])
+    meter = loudness.LoudnessMeter(SR, 2, true_peak=True)
+    for start in range(0, y.shape[1], 7000):
+        meter.push(y[:, start:start + 7000].T)
+    assert meter.true_peak() == pytest.approx(loudness.true_peak(y), abs=1e-9)
+
+
+def test_limiter_holds_the_ceiling():
+    y = np.concatenate([_tone(1000, amplitude=0.3), _tone(19000, amplitude=1.2), _tone(SR / 4, phase=np.pi / 4)])
+    limited = loudness.limit_true_peak(y, SR, ceiling_dbtp=-1.0)
+    assert loudness.true_peak(limited) <= -1.0 + 0.05
+    quiet = slice(0, SR // 2) # Well before the first over: untouched
+    np.testing.assert_array_equal(limited[quiet], y[quiet])
+
+
+def _stereo_tone(*segments):
+    """ EBU Tech 3341/3342 style signal: 1 kHz on both channels, (dBFS, seconds) segments back to back. """
+    return np.concatenate([np.tile(_tone(1000, seconds, 10 ** (level / 20)), (2, 1)) for level, seconds in segments],
+                          axis=1)
+
+
+@pytest.mark.parametrize("segments, expected", [
+    ([(-23, 20)], -23.0), # Tech 3341 case 1
+    ([(-33, 20)], -33.0), # Case 2
+    ([(-36, 10), (-23, 60), (-36, 10)], -23.0), # Case 3: relative gate
+    ([(-72, 10), (-36, 10), (-23, 60), (-36, 10), (-72, 10)], -23.0), # Case 4: absolute and relative gates
+])
+def test_integrated_loudness_matches_ebu_reference(segments, expected):
+    assert loudness.integrated_loudness(_stereo_tone(*segments), SR) == pytest.approx(expected, abs=0.1)
+
+
+def test_mono_sine_reads_per_bs1770():
+    # A full-scale 997 Hz sine in one channel reads -3.01 LKFS (BS.1770-4, 2.1)
+    assert loudness.integrated_loudness(_tone(997, 10), SR) == pytest.approx(-3.01, abs=0.05)
+
+
+def test_streaming_meter_matches_the_whole_buffer():
+    y = _stereo_tone((-36, 10), (-20, 20), (-30, 20))
+    meter = loudness.LoudnessMeter(SR, 2)
+    for start in range(0, y.shape[1], 12345):
+        meter.push(y[:, start:start + 12345].T)
+    assert meter.integrated_loudness() == pytest.approx(loudness.integrated_loudness(y, SR), abs=1e-9)
+
+
+def test_loudness_range_matches_ebu_reference():
+    meter = loudness.LoudnessMeter(SR, 2)
+    meter.push(_stereo_tone((-20, 20), (-30, 20)).T)
+    assert meter.loudness_range() == pytest.approx(10.0, abs=1.0) # Tech 3342 case 1
+
+
+def test_silence_and_short_input_have_no_loudness():
+    assert loudness.integrated_loudness(np.zeros(SR), SR) == -float('inf')
+    assert loudness.integrated_loudness(_tone(1000, 0.3), SR) == -float('inf') # Shorter than one 400 ms block
@@ -0,0 +1,123 @@
+import json
+import logging
+import importlib
+import pytest
+from src import config, metrics
+
+INSTRUMENTED_MODULES = ["batch", "cache", "ingest", "jobs", "loudness", "noise_profiles", "pipeline", "previews",
+                        "processing", "server", "silence", "spectral", "utils", "warmup", "worker", "youtube"]
+OPTIONAL_IMPORTS = {'utils': "streamlit", 'youtube': "yt_dlp"}
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = metrics.Registry()
+    monkeypatch.setattr(metrics, "registry", registry)
+    monkeypatch.setattr(config, "METRICS_ENABLED", True)
+    return registry
+
+
+def test_counters_add_up_per_label_set(registry):
+    metrics.inc("jobs_total", kind="denoise")
+    metrics.inc("jobs_total", 2, kind="denoise")
+    metrics.inc("jobs_total", kind="normalize")
+    assert registry.snapshot()['counters'] == {'jobs_total{kind="denoise"}': 3.0, 'jobs_total{kind="normalize"}': 1.0}
+
+
+def test_histograms_count_and_sum(registry):
+    for value in (0.003, 0.2, 0.2, 1000):
+        metrics.observe("wait_seconds", value, step="decode")
+    assert registry.snapshot()['histograms'] == {'wait_seconds{step="decode"}': {'count': 4, 'sum': 1000.403}}
+
+
+def test_disabled_metrics_record_nothing(registry, monkeypatch):
+    monkeypatch.setattr(config, "METRICS_ENABLED", False)
+    metrics.inc("jobs_total")
+    metrics.observe("wait_seconds", 1.0)
+    with metrics.timer("decode") as timing:
+        timing.bytes = 10
+    assert timing is metrics._NULL_TIMER and timing.bytes is None
+    assert registry.snapshot() == {'counters': {}, 'histograms': {}}
+
+
+def test_prometheus_rendering(registry):
+    metrics.inc("jobs_total", kind='say "hi"\n')
+    for value in (0.02, 0.3, 5000):
+        metrics.observe("wait_seconds", value, buckets=(0.1, 1), step="decode")
+    lines = registry.render().splitlines()
+    assert "# TYPE vocalizer_jobs_total counter" in lines
+    assert 'vocalizer_jobs_total{kind="say \\"hi\\"\\n"} 1' in lines
+    assert "# TYPE vocalizer_wait_seconds histogram" in lines
+    start = lines.index('vocalizer_wait_seconds_bucket{step="decode",le="0.1"} 1')
+    assert lines[start:start + 5] == ['vocalizer_wait_seconds_bucket{step="decode",le="0.1"} 1',
+                                      'vocalizer_wait_seconds_bucket{step="decode",le="1"} 2',
+                                      'vocalizer_wait_seconds_bucket{step="decode",le="+Inf"} 3',
+                                      'vocalizer_wait_seconds_sum{step="decode"} 5000.32',
+                                      'vocalizer_wait_seconds_count{step="decode"} 3']
+    assert any(line.startswith("vocalizer_process_cpu_seconds_total ") for line in lines)
+
+
+def test_write_prometheus(registry, tmp_path):
+    metrics.inc("jobs_total")
+    path = tmp_path / "metrics" / "vocalizer.prom"
+    metrics.write_prometheus(str(path))
+    assert "vocalizer_jobs_total 1" in path.read_text().splitlines()
+    assert [p.name for p in path.parent.iterdir()] == ["vocalizer.prom"]
+
+
+def test_timer_records_throughput_and_errors(registry):
+    with metrics.timer("decode", format="wav") as timing:
+        timing.bytes, timing.audio_sec = 4096, 10.0
+    with pytest.raises(ValueError):
+        with metrics.timer("decode", format="wav"):
+            raise ValueError("corrupt")
+
+    @metrics.timed("encode")
+    def encode(ok):
+        return {'success': ok}
+    encode(True)
+    encode(False)
+
+    counters = registry.snapshot()['counters']
+    assert counters['stage_runs_total{format="wav",stage="decode"}'] == 2
+    assert counters['stage_errors_total{format="wav",stage="decode"}'] == 1
+    assert counters['stage_bytes_total{format="wav",stage="decode"}'] == 4096
+    assert counters['stage_audio_seconds_total{format="wav",stage="decode"}'] == 10.0
+    assert counters['stage_runs_total{stage="encode"}'] == 2 and counters['stage_errors_total{stage="encode"}'] == 1
+    assert registry.snapshot()['histograms']['stage_rtf{format="wav",stage="decode"}']['count'] == 1
+
+
+def test_correlation_tags_log_records():
+    records = []
+
+    class Collect(logging.Handler):
+        def emit(self, record):
+            records.append(record)
+
+    handler = Collect()
+    handler.addFilter(metrics.CorrelationFilter())
+    logger = logging.getLogger("test_metrics.correlation")
+    logger.addHandler(handler)
+    try:
+        logger.warning("outside")
+        with metrics.correlation("job-1") as correlation_id:
+            assert correlation_id == metrics.current_correlation_id() == "job-1"
+            with metrics.correlation("job-2"):
+                logger.warning("nested")
+            logger.warning("inside")
+        logger.warning("after")
+    finally:
+        logger.removeHandler(handler)
+    assert [(r.getMessage(), r.correlation_id) for r in records] == [
+        ("outside", None), ("nested", "job-2"), ("inside", "job-1"), ("after", None)]
+
+    entry = json.loads(metrics.JsonFormatter().format(records[2]))
+    assert entry['correlation_id'] == "job-1" and entry['message'] == "inside" and entry['level'] == "WARNING"
+
+
+@pytest.mark.parametrize("name", INSTRUMENTED_MODULES)
+def test_instrumented_modules_import(name):
+    if name in OPTIONAL_IMPORTS:
+        pytest.importorskip(OPTIONAL_IMPORTS[name])
+    module = importlib.import_module(f"src.{name}")
+    assert module.metrics is metrics
@@ -0,0 +1,92 @@
+import os
+import numpy as np
+import soundfile as sf
+import pytest
+from src import config, noise_profiles, processing
+
+SR = 16000
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(config, "CACHE_ENABLED", False)
+
+
+def _write(path, y, sr=SR):
+    sf.write(path, y.astype(np.float32), sr, subtype='FLOAT')
+    return path
+
+
+@pytest.fixture
+def noise_clip(tmp_path):
+    return _write(str(tmp_path / "room.wav"), 0.01 * np.random.default_rng(0).standard_normal(4 * SR))
+
+
+def test_save_load_round_trip(noise_clip):
+    profile = noise_profiles.estimate([noise_clip], "room", quietest=1.0)
+    assert os.path.exists(os.path.join(config.NOISE_PROFILE_DIR, "room.npz"))
+    loaded = noise_profiles.load("room")
+    np.testing.assert_array_equal(loaded.magnitude, profile.magnitude)
+    assert (loaded.sample_rate, loaded.n_fft, loaded.hop_length) == (SR, 2048, 512)
+    assert loaded.digest == profile.digest and loaded.name == "room"
+    assert loaded.meta['sources'] == ["room.wav"]
+    assert noise_profiles.fingerprint("room") == profile.digest
+    assert [p['name'] for p in noise_profiles.list_profiles()] == ["room"]
+
+
+def test_quietest_frames_ignore_the_programme(tmp_path, noise_clip):
+    """ A take that is mostly loud tone gives about the same profile as its noise alone. """
+    noise = sf.read(noise_clip, dtype='float32')[0]
+    t = np.arange(20 * SR) / SR
+    take = 0.01 * np.random.default_rng(1).standard_normal(len(t)) + 0.5 * np.sin(2 * np.pi * 440 * t) * (t > 2)
+    from_take = noise_profiles.estimate([_write(str(tmp_path / "take.wav"), take)], quietest=0.05)
+    from_clip = noise_profiles.estimate([_write(str(tmp_path / "noise.wav"), noise)], quietest=1.0)
+    ratio = np.median(from_take.magnitude / from_clip.magnitude)
+    assert 0.9 < ratio < 1.1
+
+
+def test_rate_mismatch_is_rejected(tmp_path, noise_clip):
+    noise_profiles.estimate([noise_clip], "room", quietest=1.0)
+    with pytest.raises(ValueError):
+        noise_profiles.load("room").check_rate(44100)
+
+    other = _write(str(tmp_path / "other.wav"), 0.1 * np.random.default_rng(2).standard_normal(44100), sr=44100)
+    result = processing.adaptive_noise_reduction(other, noise_profile="room", streaming=False)
+    assert not result['success'] and "16000 Hz" in result['message']
+    with pytest.raises(ValueError):
+        noise_profiles.estimate([noise_clip, other])
+
+
+def test_matching_profile_denoises(noise_clip):
+    noise_profiles.estimate([noise_clip], "room", quietest=1.0)
+    result = processing.adaptive_noise_reduction(noise_clip, noise_profile="room", streaming=False)
+    assert result['success']
+
+
+def test_names_are_plain_file_names(noise_clip):
+    for name in ("../room", "", ".hidden", "a/b"):
+        with pytest.raises(ValueError):
+            noise_profiles.profile_path(name)
+    with pytest.raises(FileNotFoundError):
+        noise_profiles.load("missing")
+    result = processing.adaptive_noise_reduction(noise_clip, noise_profile="missing", streaming=False)
+    assert not result['success']
+
+
+def test_silent_input_has_no_profile(tmp_path):
+    with pytest.raises(ValueError):
+        noise_profiles.estimate([_write(str(tmp_path / "silent.wav"), np.zeros(SR))])
+
+
+def test_clip_uses_every_frame(noise_clip, monkeypatch):
+    monkeypatch.setattr(config, "NOISE_PROFILE_MAX_FRAMES", 16)
+    frames = 1 + (4 * SR - 2048) // 512
+    assert noise_profiles.estimate([noise_clip], quietest=1.0).meta['frames'] == frames
+    assert noise_profiles.estimate([noise_clip], quietest=0.5).meta['frames'] == 16
+
+
+def test_cli_builds_and_shows(noise_clip, capsys):
+    assert noise_profiles.main(["build", "room", noise_clip, "--clip"]) == 0
+    assert noise_profiles.main(["show", "room"]) == 0
+    assert '"quietest": 1.0' in capsys.readouterr().out
+    assert noise_profiles.main(["show", "nope"]) == 1
@@ -0,0 +1,53 @@
+import os
+import numpy as np
+import soundfile as sf
+from src import config, loudness, pipeline
+
+
+def _noisy_tone(path, seconds=3.0, sr=16000):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sr)) / sr
+    y = 0.01 * rng.standard_normal(len(t))
+    y[sr // 2:] += 0.2 * np.sin(2 * np.pi * 440 * t[sr // 2:]) # Leading noise for the noise profile
+    sf.write(str(path), y.astype(np.float32), sr, subtype='FLOAT')
+    return str(path)
+
+
+def _files(root):
+    return {os.path.relpath(os.path.join(d, f), root) for d, _, files in os.walk(root) for f in files}
+
+
+def test_denoise_and_normalize_write_only_the_result(tmp_path):
+    source = _noisy_tone(tmp_path / "take.wav")
+    before = _files(tmp_path)
+    progress = []
+    result = pipeline.run_pipeline(source, ["denoise", "normalize"], target_lufs=-20.0,
+                                   progress_callback=lambda fraction, stage: progress.append((fraction, stage)))
+    assert result['success'], result['message']
+    assert result['output_path'] == os.path.join(config.PROCESSED_OUTPUT_DIR, "take_pipeline.wav")
+    assert set(result['timings']) == {"decode", "denoise", "normalize", "encode", "total"}
+    assert progress == [(0.0, "denoise"), (1 / 3, "normalize"), (2 / 3, "encode")]
+
+    # Stages hand buffers to each other: the only new files are the result and the decoded-input cache
+    output = os.path.relpath(result['output_path'], tmp_path)
+    new = _files(tmp_path) - before
+    assert output in new
+    assert all(path.startswith(os.path.relpath(config.INGEST_DIR, tmp_path)) for path in new - {output})
+
+    y, sr = sf.read(result['output_path'], dtype='float32')
+    assert sr == result['sample_rate'] == 16000 and len(y) == 48000
+    assert abs(loudness.integrated_loudness(y, sr) - (-20.0)) < 0.5
+    assert np.abs(y[:sr // 4]).mean() < np.abs(sf.read(source)[0][:sr // 4]).mean() # The noise was reduced
+
+
+def test_unknown_stage_fails_without_output(tmp_path):
+    source = _noisy_tone(tmp_path / "take.wav")
+    result = pipeline.run_pipeline(source, ["denoise", "sharpen"], output_file=str(tmp_path / "out.wav"))
+    assert not result['success'] and "sharpen" in result['message']
+    assert result['output_path'] is None and not os.path.exists(tmp_path / "out.wav")
+
+
+def test_missing_input_fails(tmp_path):
+    result = pipeline.run_pipeline(str(tmp_path / "missing.wav"), ["normalize"])
+    assert not result['success'] and "not found" in result['message']
+    assert 'total' in result['timings']
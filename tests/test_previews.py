@@ -0,0 +1,80 @@
+import io
+import os
+import hashlib
+import numpy as np
+import soundfile as sf
+import pytest
+from src import cache, config, previews
+
+
+def _wav(path, seconds=1.0, sr=44100):
+    t = np.arange(int(seconds * sr)) / sr
+    sf.write(str(path), (0.1 * np.sin(2 * np.pi * 440 * t)).astype(np.float32), sr, subtype='FLOAT')
+    return str(path)
+
+
+def _wav_bytes(seconds=1.0, sr=16000):
+    t = np.arange(int(seconds * sr)) / sr
+    buffer = io.BytesIO()
+    sf.write(buffer, (0.1 * np.sin(2 * np.pi * 440 * t)).astype(np.float32), sr, format='WAV')
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("fmt", ["mp3", "opus", "flac"])
+def test_preview_is_encoded_once(tmp_path, fmt):
+    source = _wav(tmp_path / "take.wav")
+    path, mime = previews.get_preview(source, fmt)
+    assert mime == previews.PREVIEW_FORMATS[fmt][3]
+    assert path.endswith(previews.PREVIEW_FORMATS[fmt][2]) and os.path.dirname(path) == config.PREVIEW_DIR
+    assert os.path.getsize(path) < os.path.getsize(source)
+    info = sf.info(path)
+    assert info.samplerate == (previews.OPUS_SAMPLE_RATE if fmt == "opus" else 44100)
+    assert abs(info.duration - 1.0) < 0.1
+
+    mtime = os.path.getmtime(path)
+    assert previews.get_preview(_wav(tmp_path / "copy.wav"), fmt) == (path, mime) # Keyed on content, not name
+    assert os.path.getmtime(path) >= mtime and len(os.listdir(config.PREVIEW_DIR)) == 1
+
+
+def test_compressed_sources_play_as_they_are(tmp_path):
+    source = str(tmp_path / "download.m4a")
+    open(source, "wb").close()
+    assert previews.get_preview(source) == (source, "audio/mp4")
+
+
+def test_failed_encode_falls_back_to_the_original(tmp_path, monkeypatch):
+    def broken(input_file, output_file, fmt):
+        open(output_file, "wb").close()
+        raise RuntimeError("encoder missing")
+    monkeypatch.setattr(previews, "_encode", broken)
+    source = _wav(tmp_path / "take.wav")
+    assert previews.get_preview(source, "mp3") == (source, "audio/wav")
+    assert not os.listdir(config.PREVIEW_DIR) # No half-written preview is left behind
+
+
+def test_evict_drops_least_recently_played(tmp_path):
+    os.makedirs(config.PREVIEW_DIR)
+    for age, name in ((300, "old.mp3"), (200, "played.mp3"), (100, "new.mp3")):
+        path = os.path.join(config.PREVIEW_DIR, name)
+        with open(path, "wb") as f:
+            f.write(b"\0" * 100)
+        os.utime(path, (1000 - age, 1000 - age))
+    previews.evict(max_bytes=250)
+    assert sorted(os.listdir(config.PREVIEW_DIR)) == ["new.mp3", "played.mp3"]
+
+
+def test_spill_audio_bytes(tmp_path):
+    audio_bytes = _wav_bytes()
+    result = previews.spill_audio_bytes({'success': True, 'message': "done", 'audio_bytes': audio_bytes},
+                                        "noise_reduced", str(tmp_path / "take.wav"))
+    assert 'audio_bytes' not in result and result['message'] == "done"
+    digest = hashlib.sha256(audio_bytes).hexdigest()
+    assert result['output_path'] == os.path.join(config.PROCESSED_OUTPUT_DIR, f"take_noise_reduced_{digest[:8]}.wav")
+    with open(result['output_path'], "rb") as f:
+        assert f.read() == audio_bytes
+    assert cache.hash_file(result['output_path']) == digest
+
+    streamed = {'success': True, 'output_path': result['output_path']}
+    assert previews.spill_audio_bytes(streamed) is streamed # Results already on disk pass through
+    failed = {'success': False, 'message': "boom"}
+    assert previews.spill_audio_bytes(failed) is failed
@@ -0,0 +1,103 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pytest
+from src import config, demucs_pool, processing
+
+
+class _FakeModel:
+    sources = ['drums', 'bass', 'other', 'vocals']
+    samplerate = 8000
+    audio_channels = 2
+
+
+class _FakePool:
+    """ Runs submit_array inline: silent segments through the real code path, others split evenly. """
+    max_workers = 2
+
+    def submit_array(self, wav, sr, model, stems, settings=None):
+        future = Future()
+        if np.max(np.abs(wav)) == 0:
+            future.set_result(demucs_pool.separate_array_in_process(wav, sr, model, stems, settings))
+        else:
+            future.set_result(({stems: wav * 0.5, f"no_{stems}": wav * 0.5}, sr))
+        return future
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    monkeypatch.setattr(demucs_pool, "get_resident_model", lambda name: _FakeModel())
+
+
+def test_normalisation_of_digital_silence_is_finite():
+    wav = np.zeros((2, 1000), dtype=np.float32)
+    offset, scale = demucs_pool._normalisation(wav)
+    assert scale > 0
+    assert np.all(np.isfinite((wav - offset) / scale))
+
+
+def test_silent_buffer_skips_the_model(fake_model):
+    named, sr = demucs_pool.separate_array_in_process(np.zeros((2, 4000), dtype=np.float32), 8000, "htdemucs", "vocals")
+    assert sr == 8000
+    assert set(named) == {"vocals", "no_vocals"}
+    for audio in named.values():
+        assert audio.shape == (2, 4000)
+        assert not np.any(audio)
+
+
+def test_silent_buffer_is_resampled_to_the_model_rate(fake_model):
+    named, sr = demucs_pool.separate_array_in_process(np.zeros(4000, dtype=np.float32), 16000, "htdemucs", "four")
+    assert set(named) == set(_FakeModel.sources)
+    assert all(audio.shape == (2, 2000) for audio in named.values())
+
+
+def test_segmented_with_silent_tail_stays_finite(fake_model):
+    sr = 8000
+    t = np.arange(int(2.5 * sr)) / sr
+    wav = np.zeros((2, 4 * sr), dtype=np.float32)
+    wav[:, :len(t)] = 0.5 * np.sin(2 * np.pi * 220 * t)
+    stitched, out_sr = demucs_pool.separate_segmented(wav, sr, "htdemucs", "vocals", segment_sec=1.0,
+                                                      overlap_sec=0.1, pool=_FakePool())
+    assert out_sr == sr
+    total = stitched["vocals"] + stitched["no_vocals"]
+    assert np.all(np.isfinite(total))
+    np.testing.assert_allclose(total, wav, atol=1e-6)
+
+
+def _failing_init(model_names, torch_threads):
+    raise RuntimeError("model download failed")
+
+
+def test_broken_pool_is_replaced(monkeypatch):
+    monkeypatch.setattr(demucs_pool, "_init_worker", _failing_init)
+    monkeypatch.setattr(config, "DEMUCS_POOL_WORKERS", 1)
+    demucs_pool.shutdown_pool()
+    try:
+        pool = demucs_pool.get_pool()
+        with pytest.raises(BrokenProcessPool):
+            pool.warm_up()
+        assert pool.broken
+        replacement = demucs_pool.get_pool()
+        assert replacement is not pool
+        assert not replacement.broken
+    finally:
+        demucs_pool.shutdown_pool()
+
+
+def test_auto_profile_thresholds(monkeypatch):
+    choose = processing.choose_demucs_profile
+    # On the reference CPU count a 300 s budget fits 300 / rtf seconds of audio: best 107 s, balanced 857 s, fast 1000 s
+    assert choose(107, cpus=4, budget_sec=300) == "best"
+    assert choose(108, cpus=4, budget_sec=300) == "balanced"
+    assert choose(857, cpus=4, budget_sec=300) == "balanced"
+    assert choose(858, cpus=4, budget_sec=300) == "fast"
+    assert choose(1000, cpus=4, budget_sec=300) == "fast"
+    assert choose(5000, cpus=4, budget_sec=300) == "fast" # Nothing fits: the fastest
+    assert choose(214, cpus=8, budget_sec=300) == "best" # Twice the cores, twice the audio
+    assert choose(215, cpus=8, budget_sec=300) == "balanced"
+    assert choose(10, cpus=4, budget_sec=0) == "fast"
+
+    monkeypatch.setattr(config, "DEMUCS_PROFILE", "auto")
+    assert choose(None) == "balanced" # Unknown duration
+    monkeypatch.setattr(config, "DEMUCS_PROFILE", "best")
+    assert choose(None) == "best"
@@ -0,0 +1,104 @@
+import io
+import os
+import json
+import asyncio
+import threading
+from unittest import mock
+import numpy as np
+import soundfile as sf
+from tornado.tcpclient import TCPClient
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from src import config, processing, server
+
+
+def _wav_bytes(seconds=1.0, sr=16000):
+    t = np.arange(int(seconds * sr)) / sr
+    buffer = io.BytesIO()
+    sf.write(buffer, (0.1 * np.sin(2 * np.pi * 440 * t)).astype(np.float32), sr, format='WAV', subtype='PCM_16')
+    return buffer.getvalue()
+
+
+def _work_dirs():
+    if not os.path.isdir(config.TEMP_DIR_BASE):
+        return []
+    return [name for name in os.listdir(config.TEMP_DIR_BASE) if name.startswith("http-")]
+
+
+class ServerTest(AsyncHTTPTestCase):
+    def setUp(self):
+        config.CACHE_ENABLED, self._cache_enabled = False, config.CACHE_ENABLED
+        self.service = server.Service(workers=2, max_active=2)
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        self.service.executor.shutdown(wait=True)
+        config.CACHE_ENABLED = self._cache_enabled
+
+    def get_app(self):
+        return server.make_app(self.service)
+
+    def test_busy_server_answers_429(self):
+        self.service.active = self.service.max_active
+        response = self.fetch("/v1/normalize", method="POST", body=_wav_bytes())
+        assert response.code == 429
+        assert response.headers["Retry-After"] == str(config.SERVER_RETRY_AFTER_SEC)
+        assert json.loads(response.body)['error'] == "Server busy"
+        assert self.service.active == self.service.max_active # A rejected request takes no slot
+
+    def test_bad_parameters_are_400(self):
+        response = self.fetch("/v1/denoise?noise_floor=lots", method="POST", body=_wav_bytes())
+        assert response.code == 400
+        assert "noise_floor" in json.loads(response.body)['error']
+        assert self.fetch("/v1/denoise?silence_fill=noise", method="POST", body=_wav_bytes()).code == 400
+        assert self.fetch("/v1/normalize", method="POST", body=b"").code == 400
+        assert self.service.active == 0 and not _work_dirs()
+
+    def test_upload_is_processed_and_streamed_back(self):
+        body = _wav_bytes(seconds=2.0)
+        response = self.fetch("/v1/normalize?filename=take.wav&target_lufs=-20", method="POST", body=body)
+        assert response.code == 200, response.body
+        assert response.headers["Content-Disposition"] == 'attachment; filename="take_normalized.wav"'
+        assert int(response.headers["Content-Length"]) == len(response.body)
+        y, sr = sf.read(io.BytesIO(response.body))
+        assert sr == 16000 and len(y) == 32000
+        assert self.service.active == 0 and not _work_dirs()
+
+    @gen_test
+    async def test_disconnect_keeps_the_slot_until_the_job_ends(self):
+        started, release = threading.Event(), threading.Event()
+
+        def slow_denoise(path, *args, output_file=None, **kwargs):
+            started.set()
+            release.wait(10)
+            with open(output_file, "wb") as f:
+                f.write(_wav_bytes())
+            return {'success': True, 'output_path': output_file}
+
+        closed = threading.Event()
+        original = server.BaseHandler.on_connection_close
+
+        def on_connection_close(handler):
+            original(handler)
+            closed.set()
+
+        async def wait_for(condition):
+            for _ in range(500):
+                if condition():
+                    return
+                await asyncio.sleep(0.01)
+            raise AssertionError("timed out")
+
+        with mock.patch.object(processing, "adaptive_noise_reduction", slow_denoise), \
+             mock.patch.object(server.BaseHandler, "on_connection_close", on_connection_close):
+            body = _wav_bytes()
+            stream = await TCPClient().connect("127.0.0.1", self.get_http_port())
+            await stream.write(b"POST /v1/denoise HTTP/1.1\r\nHost: test\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+            await wait_for(started.is_set)
+            stream.close()
+            await wait_for(closed.is_set)
+            assert self.service.active == 1 and len(_work_dirs()) == 1
+
+            release.set()
+            await wait_for(lambda: self.service.active == 0)
+            assert not _work_dirs()
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from src import silence
+
+SR = 8000 # 20 ms frames are 160 samples
+PAD = 13 * 160 # 0.25 s of padding rounds up to whole frames
+
+
+def _tone(seconds, amplitude=0.3):
+    t = np.arange(int(seconds * SR)) / SR
+    return (amplitude * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+
+
+def _quiet(seconds):
+    return np.zeros(int(seconds * SR), dtype=np.float32)
+
+
+def test_short_pause_stays_inside_a_padded_region():
+    y = np.concatenate([_quiet(2), _tone(2), _quiet(0.5), _tone(1.5), _quiet(4)])
+    part = silence.partition(y, SR, min_silence_sec=1.0, pad_sec=0.25)
+    assert part.regions.tolist() == [[2 * SR - PAD, 6 * SR + PAD]]
+    assert part.total == len(y)
+    assert part.savings == pytest.approx(1 - (4 * SR + 2 * PAD) / (10 * SR))
+
+
+def test_long_pause_splits_regions():
+    y = np.concatenate([_quiet(1), _tone(1), _quiet(3), _tone(1), _quiet(1)])
+    part = silence.partition(y, SR, min_silence_sec=1.0, pad_sec=0.25)
+    assert part.regions.tolist() == [[SR - PAD, 2 * SR + PAD], [5 * SR - PAD, 6 * SR + PAD]]
+
+
+def test_padding_is_clipped_at_the_edges():
+    y = np.concatenate([_tone(1), _quiet(3), _tone(1.01)])
+    part = silence.partition(y, SR, min_silence_sec=1.0, pad_sec=0.25)
+    assert part.regions[0, 0] == 0
+    assert part.regions[-1, 1] == len(y)
+
+
+def test_threshold_decides_what_is_silence():
+    y = np.concatenate([_quiet(1), _tone(1, amplitude=10 ** (-60 / 20)), _quiet(1)]) # ~-63 dBFS RMS
+    assert len(silence.partition(y, SR, threshold_dbfs=-50).regions) == 0
+    assert len(silence.partition(y, SR, threshold_dbfs=-70).regions) == 1
+
+
+def test_all_silent_input_has_no_regions():
+    part = silence.partition(_quiet(3), SR)
+    assert part.active_samples == 0 and part.savings == 1.0
+    assert part.compact(_quiet(3)).shape == (0,)
+
+
+def test_compact_expand_round_trip_with_passthrough():
+    rng = np.random.default_rng(0)
+    y = np.concatenate([_quiet(1), _tone(1), _quiet(2), _tone(1), _quiet(1)])
+    y += 1e-4 * rng.standard_normal(len(y)).astype(np.float32) # Under the threshold, but not digital silence
+    stereo = np.stack([y, -y])
+    part = silence.partition(stereo, SR)
+    compacted = part.compact(stereo)
+    assert compacted.shape == (2, part.active_samples)
+    np.testing.assert_array_equal(part.expand(compacted, silence.fill_like(stereo, "passthrough")), stereo)
+    zeroed = part.expand(compacted, silence.fill_like(stereo, "zero"))
+    outside = np.ones(len(y), dtype=bool)
+    for start, end in part.regions:
+        outside[start:end] = False
+    assert not np.any(zeroed[:, outside])
+    np.testing.assert_array_equal(zeroed[:, ~outside], stereo[:, ~outside])
+
+
+def test_frame_rms_matches_a_direct_computation(monkeypatch):
+    monkeypatch.setattr(silence, "CHUNK_FRAMES", 7) # Force several chunks and a partial last frame
+    y = np.random.default_rng(1).standard_normal((2, 160 * 50 + 33)).astype(np.float32)
+    padded = np.pad(y, ((0, 0), (0, 160 - 33)))
+    expected = np.sqrt(np.mean(padded.reshape(2, -1, 160) ** 2, axis=-1).mean(axis=0))
+    np.testing.assert_allclose(silence.frame_rms(y, 160), expected, rtol=1e-5)
+
+
+def test_skipping_needs_enough_savings():
+    mostly_active = np.concatenate([_tone(9), _quiet(1)])
+    assert silence.partition_for_skipping(mostly_active, SR, min_savings=0.1) is None
+    mostly_quiet = np.concatenate([_tone(2), _quiet(8)])
+    assert silence.partition_for_skipping(mostly_quiet, SR, min_savings=0.1) is not None
+
+
+def test_unknown_fill_is_rejected():
+    with pytest.raises(ValueError):
+        silence.fill_like(_quiet(1), "noise")
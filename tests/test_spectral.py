@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from src import spectral
+
+
+@pytest.fixture
+def signal():
+    return (0.1 * np.random.default_rng(3).standard_normal(20000)).astype(np.float32)
+
+
+def _reference_stft(y, n_fft, hop):
+    """ float64 centred STFT with a periodic Hann window (librosa's defaults). """
+    window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft)
+    padded = np.pad(y.astype(np.float64), n_fft // 2)
+    starts = range(0, len(padded) - n_fft + 1, hop)
+    return np.fft.rfft(np.stack([padded[s:s + n_fft] * window for s in starts]), axis=1)
+
+
+@pytest.mark.parametrize("n_fft, hop", [(2048, 512), (1024, 300)])
+def test_stft_matches_float64_reference(signal, n_fft, hop):
+    engine = spectral.SpectralEngine(n_fft, hop)
+    spectra = engine.stft(signal)
+    reference = _reference_stft(signal, n_fft, hop)
+    assert spectra.dtype == np.complex64
+    assert spectra.shape == reference.shape
+    assert np.max(np.abs(spectra - reference)) < 1e-5 * np.max(np.abs(reference))
+
+
+@pytest.mark.parametrize("n_fft, hop", [(2048, 512), (1024, 300)])
+def test_istft_reconstructs_the_signal(signal, n_fft, hop):
+    engine = spectral.SpectralEngine(n_fft, hop)
+    y = engine.istft(engine.stft(signal), len(signal))
+    assert y.dtype == np.float32
+    np.testing.assert_allclose(y, signal, atol=1e-5)
+
+
+def test_subtract_is_magnitude_subtraction():
+    spectra = np.array([[3 + 4j, 0.1 + 0j, 0j]], dtype=np.complex64)
+    out = spectral.SpectralEngine.subtract(spectra.copy(), np.array([1.0, 1.0, 1.0], dtype=np.float32))
+    np.testing.assert_allclose(out, [[(3 + 4j) * 0.8, 0, 0]], atol=1e-6) # |X| 5 -> 4, phase kept; below threshold -> 0
+
+
+@pytest.mark.parametrize("hop", [512, 300])
+def test_batch_matches_single_signals(hop):
+    rng = np.random.default_rng(4)
+    engine = spectral.SpectralEngine(2048, hop)
+    signals = [(0.1 * rng.standard_normal(n)).astype(np.float32) for n in (1000, 15000, 40000)]
+    thresholds = [engine.noise_profile(y[:4000]) for y in signals]
+    batched = engine.reduce_noise_batch(signals, thresholds)
+    for y, threshold, out in zip(signals, thresholds, batched):
+        assert out.shape == y.shape
+        np.testing.assert_allclose(out, engine.reduce_noise(y, threshold), atol=1e-6)
@@ -0,0 +1,112 @@
+import os
+import subprocess
+import sys
+import time
+import pytest
+from src import config, storage, store
+
+NOW = 1_000_000_000.0
+
+
+def _quota(path, max_mb=0, max_age_sec=0, **kwargs):
+    return {'path': str(path), 'max_bytes': int(max_mb * 1024 * 1024), 'max_age_sec': max_age_sec, 'depth': 1,
+            'exclude': set(), 'index': None, **kwargs}
+
+
+def _file(path, size=1024, used=NOW - 3600, modified=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    os.utime(path, (used, modified if modified is not None else used))
+    return str(path)
+
+
+def test_size_quota_evicts_least_recently_used_first(tmp_path):
+    out = tmp_path / "out"
+    # Written in the same order, but "old" has been read since: access time counts as use
+    read_since = _file(out / "old.wav", used=NOW - 600, modified=NOW - 7200)
+    unread = _file(out / "new.wav", used=NOW - 3600, modified=NOW - 3600)
+    _file(out / "newest.wav", used=NOW - 1200)
+    result = storage.sweep("out", _quota(out, max_mb=2 / 1024), now=NOW)
+    assert result == {'removed': 1, 'freed_bytes': 1024, 'bytes': 2048}
+    assert not os.path.exists(unread) and os.path.exists(read_since)
+
+
+def test_age_quota_and_recent_entries(tmp_path):
+    out = tmp_path / "out"
+    stale = _file(out / "stale.wav", used=NOW - 7200)
+    fresh = _file(out / "fresh.wav", used=NOW - 60) # Within STORAGE_MIN_AGE_SEC, even over the size quota
+    storage.sweep("out", _quota(out, max_mb=1 / 2048, max_age_sec=3600), now=NOW)
+    assert not os.path.exists(stale) and os.path.exists(fresh)
+
+
+def test_download_index_orders_youtube_entries(tmp_path):
+    out = str(tmp_path / "yt")
+    index = store.DownloadStore(out)
+    first = _file(os.path.join(out, "aaaaaaaaaaa.m4a"))
+    second = _file(os.path.join(out, "bbbbbbbbbbb.m4a"))
+    index.record("aaaaaaaaaaa", first)
+    index.record("bbbbbbbbbbb", second)
+    for path in (first, second):
+        os.utime(path, (NOW - 3600, NOW - 3600))
+    with index._connect() as conn: # The store served "a" more recently than the files' atimes show
+        conn.execute("UPDATE downloads SET last_access = ? WHERE video_id = ?", (NOW - 900, "aaaaaaaaaaa"))
+        conn.execute("UPDATE downloads SET last_access = ? WHERE video_id = ?", (NOW - 1800, "bbbbbbbbbbb"))
+    quota = _quota(out, max_mb=1 / 1024, index=config.YOUTUBE_INDEX_FILENAME,
+                   exclude={config.YOUTUBE_INDEX_FILENAME, config.YOUTUBE_INDEX_FILENAME + "-wal",
+                            config.YOUTUBE_INDEX_FILENAME + "-shm"})
+    assert storage.sweep("yt", quota, now=NOW)['removed'] == 1
+    assert os.path.exists(first) and not os.path.exists(second)
+
+
+def test_in_use_entries_are_kept(tmp_path):
+    out = tmp_path / "out"
+    track = _file(out / "track" / "vocals.wav")
+    with storage.in_use(track):
+        assert storage.sweep("out", _quota(out, max_age_sec=60), now=NOW)['removed'] == 0
+    assert not os.listdir(config.IN_USE_DIR) # The marker goes with the block
+    assert storage.sweep("out", _quota(out, max_age_sec=60), now=NOW)['removed'] == 1
+
+
+@pytest.mark.skipif(os.name == "nt", reason="needs a signal-0 liveness probe")
+def test_markers_of_other_processes(tmp_path):
+    out = tmp_path / "out"
+    kept = _file(out / "kept.wav")
+    abandoned = _file(out / "abandoned.wav")
+    other = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        finished = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+        os.makedirs(config.IN_USE_DIR, exist_ok=True)
+        for pid, path in ((other.pid, kept), (int(finished.stdout), abandoned)):
+            with open(os.path.join(config.IN_USE_DIR, f"{pid}-test"), "w", encoding="utf-8") as f:
+                f.write(os.path.abspath(path))
+        assert storage.sweep("out", _quota(out, max_age_sec=60), now=NOW)['removed'] == 1
+        assert os.path.exists(kept) and not os.path.exists(abandoned)
+        storage.clear_orphans()
+        assert os.listdir(config.IN_USE_DIR) == [f"{other.pid}-test"] # Only the dead process's marker is cleared
+    finally:
+        other.kill()
+        other.wait()
+
+
+def test_atomic_path(tmp_path):
+    final = str(tmp_path / "out" / "result.wav")
+    with storage.atomic_path(final) as part:
+        assert os.path.basename(part).startswith(storage.PART_PREFIX) and part.endswith(".wav")
+        _file(part, size=10)
+        assert not os.path.exists(final)
+    assert os.path.getsize(final) == 10 and os.listdir(os.path.dirname(final)) == ["result.wav"]
+
+    with pytest.raises(RuntimeError):
+        with storage.atomic_path(final) as part:
+            _file(part, size=20)
+            raise RuntimeError("encoder failed")
+    assert os.path.getsize(final) == 10 and os.listdir(os.path.dirname(final)) == ["result.wav"]
+
+
+def test_part_files_survive_until_orphaned(tmp_path):
+    out = tmp_path / "out"
+    writing = _file(out / f"{storage.PART_PREFIX}1234-take.wav", used=NOW - 1800)
+    orphaned = _file(out / f"{storage.PART_PREFIX}5678-take.wav", used=NOW - 2 * config.STORAGE_ORPHAN_AGE_SEC)
+    storage.sweep("out", _quota(out, max_age_sec=60), now=NOW)
+    assert os.path.exists(writing) and not os.path.exists(orphaned)
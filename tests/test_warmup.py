@@ -0,0 +1,54 @@
+import sys
+import pytest
+from src import config, demucs_pool, warmup
+
+
+@pytest.fixture
+def no_demucs(monkeypatch):
+    """ Makes `import demucs` fail even where it is installed (torch is left alone: scipy probes sys.modules for it). """
+    for name in ("demucs", "demucs.pretrained"):
+        monkeypatch.setitem(sys.modules, name, None)
+    monkeypatch.setattr(demucs_pool, "_resident_models", {})
+
+
+def test_missing_demucs_fails_only_its_step(no_demucs, monkeypatch, capsys):
+    monkeypatch.setattr(config, "WARMUP_DEMUCS", True)
+    monkeypatch.setattr(config, "DEMUCS_BACKEND", "inprocess")
+    results = warmup.warm_up()
+    assert list(results) == ["imports", "spectral", "loudness", "demucs"]
+    assert results['demucs'].startswith("error: ")
+    assert all(isinstance(results[step], float) for step in ("imports", "spectral", "loudness"))
+
+    assert warmup.main([]) == 2 # The CLI reports the failed step
+    assert "demucs     error: " in capsys.readouterr().out
+
+
+def test_demucs_step_is_planned_only_for_resident_backends(monkeypatch):
+    monkeypatch.setattr(config, "WARMUP_DEMUCS", True)
+    monkeypatch.setattr(config, "DEMUCS_BACKEND", "subprocess")
+    assert [name for name, _ in warmup.steps()] == ["imports", "spectral", "loudness"]
+    monkeypatch.setattr(config, "DEMUCS_BACKEND", "pool")
+    assert [name for name, _ in warmup.steps()][-1] == "demucs"
+    monkeypatch.setattr(config, "WARMUP_DEMUCS", False)
+    assert "demucs" not in [name for name, _ in warmup.steps()]
+
+
+def test_background_warmup_finishes_without_demucs(no_demucs, monkeypatch):
+    monkeypatch.setattr(config, "WARMUP_ENABLED", True)
+    monkeypatch.setattr(config, "DEMUCS_BACKEND", "inprocess")
+    monkeypatch.setattr(warmup, "_warmup", None)
+    started = warmup.start_warmup()
+    assert warmup.start_warmup() is started
+    assert started.finished.wait(60)
+    assert started.results['demucs'].startswith("error: ")
+    monkeypatch.setattr(config, "WARMUP_ENABLED", False)
+    monkeypatch.setattr(warmup, "_warmup", None)
+    assert warmup.start_warmup() is None
+
+
+def test_parse_importtime():
+    stderr = ("import time: self [us] | cumulative | imported package\n"
+              "import time:       120 |        120 |   numpy.core\n"
+              "import time:        80 |        200 | numpy\n"
+              "unrelated line\n")
+    assert warmup._parse_importtime(stderr) == [("numpy.core", 120, 120), ("numpy", 80, 200)]
@@ -0,0 +1,158 @@
+import os
+import sys
+import types
+import shutil
+import importlib
+import subprocess
+import numpy as np
+import soundfile as sf
+import pytest
+
+
+class _DownloadError(Exception):
+    pass
+
+
+class _FakeYoutubeDL:
+    """ Stands in for yt_dlp.YoutubeDL: "downloads" by writing a small file where outtmpl points. """
+    calls = 0
+
+    def __init__(self, opts):
+        self.opts = opts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, url, download=True):
+        type(self).calls += 1
+        video_id = url.rsplit("=", 1)[-1]
+        info = {'id': video_id, 'ext': 'm4a', 'duration': 1.5, 'title': "Test", 'url': url}
+        if download:
+            path = self.opts['outtmpl'] % {'id': video_id, 'ext': 'm4a'}
+            with open(path, "wb") as f:
+                f.write(b"\0" * 64)
+            for hook in self.opts.get('progress_hooks', []):
+                hook({'status': 'finished', 'filename': path})
+            info['requested_downloads'] = [{'filepath': path}]
+        return info
+
+
+@pytest.fixture
+def youtube(monkeypatch):
+    fake = types.ModuleType("yt_dlp")
+    fake.YoutubeDL = _FakeYoutubeDL
+    fake.utils = types.SimpleNamespace(DownloadError=_DownloadError)
+    monkeypatch.setitem(sys.modules, "yt_dlp", fake)
+    module = importlib.import_module("src.youtube")
+    monkeypatch.setattr(module, "yt_dlp", fake)
+    _FakeYoutubeDL.calls = 0
+    return module
+
+
+def test_get_yt_vid_id(youtube):
+    get_yt_vid_id = youtube.get_yt_vid_id
+    assert get_yt_vid_id("https://www.youtube.com/watch?v=dQw4w9WgXcQ") == "dQw4w9WgXcQ"
+    assert get_yt_vid_id("https://youtu.be/dQw4w9WgXcQ?t=10") == "dQw4w9WgXcQ"
+    assert get_yt_vid_id("https://example.com/video") is None
+
+
+def test_download_then_store_hit(youtube, tmp_path):
+    url = "https://www.youtube.com/watch?v=abcdefghijk"
+    first = youtube.download_audio_yt_dlp(url, output_dir=str(tmp_path))
+    assert first['success'], first['message']
+    assert first['file_path'] == os.path.join(str(tmp_path), "abcdefghijk.m4a")
+    assert os.path.exists(first['file_path'])
+
+    second = youtube.download_audio_yt_dlp(url, output_dir=str(tmp_path))
+    assert second['success']
+    assert second['file_path'] == first['file_path']
+    assert "store" in second['message']
+    assert _FakeYoutubeDL.calls == 1 # The store hit never constructs yt-dlp
+
+
+def test_download_error_is_reported(youtube, tmp_path, monkeypatch):
+    def fail(self, url, download=True):
+        raise _DownloadError("video unavailable")
+    monkeypatch.setattr(_FakeYoutubeDL, "extract_info", fail)
+    result = youtube.download_audio_yt_dlp("https://www.youtube.com/watch?v=zzzzzzzzzzz", output_dir=str(tmp_path))
+    assert not result['success']
+    assert "video unavailable" in result['message']
+    assert result['file_path'] is None
+
+
+def test_download_bulk_skips_archived(youtube, tmp_path, monkeypatch):
+    monkeypatch.setattr(youtube.HostRateLimiter, "wait", lambda self, url: None)
+    urls = ["https://www.youtube.com/watch?v=aaaaaaaaaaa", "https://www.youtube.com/watch?v=bbbbbbbbbbb"]
+    archive = str(tmp_path / "archive.txt")
+    first = youtube.download_bulk(urls, output_dir=str(tmp_path), archive_path=archive)
+    assert first['counts'] == {'downloaded': 2, 'skipped': 0, 'failed': 0}
+    second = youtube.download_bulk(urls, output_dir=str(tmp_path), archive_path=archive)
+    assert second['counts'] == {'downloaded': 0, 'skipped': 2, 'failed': 0}
+    assert [item['file_path'] for item in second['items']] == [item['file_path'] for item in first['items']]
+
+
+def test_download_bulk_refetches_evicted_files(youtube, tmp_path, monkeypatch):
+    monkeypatch.setattr(youtube.HostRateLimiter, "wait", lambda self, url: None)
+    urls = ["https://www.youtube.com/watch?v=aaaaaaaaaaa", "https://www.youtube.com/watch?v=bbbbbbbbbbb"]
+    first = youtube.download_bulk(urls, output_dir=str(tmp_path))
+    archive_path = tmp_path / "download_archive.txt" # The archive lives with the downloads by default
+    assert sorted(archive_path.read_text().split()) == ["aaaaaaaaaaa", "bbbbbbbbbbb"]
+
+    os.remove(first['items'][0]['file_path']) # What store eviction or the storage janitor does
+    second = youtube.download_bulk(urls, output_dir=str(tmp_path))
+    assert [item['status'] for item in second['items']] == ['downloaded', 'skipped']
+    assert all(os.path.exists(item['file_path']) for item in second['items'])
+    assert sorted(archive_path.read_text().split()) == ["aaaaaaaaaaa", "bbbbbbbbbbb"]
+
+
+def test_archive_discard_rewrites_the_file(youtube, tmp_path):
+    path = str(tmp_path / "archive.txt")
+    archive = youtube.DownloadArchive(path)
+    for video_id in ("a", "b", "c"):
+        archive.add(video_id)
+    archive.discard("b")
+    assert "b" not in archive
+    assert "b" not in youtube.DownloadArchive(path) and "c" in youtube.DownloadArchive(path)
+
+
+def _tone(sr, seconds, channels):
+    t = np.arange(int(sr * seconds)) / sr
+    return np.stack([0.1 * (c + 1) * np.sin(2 * np.pi * 440 * t) for c in range(channels)]).astype(np.float32)
+
+
+def _fake_ffmpeg(monkeypatch, youtube, pcm: bytes, returncode=0, stderr=""):
+    """ Replaces ffmpeg with a Python process that writes pcm to stdout (and stderr) and exits with returncode. """
+    script = ("import sys; sys.stdout.buffer.write(open(sys.argv[1], 'rb').read()); "
+              f"sys.stderr.write({stderr!r}); sys.exit({returncode})")
+    path = os.path.join(os.getcwd(), "pcm.bin")
+    with open(path, "wb") as f:
+        f.write(pcm)
+    popen = subprocess.Popen
+    monkeypatch.setattr(youtube.subprocess, "Popen", lambda cmd, **kwargs: popen([sys.executable, "-c", script, path], **kwargs))
+
+
+def test_decode_pcm_shape_and_dtype(youtube, monkeypatch):
+    tone = _tone(8000, 1.5, 2)
+    _fake_ffmpeg(monkeypatch, youtube, tone.T.tobytes())
+    monkeypatch.setattr(youtube, "PCM_READ_CHUNK_SIZE", 4096) # Several reads, the last one partial
+    audio = youtube.decode_pcm("take.m4a", sample_rate=8000, channels=2)
+    assert audio.shape == (2, 12000) and audio.dtype == np.float32
+    np.testing.assert_array_equal(audio, tone)
+
+
+def test_decode_pcm_failure(youtube, monkeypatch):
+    _fake_ffmpeg(monkeypatch, youtube, b"", returncode=1, stderr="Invalid data found")
+    with pytest.raises(RuntimeError, match="Invalid data found"):
+        youtube.decode_pcm("broken.m4a")
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_decode_pcm_with_ffmpeg(youtube, tmp_path):
+    path = str(tmp_path / "tone.wav")
+    sf.write(path, _tone(22050, 1.0, 1).T, 22050, subtype='FLOAT')
+    audio = youtube.decode_pcm(path, sample_rate=44100, channels=2)
+    assert audio.dtype == np.float32 and audio.shape[0] == 2
+    assert abs(audio.shape[1] - 44100) < 100